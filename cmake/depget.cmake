@@ -16,29 +16,21 @@ else()
 	message(FATAL_ERROR "Failed to find Git")
 endif()
 
+# Clones go through hubris.git so they can use the mirror cache, depth and filter options
+include(${CMAKE_CURRENT_LIST_DIR}/gitclone.cmake)
+
 #
 #	Executes a command to clone a git repository
 #
 #	Takes an optional 3rd argument that specifies the branch to clone.
+#	See gitclone.cmake for the mirror cache, depth and filter options.
 #
 macro(DEPGET_CLONE_GIT_REPOSITORY_EXECUTE in_Repo in_CloneDest)
 	
-	set(__command ${GIT_EXECUTABLE} clone ${in_Repo} ${in_CloneDest})
-
-	# If the extra branch argument was given, we need to modify the git command to include it
-	if (${ARGC} EQUAL 3)
-		set(__command ${__command} -b ${ARGV2})
-	endif()
-
-	execute_process (
-		COMMAND ${__command}
-		RESULTS_VARIABLE __gitResultCode
-		ERROR_VARIABLE __gitResultError
-		WORKING_DIRECTORY ${CMAKE_CURRENT_LIST_DIR}
-		COMMAND_ECHO STDOUT
-	)
+	set(__gitResultCode )
+	HUBRIS_GIT_CLONE(__gitResultCode ${ARGV})
 	if (NOT __gitResultCode EQUAL "0")
-		message(FATAL_ERROR "Failed to clone repository -\n${__gitResultError}")
+		message(FATAL_ERROR "Failed to clone repository ${in_Repo}")
 	endif()
 endmacro()
 
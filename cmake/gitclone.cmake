@@ -0,0 +1,64 @@
+#
+#	Git dependency cloning through hubris.git.clone()
+#
+#	Falls back to a plain "git clone" when python isn't available.
+#
+
+include_guard(GLOBAL)
+
+find_package(Git QUIET)
+find_package(Python3 QUIET COMPONENTS Interpreter)
+
+# Directory of bare mirrors that clones borrow objects from, empty to use $ENV{HUBRIS_GIT_MIRROR_CACHE}
+set(HUBRIS_GIT_MIRROR_CACHE "$ENV{HUBRIS_GIT_MIRROR_CACHE}" CACHE PATH "Directory of bare git mirrors used as a clone reference")
+
+# Shallow clone depth for git dependencies, 0 clones the full history
+set(HUBRIS_GIT_CLONE_DEPTH 0 CACHE STRING "Shallow clone depth for git dependencies, 0 for full history")
+
+# Partial clone filter for git dependencies, ie "blob:none"
+set(HUBRIS_GIT_CLONE_FILTER "" CACHE STRING "Partial clone filter for git dependencies")
+
+# Captured here as CMAKE_CURRENT_LIST_DIR changes by the time the function below is called
+set(__HUBRIS_GITCLONE_TOOLS_ROOT "${CMAKE_CURRENT_LIST_DIR}/..")
+
+
+#
+#	Clones a git repository
+#
+#	@param out_Result Set to 0 on success
+#	@param in_Repo Path or URL to clone the repo from
+#	@param in_CloneDest Where to clone the repo into
+#	@param branchName? Name of the branch to clone, defaults to HEAD
+#
+function(HUBRIS_GIT_CLONE out_Result in_Repo in_CloneDest)
+
+	set(__script "${__HUBRIS_GITCLONE_TOOLS_ROOT}/utils/scripts/gitclone.py")
+
+	if (Python3_Interpreter_FOUND AND EXISTS "${__script}")
+		set(__command ${CMAKE_COMMAND} -E env "PYTHONPATH=${__HUBRIS_GITCLONE_TOOLS_ROOT}/python"
+			${Python3_EXECUTABLE} "${__script}" ${in_Repo} ${in_CloneDest}
+			--depth ${HUBRIS_GIT_CLONE_DEPTH})
+		if (HUBRIS_GIT_CLONE_FILTER)
+			set(__command ${__command} --filter ${HUBRIS_GIT_CLONE_FILTER})
+		endif()
+		if (HUBRIS_GIT_MIRROR_CACHE)
+			set(__command ${__command} --mirror_cache ${HUBRIS_GIT_MIRROR_CACHE})
+		endif()
+		if (${ARGC} GREATER 3)
+			set(__command ${__command} --branch ${ARGV3})
+		endif()
+	else()
+		set(__command ${GIT_EXECUTABLE} clone ${in_Repo} ${in_CloneDest})
+		if (${ARGC} GREATER 3)
+			set(__command ${__command} -b ${ARGV3})
+		endif()
+	endif()
+
+	execute_process(
+		COMMAND ${__command}
+		RESULT_VARIABLE __gitResultCode
+		WORKING_DIRECTORY ${CMAKE_CURRENT_LIST_DIR}
+		COMMAND_ECHO STDOUT
+	)
+	set(${out_Result} ${__gitResultCode} PARENT_SCOPE)
+endfunction()
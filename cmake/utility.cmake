@@ -4,6 +4,9 @@ option(ENABLE_GIT_DEPENDENCIES "Enables automatic cloning of dependencies that d
 
 find_package(Git QUIET)
 
+# Clones go through hubris.git so they can use the mirror cache, depth and filter options
+include(${CMAKE_CURRENT_LIST_DIR}/gitclone.cmake)
+
 
 
 
@@ -38,13 +41,9 @@ function(ADD_GIT_DEPENDENCY_FN depPath depTarget depRepo)
 
 				# Use branch optional parameter if it was provided
 				if (ARGC GREATER 3)
-					execute_process(COMMAND
-						${GIT_EXECUTABLE} clone -b "${ARGV3}" ${depRepo} ${depPath}
-						RESULTS_VARIABLE gitResult)
+					HUBRIS_GIT_CLONE(gitResult ${depRepo} ${depPath} "${ARGV3}")
 				else()
-					execute_process(COMMAND
-						${GIT_EXECUTABLE} clone ${depRepo} ${depPath}
-						RESULTS_VARIABLE gitResult)
+					HUBRIS_GIT_CLONE(gitResult ${depRepo} ${depPath})
 				endif()
 
 				# Add the cloned repo as a subdir if it has CMake support
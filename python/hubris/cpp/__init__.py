@@ -2,3 +2,4 @@ from .type import Type
 from .variable import Variable
 from .enum import Enum
 from .cpp import run_tests
+from .include import IncludeGraph, HeaderStats, scan_includes, find_include_dirs, tree_stamp
@@ -1,6 +1,5 @@
 # Helper for enum<->string conversion table generation.
 
-from msilib.schema import MsiPatchHeaders
 import hubris
 from .common import strip_block_comments, strip_line_comments
 import re
@@ -0,0 +1,378 @@
+# Include graph analysis.
+#
+# Scans a source tree for #include directives, resolves them against the include
+# directories declared in the tree's CMakeLists and measures what each header costs
+# the build: how much it pulls in and how many translation units rebuild when it changes.
+
+import hashlib
+import os
+import re
+from pathlib import Path
+
+import hubris
+from .common import strip_block_comments
+
+
+
+SOURCE_EXTENSIONS = (".c", ".cc", ".cpp", ".cxx", ".c++", ".m", ".mm")
+HEADER_EXTENSIONS = (".h", ".hh", ".hpp", ".hxx", ".h++", ".inl", ".ipp", ".tpp")
+
+_INCLUDE_REGEX = re.compile(r'^\s*#\s*include\s*(?P<open>[<"])(?P<name>[^>"]+)[>"]')
+_DIRECTIVE_REGEX = re.compile(r"^\s*#\s*(?P<directive>\w+)\s*(?P<arg>\w*)")
+
+# target_include_directories(<target> [SYSTEM] [AFTER|BEFORE] <INTERFACE|PUBLIC|PRIVATE> dirs...)
+# and include_directories([AFTER|BEFORE] [SYSTEM] dirs...)
+_CMAKE_INCLUDE_COMMAND_REGEX = re.compile(
+	r"\b(?P<command>target_include_directories|include_directories)\s*\((?P<args>[^)]*)\)", re.IGNORECASE)
+_CMAKE_COMMENT_REGEX = re.compile(r"#.*")
+_CMAKE_KEYWORDS = ("SYSTEM", "AFTER", "BEFORE", "INTERFACE", "PUBLIC", "PRIVATE")
+_CMAKE_VARIABLE_REGEX = re.compile(r"\$\{(?P<name>\w+)\}")
+_CMAKE_BUILD_INTERFACE_REGEX = re.compile(r"^\$<BUILD_INTERFACE:(?P<path>.*)>$")
+
+# Default share of translation units a header must reach to be a precompiled header candidate
+DEFAULT_PCH_THRESHOLD = 0.5
+
+# Project headers pulling in fewer lines than this aren't worth precompiling
+DEFAULT_PCH_MIN_LINES = 500
+
+
+def _is_source(path : str) -> bool :
+	return path.lower().endswith(SOURCE_EXTENSIONS)
+
+def _is_header(path : str) -> bool :
+	return path.lower().endswith(HEADER_EXTENSIONS)
+
+def _walk_tree(source_root : str):
+	"""
+	Yields every file under source_root, skipping build/output ("_*") and hidden directories.
+	"""
+	for root, dirs, files in os.walk(source_root):
+		dirs[:] = [v for v in dirs if not v.startswith("_") and not v.startswith(".")]
+		for v in files:
+			yield os.path.join(root, v)
+
+
+def _read_includes(path : "str | Path") -> "list[tuple[str, bool, bool]]" :
+	"""
+	Reads the #include directives of a source file as (name, is_quoted, is_conditional).
+	An include is conditional when it is inside an #if block other than the include guard.
+	"""
+	with open(path, "r", errors="replace") as f:
+		text = strip_block_comments(f.read())
+	o = []
+	depth = 0
+	guard = None
+	first_directive = True
+	for line in text.splitlines():
+		m = _INCLUDE_REGEX.match(line)
+		if m:
+			o.append((m.group("name"), m.group("open") == '"', depth != 0))
+			first_directive = False
+			continue
+		m = _DIRECTIVE_REGEX.match(line)
+		if m is None:
+			continue
+		directive = m.group("directive")
+		if directive in ("if", "ifdef", "ifndef"):
+			# "#ifndef X" then "#define X" opening the file is the include guard
+			if first_directive and directive == "ifndef":
+				guard = m.group("arg")
+			depth += 1
+		elif directive == "endif":
+			depth = max(depth - 1, 0)
+		elif directive == "define" and guard is not None and depth == 1 and m.group("arg") == guard:
+			depth = 0
+			guard = None
+		first_directive = False
+	return o
+
+def read_include_directives(path : "str | Path") -> "list[tuple[str, bool]]" :
+	"""
+	Reads the #include directives of a source file as (name, is_quoted) pairs.
+	Commented out includes are ignored.
+	"""
+	return [(name, quoted) for name, quoted, _ in _read_includes(path)]
+
+
+def read_cmake_include_dirs(cmakelists_path : "str | Path", source_root : "str | Path | None" = None) -> "list[Path]" :
+	"""
+	Reads the directories given to target_include_directories() and include_directories() in a CMakeLists.
+	Relative paths and the usual source directory variables are resolved, directories using any
+	other variable and install interface directories are skipped.
+	"""
+	cmakelists_path = Path(cmakelists_path)
+	list_dir = str(cmakelists_path.parent.resolve())
+	variables = {
+		"CMAKE_CURRENT_SOURCE_DIR" : list_dir,
+		"CMAKE_CURRENT_LIST_DIR" : list_dir,
+		"PROJECT_SOURCE_DIR" : str(Path(source_root or list_dir).resolve()),
+		"CMAKE_SOURCE_DIR" : str(Path(source_root or list_dir).resolve()),
+	}
+
+	text = _CMAKE_COMMENT_REGEX.sub("", cmakelists_path.read_text(errors="replace"))
+	o = []
+	for m in _CMAKE_INCLUDE_COMMAND_REGEX.finditer(text):
+		args = m.group("args").split()
+		if m.group("command").lower() == "target_include_directories":
+			args = args[1:]
+
+		for v in args:
+			v = v.strip('"')
+			if v.upper() in _CMAKE_KEYWORDS:
+				continue
+			interface = _CMAKE_BUILD_INTERFACE_REGEX.match(v)
+			if interface:
+				v = interface.group("path")
+			elif v.startswith("$<"):
+				continue
+
+			v = _CMAKE_VARIABLE_REGEX.sub(lambda var: variables.get(var.group("name"), var.group(0)), v)
+			if "${" in v:
+				hubris.log_debug(f"Skipping include directory {v} in {str(cmakelists_path)}")
+				continue
+
+			path = Path(v)
+			if not path.is_absolute():
+				path = Path(list_dir).joinpath(path)
+			o.append(path.resolve())
+	return o
+
+def find_include_dirs(source_root : "str | Path") -> "list[Path]" :
+	"""
+	Collects the include directories declared by every CMakeLists.txt in a source tree.
+	"""
+	o = []
+	for v in _walk_tree(str(source_root)):
+		if os.path.basename(v) == "CMakeLists.txt":
+			for d in read_cmake_include_dirs(v, source_root):
+				if d not in o:
+					o.append(d)
+	return o
+
+
+class HeaderStats:
+	"""
+	What a header costs the build.
+
+	path : Path relative to the source root, or the include name for headers outside of it.
+	external : True for headers that couldn't be resolved in the tree (ie system or dependency headers).
+	lines : Line count of the header itself, 0 for external headers.
+	direct_includers : Number of files that include it directly.
+	transitive_includes : Number of headers it pulls in, directly or not.
+	transitive_lines : Lines parsed for every inclusion of it, its own lines included.
+	fan_out : Number of translation units rebuilt when it changes.
+	rebuild_fraction : fan_out as a share of every translation unit.
+	cost : Lines the build parses because of it, fan_out * transitive_lines.
+	pch_candidate : True if it is a good fit for a precompiled header.
+	"""
+	__slots__ = ("path", "external", "lines", "direct_includers", "transitive_includes",
+		"transitive_lines", "fan_out", "rebuild_fraction", "cost", "pch_candidate")
+
+	def __str__(self) -> str :
+		return f"{self.path} : {self.fan_out} TU(s) ({self.rebuild_fraction * 100.0:.0f}%), {self.transitive_includes} include(s), {self.transitive_lines} line(s)"
+
+	def __init__(self, path : str, external : bool):
+		self.path = path
+		self.external = external
+		self.lines = 0
+		self.direct_includers = 0
+		self.transitive_includes = 0
+		self.transitive_lines = 0
+		self.fan_out = 0
+		self.rebuild_fraction = 0.0
+		self.cost = 0
+		self.pch_candidate = False
+
+
+class IncludeGraph:
+	"""
+	Resolved include graph of a source tree.
+
+	Files are keyed by their absolute path, headers that couldn't be resolved by their
+	include name prefixed with "<" (ie "<vector").
+	includes : The direct includes of every scanned file.
+	names : How every header was first spelled in an #include directive that didn't depend on
+		the including file's directory, headers only ever included relative to it have none.
+	conditional : Headers included inside an #if block somewhere, ie platform specific ones.
+	sources : The translation units of the tree.
+	"""
+
+	def is_external(self, node : str) -> bool :
+		"""
+		True for headers that couldn't be resolved.
+		"""
+		return node.startswith("<")
+
+	def is_in_tree(self, node : str) -> bool :
+		"""
+		True for files under the source root, as opposed to system or dependency headers.
+		"""
+		if self.is_external(node):
+			return False
+		return os.path.commonpath([self.source_root, node]) == self.source_root
+
+	def display_path(self, node : str) -> str :
+		if self.is_external(node):
+			return node[1:]
+		try:
+			return os.path.relpath(node, self.source_root)
+		except ValueError:
+			return node
+
+	def closure(self, node : str) -> "set[str]" :
+		"""
+		Every header reachable from node, not including node itself.
+		"""
+		cached = self._closures.get(node)
+		if cached is not None:
+			return cached
+		seen = set()
+		stack = list(self.includes.get(node, ()))
+		while len(stack) != 0:
+			v = stack.pop()
+			if v in seen or v == node:
+				continue
+			seen.add(v)
+			stack.extend(self.includes.get(v, ()))
+		self._closures[node] = seen
+		return seen
+
+	def analyze(self,
+		pch_threshold : float = DEFAULT_PCH_THRESHOLD,
+		pch_min_lines : int = DEFAULT_PCH_MIN_LINES) -> "list[HeaderStats]" :
+		"""
+		Measures every header reached from the translation units, most costly first.
+
+		pch_threshold : Share of translation units a header must be included by to be a PCH candidate.
+		pch_min_lines : Transitive lines a project header must pull in to be a PCH candidate,
+			external headers only need to meet the threshold.
+		"""
+		stats : "dict[str, HeaderStats]" = {}
+		def get(node : str) -> HeaderStats :
+			s = stats.get(node)
+			if s is None:
+				s = stats[node] = HeaderStats(self.display_path(node), self.is_external(node))
+				s.lines = self.lines.get(node, 0)
+				closure = self.closure(node)
+				s.transitive_includes = len(closure)
+				s.transitive_lines = s.lines + sum(self.lines.get(v, 0) for v in closure)
+			return s
+
+		for includer, headers in self.includes.items():
+			for v in set(headers):
+				get(v).direct_includers += 1
+
+		for v in self.sources:
+			for header in self.closure(v):
+				get(header).fan_out += 1
+
+		source_count = len(self.sources)
+		for s in stats.values():
+			if source_count != 0:
+				s.rebuild_fraction = s.fan_out / source_count
+			s.cost = s.fan_out * s.transitive_lines
+			s.pch_candidate = s.fan_out > 1 and s.rebuild_fraction >= pch_threshold and \
+				(s.external or s.transitive_lines >= pch_min_lines)
+
+		o = list(stats.values())
+		o.sort(key=lambda v: (v.cost, v.fan_out), reverse=True)
+		return o
+
+	def __init__(self, source_root : "str | Path"):
+		self.source_root = str(Path(source_root).resolve())
+		self.includes : "dict[str, list[str]]" = {}
+		self.names : "dict[str, str]" = {}
+		self.conditional : "set[str]" = set()
+		self.lines : "dict[str, int]" = {}
+		self.sources : "list[str]" = []
+		self._closures : "dict[str, set[str]]" = {}
+
+
+def _resolve_include(name : str, quoted : bool, includer_dir : str, include_dirs : "list[str]") -> "str | None" :
+	# Quoted includes are looked up next to the including file first
+	if quoted:
+		path = os.path.normpath(os.path.join(includer_dir, name))
+		if os.path.isfile(path):
+			return path
+	for v in include_dirs:
+		path = os.path.normpath(os.path.join(v, name))
+		if os.path.isfile(path):
+			return path
+	return None
+
+def _count_lines(path : str) -> int :
+	n = 0
+	with open(path, "rb") as f:
+		for _ in f:
+			n += 1
+	return n
+
+def tree_stamp(source_root : "str | Path", exclude : "list[str | Path] | None" = None) -> str :
+	"""
+	Hashes the path, mtime and size of every source, header and CMakeLists.txt scan_includes()
+	would read in the tree, so a scan can be skipped while the stamp doesn't change.
+
+	exclude : Directories to leave out, ie a build root inside the tree.
+	"""
+	source_root = str(Path(source_root).resolve())
+	exclude = set(os.path.normcase(str(Path(v).resolve())) for v in exclude or [])
+	entries = []
+	for root, dirs, files in os.walk(source_root):
+		dirs[:] = [v for v in dirs if not v.startswith("_") and not v.startswith(".")
+			and os.path.normcase(os.path.join(root, v)) not in exclude]
+		for v in files:
+			if _is_source(v) or _is_header(v) or v == "CMakeLists.txt":
+				path = os.path.join(root, v)
+				try:
+					st = os.stat(path)
+				except OSError:
+					continue
+				entries.append((os.path.relpath(path, source_root), st.st_mtime_ns, st.st_size))
+	entries.sort()
+	return hashlib.sha256(repr(entries).encode()).hexdigest()
+
+def scan_includes(source_root : "str | Path", include_dirs : "list[str | Path] | None" = None) -> IncludeGraph :
+	"""
+	Builds the include graph of every source and header file under source_root.
+
+	include_dirs : Directories angle and unresolved quoted includes are looked up in,
+		defaults to the ones declared by the tree's CMakeLists, see find_include_dirs().
+	"""
+	graph = IncludeGraph(source_root)
+	if include_dirs is None:
+		include_dirs = find_include_dirs(graph.source_root)
+	include_dirs = [str(Path(v).resolve()) for v in include_dirs]
+
+	# Files are read as they are found, headers outside the tree are followed too
+	pending = [v for v in _walk_tree(graph.source_root) if _is_source(v) or _is_header(v)]
+	graph.sources = [v for v in pending if _is_source(v)]
+	while len(pending) != 0:
+		path = pending.pop()
+		if path in graph.includes:
+			continue
+		try:
+			directives = _read_includes(path)
+			graph.lines[path] = _count_lines(path)
+		except OSError as exc:
+			hubris.log_warn(f"Failed to read {path} : {exc}")
+			graph.includes[path] = []
+			continue
+
+		includer_dir = os.path.dirname(path)
+		resolved = []
+		for name, quoted, conditional in directives:
+			v = _resolve_include(name, quoted, includer_dir, include_dirs)
+			if v is None:
+				v = "<" + name
+				resolved.append(v)
+			else:
+				resolved.append(v)
+				if v not in graph.includes:
+					pending.append(v)
+			if conditional:
+				graph.conditional.add(v)
+			# Only names that resolve from anywhere, not just next to the includer
+			if v.startswith("<") or v != os.path.normpath(os.path.join(includer_dir, name)):
+				graph.names.setdefault(v, name)
+		graph.includes[path] = resolved
+	return graph
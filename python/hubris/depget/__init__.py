@@ -1 +1 @@
-from .depget import install, search
+from .depget import InstallPlan, install, install_all, plan, search
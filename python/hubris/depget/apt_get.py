@@ -1,4 +1,6 @@
+import os
 import subprocess
+import hubris
 from .error import DepGetError
 
 class Pacman_AptGet:
@@ -7,22 +9,64 @@ class Pacman_AptGet:
 			self._exec_path
 		]
 		command.extend(args)
-		proc = subprocess.Popen(command, stdout=stdout, universal_newlines=True)
+		# Never stop to ask, ie for service restarts or config file prompts
+		env = dict(os.environ)
+		env["DEBIAN_FRONTEND"] = "noninteractive"
+		proc = subprocess.Popen(command, stdout=stdout, universal_newlines=True, env=env)
 		return proc
 
-	def _popen_install(self, package_name : str, stdout=None) -> subprocess.Popen :
-		return self._popen(["install", package_name], stdout=stdout)
+	def _popen_install(self, package_names : "list[str]", stdout=None, dry_run : bool = False) -> subprocess.Popen :
+		args = ["install", "-y"]
+		if dry_run:
+			args.append("--simulate")
+		args.extend(package_names)
+		return self._popen(args, stdout=stdout)
 
 	def install(self, package_name : str) -> bool :
-		f = open("_depget.log", "a")
+		return self.install_many([package_name])
+
+	def install_many(self, package_names : "list[str]", dry_run : bool = False) -> bool :
+		"""
+		Installs the packages in a single transaction.
+
+		dry_run : Only resolve the transaction, logging the packages it would install.
+		"""
 		try:
-			proc = self._popen_install(package_name, stdout=f)
+			if dry_run:
+				proc = self._popen_install(package_names, stdout=subprocess.PIPE, dry_run=True)
+				pout, _ = proc.communicate()
+				for line in pout.splitlines():
+					if line.startswith("Inst "):
+						hubris.log_info(f"Would install {line[len('Inst '):]}")
+				return proc.returncode == 0
+
+			f = open("_depget.log", "a")
+			proc = self._popen_install(package_names, stdout=f)
 			proc_result = proc.wait()
 			f.close()
 			return proc_result == 0
 		except FileNotFoundError:
 			raise DepGetError("Invalid package manner")
 
+	def installed(self, package_names : "list[str]") -> "set[str]" :
+		"""Returns which of the packages are installed, with one dpkg query for all of them"""
+		if len(package_names) == 0:
+			return set()
+		command = ["dpkg-query", "-W", "-f=${binary:Package}\t${Package}\t${db:Status-Abbrev}\n"]
+		command.extend(package_names)
+		try:
+			proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+		except FileNotFoundError:
+			return set()
+
+		# Exits with 1 when some are unknown, the known ones are listed all the same
+		o = set()
+		for line in proc.stdout.splitlines():
+			fields = line.split("\t")
+			if len(fields) == 3 and fields[2].startswith("ii"):
+				o.update(fields[:2])
+		return o.intersection(package_names)
+
 	def search(self, package_name : str):
 		return ""
 
@@ -36,6 +36,27 @@ class Pacman_Choco:
 
 		return proc_result == 0
 
+	def install_many(self, package_names : "list[str]", dry_run : bool = False) -> bool :
+		"""
+		Installs the packages with a single choco run.
+
+		dry_run : Only report what would be installed.
+		"""
+		args = ["install"]
+		args.extend(package_names)
+		args.append("-y")
+		if dry_run:
+			args.append("--noop")
+		proc = self._popen(args)
+		if proc.wait() != 0:
+			hubris.log_error(f"choco failed to install the packages {', '.join(package_names)}")
+			return False
+		return True
+
+	def installed(self, package_names : "list[str]") -> "set[str]" :
+		# choco skips installed packages on its own, its list command differs between versions
+		return set()
+
 	def search(self, package_name : str) -> bool :
 		proc = self._popen(["search", package_name], subprocess.PIPE)
 		pout, perr = proc.communicate()
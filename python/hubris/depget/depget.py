@@ -49,6 +49,39 @@ def install(package_name : str) -> bool :
 	else:
 		raise DepGetError("Invalid package manager")
 
+class InstallPlan:
+	"""
+	Packages split by whether they are already installed, see plan().
+	"""
+	__slots__ = ("installed", "missing")
+
+	def __init__(self, installed : "list[str]", missing : "list[str]"):
+		self.installed = installed
+		self.missing = missing
+
+# Checks which packages are already installed using the auto-determined package manager
+def plan(package_names : "list[str]") -> InstallPlan :
+	_pacman = _get_pacman()
+	if not _pacman.valid:
+		raise DepGetError("Invalid package manager")
+	package_names = list(dict.fromkeys(package_names))
+	installed = _pacman.installed(package_names)
+	return InstallPlan(
+		[v for v in package_names if v in installed],
+		[v for v in package_names if v not in installed]
+	)
+
+def install_all(package_names : "list[str]", dry_run : bool = False) -> bool :
+	"""
+	Installs the packages that aren't installed yet in one package manager transaction.
+
+	dry_run : Only resolve what would be installed, nothing is changed.
+	"""
+	missing = plan(package_names).missing
+	if len(missing) == 0:
+		return True
+	return _get_pacman().install_many(missing, dry_run=dry_run)
+
 # Searches for a package using the auto-determined package manager
 def search(package_name : str) -> str :
 	_pacman = _get_pacman()
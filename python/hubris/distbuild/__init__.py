@@ -0,0 +1,4 @@
+from .command import CompileCommand, read_compile_commands, split_command
+from .pool import WORKERS_ENV, WorkerPool
+from .worker import LocalWorkers, Worker
+from .launcher import compile_command, compile_commands
@@ -0,0 +1,36 @@
+#
+# python -m hubris.distbuild serve --address <address> [--slots <n>]
+#	Runs a compile worker.
+#
+# python -m hubris.distbuild <compiler> <args...>
+#	Runs a compile through the workers of $HUBRIS_DIST_WORKERS, used as a compiler launcher.
+#
+
+import sys
+
+from argparse import ArgumentParser
+
+from .launcher import compile_command
+from .worker import Worker
+
+
+def _serve(argv : "list[str]") -> int :
+	parser = ArgumentParser(prog="python -m hubris.distbuild serve", description="Runs a compile worker")
+	parser.add_argument("--address", required=True, help="unix:<path> or <host>:<port> to listen on")
+	parser.add_argument("--slots", type=int, default=None, help="Compiles run at once, defaults to the cpu count")
+	args = parser.parse_args(argv)
+
+	worker = Worker(args.address, args.slots)
+	try:
+		worker.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+
+if len(sys.argv) > 1 and sys.argv[1] == "serve":
+	sys.exit(_serve(sys.argv[2:]))
+if len(sys.argv) < 2:
+	sys.stderr.write("usage: python -m hubris.distbuild <compiler> <args...>\n")
+	sys.exit(2)
+sys.exit(compile_command(sys.argv[1:]))
@@ -0,0 +1,195 @@
+#
+# Compile commands, and splitting them into a local preprocess and a remote compile
+#
+
+import json
+import os
+import pathlib
+import re
+import shlex
+import subprocess
+import sys
+
+
+
+# Languages of the sources that can be distributed, with the language of their preprocessed output
+_SOURCE_LANGUAGES = {
+	".c" : "c",
+	".cc" : "c++",
+	".cp" : "c++",
+	".cpp" : "c++",
+	".cxx" : "c++",
+	".c++" : "c++",
+	".C" : "c++",
+}
+_PREPROCESSED_LANGUAGES = {
+	"c" : "cpp-output",
+	"c++" : "c++-cpp-output",
+}
+
+# gcc and clang drivers, possibly prefixed by a target triple or suffixed by a version
+COMPILER_REGEX = re.compile(r"^(?:[\w.+-]+-)?(?:gcc|g\+\+|cc|c\+\+|clang|clang\+\+)(?:-[\d.]+)?(?:\.exe)?$")
+
+# Only read by the preprocessor, left out of the remote compile
+_PREPROCESSOR_FLAGS_WITH_VALUE = ("-I", "-isystem", "-iquote", "-idirafter", "-include", "-imacros",
+	"-D", "-U", "-MF", "-MT", "-MQ", "-isysroot", "--sysroot")
+_PREPROCESSOR_FLAGS = ("-MD", "-MMD", "-MP", "-nostdinc", "-nostdinc++", "-H")
+
+# Joined forms of the above, ie "-Iinclude" or "--sysroot=/"
+_PREPROCESSOR_FLAG_PREFIXES = ("-I", "-D", "-U", "-isystem", "-iquote", "-idirafter", "-MF", "-MT", "-MQ",
+	"-isysroot", "--sysroot=")
+
+# Commands using these are compiled locally, they either can't be split, would run something
+# of the client's choosing on the worker, or write files next to the object (.dwo, .gcno,
+# .su, time traces, dumps) that the worker doesn't send back or bake its paths into the object
+_LOCAL_ONLY_FLAGS = ("-x", "-Xclang", "-E", "-S", "-M", "-MM", "-save-temps", "-B", "-specs", "-wrapper",
+	"--serialize-diagnostics", "--coverage", "-dumpdir", "-dumpbase")
+_LOCAL_ONLY_FLAG_PREFIXES = ("-fplugin", "-save-temps", "-specs=", "-B", "-wrapper", "@",
+	"-gsplit-dwarf", "-fprofile-arcs", "-ftest-coverage", "-fprofile-generate", "-ftime-trace",
+	"-fstack-usage", "-fcallgraph-info", "-fdump-", "-dumpbase")
+
+# Lines of `--version` naming where the compiler is installed, which may differ between machines
+_VERSION_IGNORED_PREFIXES = ("InstalledDir:",)
+
+# compiler_version() results by (path, mtime, size) of the compiler
+_compiler_versions : "dict[tuple, str | None]" = {}
+
+
+class CompileCommand:
+	"""
+	An entry of compile_commands.json.
+
+	directory : Directory the command runs in.
+	arguments : The command, compiler first.
+	file : The source it compiles, absolute.
+	output : The object it writes, if the entry says.
+	"""
+	__slots__ = ("directory", "arguments", "file", "output")
+
+	def __str__(self) -> str :
+		return " ".join(self.arguments)
+
+	def __init__(self, directory : str, arguments : "list[str]", file : str, output : "str | None" = None):
+		self.directory = directory
+		self.arguments = arguments
+		self.file = file
+		self.output = output
+
+
+def read_compile_commands(build_root : "str | pathlib.Path") -> "list[CompileCommand]" :
+	"""
+	Reads the compile_commands.json cmake exports to build_root (see CMake.generate()).
+	Returns an empty list if there isn't one.
+	"""
+	try:
+		with open(pathlib.Path(build_root).joinpath("compile_commands.json"), "r") as f:
+			entries = json.load(f)
+	except (OSError, ValueError):
+		return []
+
+	o = []
+	for v in entries:
+		arguments = v.get("arguments")
+		if arguments is None:
+			arguments = shlex.split(v["command"], posix=not sys.platform.startswith("win32"))
+		directory = v["directory"]
+		o.append(CompileCommand(directory, arguments, os.path.normpath(os.path.join(directory, v["file"])), v.get("output")))
+	return o
+
+
+class SplitCommand:
+	"""
+	A compile split in two, the command preprocessing the source where it is and the flags
+	compiling the preprocessed output anywhere.
+
+	preprocess_args : The command minus its output, "-E -o <file>" is added to run it. Dependency
+		files the build asked for (-MD -MF) are still written by it.
+	compile_args : Flags for the compile, without the compiler, input or output.
+	language : Language of the preprocessed output, given as "-x <language>".
+	output : Object file the original command writes, relative to where it runs.
+	"""
+	__slots__ = ("compiler", "source", "output", "language", "preprocess_args", "compile_args")
+
+	def __init__(self, compiler : str, source : str, output : str, language : str,
+		preprocess_args : "list[str]", compile_args : "list[str]"):
+		self.compiler = compiler
+		self.source = source
+		self.output = output
+		self.language = language
+		self.preprocess_args = preprocess_args
+		self.compile_args = compile_args
+
+
+def is_local_only(arg : str) -> bool :
+	return arg in _LOCAL_ONLY_FLAGS or arg.startswith(_LOCAL_ONLY_FLAG_PREFIXES)
+
+def compiler_version(executable : str) -> "str | None" :
+	"""
+	Gets the `--version` output of a compiler, which the client and worker compare so objects
+	are only compiled remotely by the same compiler. None if it couldn't be run.
+	"""
+	try:
+		st = os.stat(executable)
+	except OSError:
+		return None
+	stamp = (executable, st.st_mtime_ns, st.st_size)
+	if stamp in _compiler_versions:
+		return _compiler_versions[stamp]
+	try:
+		result = subprocess.run([executable, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+			text=True, errors="replace")
+		o = None
+		if result.returncode == 0:
+			o = "\n".join(v for v in result.stdout.strip().splitlines() if not v.startswith(_VERSION_IGNORED_PREFIXES))
+	except OSError:
+		o = None
+	_compiler_versions[stamp] = o
+	return o
+
+def split_command(arguments : "list[str]") -> "SplitCommand | None" :
+	"""
+	Splits a gcc or clang command compiling a single C or C++ source to an object.
+	Returns None for anything else (linking, msvc, precompiled headers, ...), which is built locally.
+	"""
+	if len(arguments) < 2 or not COMPILER_REGEX.match(os.path.basename(arguments[0])):
+		return None
+
+	compiler = arguments[0]
+	preprocess_args = [compiler]
+	compile_args = []
+	source = None
+	output = None
+	compiling = False
+
+	args = iter(arguments[1:])
+	for v in args:
+		if is_local_only(v):
+			return None
+		if v == "-c":
+			compiling = True
+		elif v == "-o":
+			output = next(args, None)
+		elif v.startswith("-o"):
+			output = v[2:]
+		elif v in _PREPROCESSOR_FLAGS_WITH_VALUE:
+			value = next(args, None)
+			if value is None:
+				return None
+			preprocess_args.extend([v, value])
+		elif v in _PREPROCESSOR_FLAGS or v.startswith(_PREPROCESSOR_FLAG_PREFIXES):
+			preprocess_args.append(v)
+		elif not v.startswith("-"):
+			# Only a single source, anything else would be an object or library to link
+			if source is not None or os.path.splitext(v)[1] not in _SOURCE_LANGUAGES:
+				return None
+			source = v
+			preprocess_args.append(v)
+		else:
+			# Code generation flags, the preprocessor sees them too as they may define macros (-O2, -std=)
+			preprocess_args.append(v)
+			compile_args.append(v)
+
+	if not compiling or source is None or output is None:
+		return None
+	language = _PREPROCESSED_LANGUAGES[_SOURCE_LANGUAGES[os.path.splitext(source)[1]]]
+	return SplitCommand(compiler, source, output, language, preprocess_args, compile_args)
@@ -0,0 +1,98 @@
+#
+# Compiling through the worker pool
+#
+# Sources are preprocessed where the build runs, so workers need nothing but a compiler,
+# then compiled by a worker and the object written where the build expects it. Anything
+# that can't be split, or that no worker could take, is compiled locally as is.
+#
+
+import concurrent.futures
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import typing
+
+import hubris
+
+from .command import compiler_version, split_command
+from .pool import WorkerPool
+
+if typing.TYPE_CHECKING:
+	from .command import CompileCommand
+
+
+
+def _run_local(arguments : "list[str]", directory : "str | None") -> int :
+	try:
+		return subprocess.run(arguments, cwd=directory).returncode
+	except OSError as exc:
+		sys.stderr.write(f"Failed to run {arguments[0]} : {exc}\n")
+		return 1
+
+def compile_command(arguments : "list[str]", directory : "str | None" = None,
+	pool : "WorkerPool | None" = None) -> int :
+	"""
+	Runs a compile command, on a worker of pool if it can be. Diagnostics are written to stderr.
+	Returns the exit code of the compile.
+
+	directory : Directory the command runs in, defaults to the current one.
+	pool : Workers to compile on, read from $HUBRIS_DIST_WORKERS by default.
+	"""
+	pool = pool or WorkerPool.from_env()
+	split = split_command(arguments)
+	if split is None or len(pool.addresses) == 0:
+		return _run_local(arguments, directory)
+
+	# Workers only take compiles for the same compiler, a bare name is looked up on PATH
+	executable = split.compiler
+	if os.path.basename(executable) == executable:
+		executable = shutil.which(executable)
+	else:
+		executable = os.path.join(directory or os.getcwd(), executable)
+	version = compiler_version(executable) if executable is not None else None
+	if version is None:
+		return _run_local(arguments, directory)
+
+	fd, preprocessed_path = tempfile.mkstemp(prefix="hubris-dist-", suffix=".i")
+	os.close(fd)
+	try:
+		# Preprocessing errors are the same the compile would report, no point compiling locally
+		returncode = _run_local(split.preprocess_args + ["-E", "-o", preprocessed_path], directory)
+		if returncode != 0:
+			return returncode
+		with open(preprocessed_path, "rb") as f:
+			source = f.read()
+	finally:
+		os.remove(preprocessed_path)
+
+	result = pool.compile(split.compiler, split.compile_args, split.language, source, version)
+	if result is None:
+		return _run_local(arguments, directory)
+
+	if len(result.stderr) != 0:
+		sys.stderr.write(result.stderr)
+	if result.returncode == 0:
+		output = os.path.join(directory or os.getcwd(), split.output)
+		os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+		with open(output, "wb") as f:
+			f.write(result.object)
+	return result.returncode
+
+def compile_commands(commands : "list[CompileCommand]", pool : WorkerPool, jobs : "int | None" = None) -> "list[int]" :
+	"""
+	Runs every command of a compile_commands.json at once through pool, ie to check that a tree
+	compiles without building it. Returns their exit codes in the same order.
+
+	jobs : Commands run at once, defaults to the slots of the reachable workers plus the cpu count.
+	"""
+	if jobs is None:
+		jobs = sum(pool.probe().values()) + (os.cpu_count() or 1)
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+		futures = [executor.submit(compile_command, v.arguments, v.directory, pool) for v in commands]
+		results = [v.result() for v in futures]
+	failed = sum(1 for v in results if v != 0)
+	if failed != 0:
+		hubris.log_error(f"{failed} of {len(commands)} compile(s) failed")
+	return results
@@ -0,0 +1,166 @@
+#
+# Talking to compile workers
+#
+# Every request is a connection of its own carrying one message each way. A message is
+# a 4 byte big endian header length, a JSON header, then header["size"] bytes of payload
+# (the preprocessed source going out, the object coming back).
+#
+
+import json
+import os
+import random
+import socket
+import struct
+
+import hubris
+
+
+
+PROTOCOL_VERSION = 2
+
+# Comma separated worker addresses compiler launchers send their compiles to
+WORKERS_ENV = "HUBRIS_DIST_WORKERS"
+
+_HEADER_LENGTH = struct.Struct(">I")
+_MAX_HEADER_SIZE = 1024 * 1024
+
+_CONNECT_TIMEOUT = 2.0
+_COMPILE_TIMEOUT = 600.0
+
+
+def parse_address(address : str) -> "tuple[int, str | tuple[str, int]]" :
+	"""
+	Parses "unix:<path>" or "<host>:<port>" into a socket family and address.
+	"""
+	if address.startswith("unix:"):
+		return socket.AF_UNIX, address[len("unix:"):]
+	host, sep, port = address.rpartition(":")
+	if len(sep) == 0 or not port.isdigit():
+		raise ValueError(f"Invalid worker address {address}, expected unix:<path> or <host>:<port>")
+	return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+def connect(address : str, timeout : float = _CONNECT_TIMEOUT) -> socket.socket :
+	family, addr = parse_address(address)
+	sock = socket.socket(family, socket.SOCK_STREAM)
+	try:
+		sock.settimeout(timeout)
+		sock.connect(addr)
+	except OSError:
+		sock.close()
+		raise
+	return sock
+
+def _recv_exact(sock : socket.socket, size : int) -> bytes :
+	chunks = []
+	while size != 0:
+		chunk = sock.recv(min(size, 1024 * 1024))
+		if len(chunk) == 0:
+			raise ConnectionError("Connection closed in the middle of a message")
+		chunks.append(chunk)
+		size -= len(chunk)
+	return b"".join(chunks)
+
+def send_message(sock : socket.socket, header : dict, payload : bytes = b""):
+	header = dict(header)
+	header["size"] = len(payload)
+	data = json.dumps(header).encode()
+	sock.sendall(_HEADER_LENGTH.pack(len(data)) + data)
+	if len(payload) != 0:
+		sock.sendall(payload)
+
+def recv_message(sock : socket.socket) -> "tuple[dict, bytes]" :
+	(length,) = _HEADER_LENGTH.unpack(_recv_exact(sock, _HEADER_LENGTH.size))
+	if length > _MAX_HEADER_SIZE:
+		raise ConnectionError(f"Message header of {length} bytes is too big")
+	header = json.loads(_recv_exact(sock, length).decode())
+	payload = _recv_exact(sock, int(header.get("size", 0)))
+	return header, payload
+
+
+class CompileResult:
+	"""
+	The outcome of a remote compile.
+
+	object : Contents of the object file, empty if the compile failed.
+	"""
+	__slots__ = ("returncode", "stderr", "object", "worker")
+
+	def __init__(self, returncode : int, stderr : str, object : bytes, worker : str):
+		self.returncode = returncode
+		self.stderr = stderr
+		self.object = object
+		self.worker = worker
+
+
+class WorkerPool:
+	"""
+	A set of compile workers. Each compile goes to the first worker, from a random one on,
+	that is reachable and has a free slot.
+	"""
+
+	def _request(self, address : str, header : dict, payload : bytes = b"",
+		timeout : float = _COMPILE_TIMEOUT) -> "tuple[dict, bytes]" :
+		with connect(address, self.connect_timeout) as sock:
+			sock.settimeout(timeout)
+			send_message(sock, header, payload)
+			return recv_message(sock)
+
+	def probe(self) -> "dict[str, int]" :
+		"""
+		Asks every worker how many compiles it runs at once. Unreachable ones are left out.
+		"""
+		o = {}
+		for v in self.addresses:
+			try:
+				header, _ = self._request(v, { "op" : "hello", "version" : PROTOCOL_VERSION }, timeout=self.connect_timeout)
+			except (OSError, ValueError) as exc:
+				hubris.log_debug(f"Compile worker {v} is unreachable : {exc}")
+				continue
+			if header.get("version") == PROTOCOL_VERSION:
+				o[v] = int(header.get("slots", 0))
+		return o
+
+	def compile(self, compiler : str, args : "list[str]", language : str, source : bytes,
+		compiler_version : str) -> "CompileResult | None" :
+		"""
+		Compiles a preprocessed source on a worker. Returns None if no worker could take it,
+		a compile that failed on a worker is a result like any other.
+
+		compiler_version : `--version` output of the client's compiler, see command.compiler_version().
+			Workers with a different compiler of the same name refuse the compile.
+		"""
+		if len(self.addresses) == 0:
+			return None
+		start = random.randrange(len(self.addresses))
+		header = {
+			"op" : "compile",
+			"version" : PROTOCOL_VERSION,
+			"compiler" : os.path.basename(compiler),
+			"compiler_version" : compiler_version,
+			"args" : args,
+			"language" : language,
+		}
+		for n in range(len(self.addresses)):
+			address = self.addresses[(start + n) % len(self.addresses)]
+			try:
+				reply, payload = self._request(address, header, source)
+			except (OSError, ValueError) as exc:
+				hubris.log_debug(f"Compile worker {address} failed : {exc}")
+				continue
+			if reply.get("busy"):
+				continue
+			if "error" in reply:
+				# The worker couldn't run the compile at all, ie it lacks the compiler or has another version
+				hubris.log_debug(f"Compile worker {address} failed : {reply['error']}")
+				continue
+			return CompileResult(int(reply.get("returncode", 1)), reply.get("stderr", ""), payload, address)
+		return None
+
+	def __init__(self, addresses : "list[str]", connect_timeout : float = _CONNECT_TIMEOUT):
+		self.addresses = list(addresses)
+		self.connect_timeout = connect_timeout
+
+	@staticmethod
+	def from_env(env = None) -> "WorkerPool" :
+		value = (env or os.environ).get(WORKERS_ENV, "")
+		return WorkerPool([v.strip() for v in value.split(",") if len(v.strip()) != 0])
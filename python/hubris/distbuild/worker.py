@@ -0,0 +1,197 @@
+#
+# Compile workers
+#
+# A worker compiles preprocessed sources it is sent with its own compiler of the same
+# name and version and sends the object back. Only gcc and clang drivers found on its PATH are run,
+# but the flags come from the client, so workers should only listen where the builds
+# using them are trusted.
+#
+
+import os
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import hubris
+
+from .command import COMPILER_REGEX, compiler_version, is_local_only
+from .pool import PROTOCOL_VERSION, WorkerPool, parse_address, recv_message, send_message
+
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+	def _compile(self, header : dict, source : bytes) -> "tuple[dict, bytes]" :
+		compiler = header.get("compiler", "")
+		args = header.get("args", [])
+		if not COMPILER_REGEX.match(compiler) or any(is_local_only(v) for v in args):
+			return { "error" : f"Refusing to run {compiler} {' '.join(args)}" }, b""
+		executable = shutil.which(compiler)
+		if executable is None:
+			return { "error" : f"Missing compiler {compiler}" }, b""
+		# Another version would make objects that differ from the ones compiled locally
+		version = compiler_version(executable)
+		if version is None or version != header.get("compiler_version"):
+			return { "error" : f"Compiler {compiler} isn't the same version as the client's" }, b""
+
+		suffix = ".ii" if header.get("language") == "c++-cpp-output" else ".i"
+		with tempfile.TemporaryDirectory(prefix="hubris-worker-") as tmp:
+			source_path = os.path.join(tmp, "source" + suffix)
+			object_path = os.path.join(tmp, "source.o")
+			with open(source_path, "wb") as f:
+				f.write(source)
+			command = [executable] + list(args) + ["-x", header.get("language", "c++-cpp-output"), source_path,
+				"-c", "-o", object_path]
+			result = subprocess.run(command, cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+			stderr = result.stdout.decode(errors="replace")
+			data = b""
+			if result.returncode == 0:
+				with open(object_path, "rb") as f:
+					data = f.read()
+		return { "returncode" : result.returncode, "stderr" : stderr }, data
+
+	def handle(self):
+		server : "Worker" = self.server.worker
+		try:
+			header, payload = recv_message(self.request)
+		except (OSError, ValueError) as exc:
+			hubris.log_debug(f"Dropped a compile request : {exc}")
+			return
+
+		if header.get("version") != PROTOCOL_VERSION:
+			reply, data = { "error" : f"Protocol version {header.get('version')} isn't {PROTOCOL_VERSION}" }, b""
+		elif header.get("op") == "hello":
+			reply, data = { "slots" : server.slots }, b""
+		elif header.get("op") != "compile":
+			reply, data = { "error" : f"Unknown request {header.get('op')}" }, b""
+		elif not server._slots.acquire(blocking=False):
+			reply, data = { "busy" : True }, b""
+		else:
+			try:
+				reply, data = self._compile(header, payload)
+			except OSError as exc:
+				reply, data = { "error" : str(exc) }, b""
+			finally:
+				server._slots.release()
+
+		reply["version"] = PROTOCOL_VERSION
+		try:
+			send_message(self.request, reply, data)
+		except OSError as exc:
+			hubris.log_debug(f"Failed to reply to a compile request : {exc}")
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+if hasattr(socketserver, "UnixStreamServer"):
+	class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+		daemon_threads = True
+
+
+class Worker:
+	"""
+	Serves compiles on an address, "unix:<path>" or "<host>:<port>".
+
+	slots : Compiles run at once, others are told the worker is busy. Defaults to the cpu count.
+	"""
+
+	def serve_forever(self):
+		hubris.log_info(f"Compile worker listening on {self.address} with {self.slots} slot(s)")
+		try:
+			self._server.serve_forever()
+		finally:
+			self.close()
+
+	def shutdown(self):
+		self._server.shutdown()
+
+	def close(self):
+		self._server.server_close()
+		family, addr = parse_address(self.address)
+		if family == socket.AF_UNIX and os.path.exists(addr):
+			os.remove(addr)
+
+	def __init__(self, address : str, slots : "int | None" = None):
+		self.address = address
+		self.slots = slots or os.cpu_count() or 1
+		self._slots = threading.BoundedSemaphore(self.slots)
+
+		family, addr = parse_address(address)
+		if family == socket.AF_UNIX:
+			if os.path.exists(addr):
+				os.remove(addr)
+			self._server = _UnixServer(addr, _Handler)
+		else:
+			self._server = _TCPServer(addr, _Handler)
+		self._server.worker = self
+
+
+def _free_tcp_address() -> str :
+	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+		sock.bind(("127.0.0.1", 0))
+		return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+class LocalWorkers:
+	"""
+	Worker processes on this machine, standing in for remote ones to test distributed builds.
+	Use as a context manager, or call stop() once done.
+
+	count : Number of worker processes.
+	slots : Compiles each of them runs at once.
+	"""
+
+	def stop(self):
+		for v in self._procs:
+			if v.poll() is None:
+				v.terminate()
+		for v in self._procs:
+			try:
+				v.wait(timeout=5)
+			except subprocess.TimeoutExpired:
+				v.kill()
+		self._procs = []
+		if self._dir is not None:
+			shutil.rmtree(self._dir, ignore_errors=True)
+			self._dir = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.stop()
+
+	def __init__(self, count : int, slots : int = 1, timeout : float = 10.0):
+		self.addresses : "list[str]" = []
+		self._procs : "list[subprocess.Popen]" = []
+		self._dir = None
+
+		if hasattr(socketserver, "UnixStreamServer"):
+			self._dir = tempfile.mkdtemp(prefix="hubris-workers-")
+			self.addresses = [f"unix:{os.path.join(self._dir, f'worker{n}.sock')}" for n in range(count)]
+		else:
+			self.addresses = [_free_tcp_address() for _ in range(count)]
+
+		# Started the same way a remote worker would be, with the hubris package on the path
+		env = dict(os.environ)
+		package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+		env["PYTHONPATH"] = os.pathsep.join(v for v in (package_root, env.get("PYTHONPATH")) if v)
+		for v in self.addresses:
+			self._procs.append(subprocess.Popen(
+				[sys.executable, "-m", "hubris.distbuild", "serve", "--address", v, "--slots", str(slots)],
+				env=env))
+
+		deadline = time.monotonic() + timeout
+		pool = WorkerPool(self.addresses)
+		while len(pool.probe()) != len(self.addresses):
+			if time.monotonic() > deadline or any(v.poll() is not None for v in self._procs):
+				self.stop()
+				raise RuntimeError(f"Failed to start {count} local compile worker(s)")
+			time.sleep(0.05)
@@ -6,3 +6,4 @@ from .filesystem import (
 	filter_children,
 	count_directory_contents
 )
+from .link import LinkMode, clone_file, clone_tree
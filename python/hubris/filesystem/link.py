@@ -0,0 +1,81 @@
+# Placing files without copying their contents where the filesystem allows it
+
+import os
+import shutil
+import sys
+
+from .path import Path
+
+
+
+class LinkMode:
+	reflink="reflink"
+	hardlink="hardlink"
+	copy="copy"
+
+# Tried in order by clone_file() unless told otherwise
+DEFAULT_LINK_MODES = (LinkMode.reflink, LinkMode.hardlink, LinkMode.copy)
+
+# ioctl cloning a whole file on Linux (btrfs, xfs, bcachefs, ...), _IOW(0x94, 9, int)
+_FICLONE = 0x40049409
+
+
+def _reflink(src : str, dst : str):
+	if not sys.platform.startswith("linux"):
+		raise OSError("reflinks are only supported on linux")
+	import fcntl
+	with open(src, "rb") as fsrc:
+		with open(dst, "wb") as fdst:
+			try:
+				fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+			except OSError:
+				fdst.close()
+				os.remove(dst)
+				raise
+	shutil.copystat(src, dst)
+
+def clone_file(src : "str | Path", dst : "str | Path", modes : "tuple[str, ...]" = DEFAULT_LINK_MODES) -> str :
+	"""
+	Places src at dst with the first of modes the filesystem supports, replacing dst if it exists.
+	Reflinks share the data until either file is written, hardlinks are the same file so writing
+	either changes both. Returns the LinkMode used.
+	"""
+	src = str(src)
+	dst = str(dst)
+	if os.path.lexists(dst):
+		os.remove(dst)
+
+	for mode in modes:
+		try:
+			if mode == LinkMode.reflink:
+				_reflink(src, dst)
+			elif mode == LinkMode.hardlink:
+				os.link(src, dst)
+			else:
+				shutil.copy2(src, dst)
+			return mode
+		except OSError:
+			continue
+	raise OSError(f"Failed to place {src} at {dst} with any of {modes}")
+
+def clone_tree(src : "str | Path", dst : "str | Path", modes : "tuple[str, ...]" = DEFAULT_LINK_MODES) -> "dict[str, int]" :
+	"""
+	Places every file under src at the same relative path under dst with clone_file(), symlinks
+	are recreated as is. Returns how many files were placed with each LinkMode.
+	"""
+	counts = {}
+	src = str(src)
+	for root, dirs, files in os.walk(src):
+		out_root = os.path.join(str(dst), os.path.relpath(root, src))
+		os.makedirs(out_root, exist_ok=True)
+		for v in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+			path = os.path.join(root, v)
+			out_path = os.path.join(out_root, v)
+			if os.path.islink(path):
+				if os.path.lexists(out_path):
+					os.remove(out_path)
+				os.symlink(os.readlink(path), out_path)
+				continue
+			mode = clone_file(path, out_path, modes)
+			counts[mode] = counts.get(mode, 0) + 1
+	return counts
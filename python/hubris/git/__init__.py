@@ -1,11 +1,27 @@
+from .error import GitError
+from .session import GitSession, ObjectInfo, active_session
+from .repoinfo import RepoInfo, repo_info
+from .clone import clone, update_mirror
+from .stream import GitProcess, stream
+from .log import Commit, log
+from .diff import changed_files
+
 from .git import (
+	Change,
+	ChangeType,
+	StatusResult,
 	branch,
+	refs,
+	rev_parse,
+	object_info,
+	read_object,
 	rename_branch,
 	delete_branch,
 	checkout,
 	create_branch,
 	status,
 	add,
+	add_many,
 	commit,
 	push,
 	pull,
@@ -0,0 +1,205 @@
+#
+# asyncio variants of the hubris.git commands
+#
+# Each coroutine takes the same arguments and returns the same result as its
+# counterpart in hubris.git, but awaits the git process instead of blocking.
+#
+
+import asyncio
+import typing
+
+from hubris.filesystem import Path as Path
+
+from .git import (
+	_proc_output,
+	_parse_branch_output,
+	_parse_status_text,
+	_parse_porcelain_v2,
+	_make_pathspec_input,
+	_refs_changed
+)
+from .session import active_session
+from .repoinfo import repo_info
+
+if typing.TYPE_CHECKING:
+	from .git import StatusResult
+
+
+
+async def _communicate(command : "list[str]", input : "str | None" = None) -> "tuple[str, str]" :
+	proc = await asyncio.create_subprocess_exec(
+		*command,
+		stdin=asyncio.subprocess.PIPE if input is not None else None,
+		stdout=asyncio.subprocess.PIPE,
+		stderr=asyncio.subprocess.PIPE)
+
+	proc_stdout, proc_stderr = await proc.communicate(input.encode() if input is not None else None)
+	return proc_stdout.decode(), proc_stderr.decode()
+
+async def _run(command : "list[str]", quiet : bool, input : "str | None" = None) -> bool :
+	proc_stdout, proc_stderr = await _communicate(command, input)
+	return _proc_output(command, proc_stdout, proc_stderr, quiet=quiet)
+
+
+async def branch(repo_root : "str | Path" = ".", quiet : bool = False):
+	session = active_session(repo_root)
+	if session is not None:
+		# The session's pipes block, answer from a thread
+		return await asyncio.get_running_loop().run_in_executor(None, session.branch)
+
+	info = repo_info(repo_root)
+	if info is not None and not info.is_detached() and info.head_sha() is not None:
+		return info.current_branch(), info.branches()
+
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"branch"
+	]
+	proc_stdout, proc_stderr = await _communicate(command)
+
+	# Check for errors
+	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
+		return None
+
+	return _parse_branch_output(proc_stdout)
+
+async def rename_branch(new_name : str, repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"branch",
+		"-m",
+		str(new_name)
+	]
+	result = await _run(command, quiet)
+	_refs_changed(repo_root)
+	return result
+
+async def delete_branch(branch_name : str, force : bool = False, repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"branch",
+		"-D" if force else "-d",
+		str(branch_name)
+	]
+	result = await _run(command, quiet)
+	_refs_changed(repo_root)
+	return result
+
+async def create_branch(branch_name : str, repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"branch",
+		str(branch_name)
+	]
+	result = await _run(command, quiet)
+	_refs_changed(repo_root)
+	return result
+
+async def checkout(branch_name : str, repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"checkout",
+		"-q",
+		str(branch_name)
+	]
+	result = await _run(command, quiet)
+	_refs_changed(repo_root)
+	return result
+
+async def status(repo_root : "str | Path" = ".", quiet : bool = False, porcelain : bool = True, untracked : bool = False) -> "StatusResult | None" :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"status"
+	]
+	if porcelain:
+		command.extend([
+			"--porcelain=v2",
+			"-z",
+			"--untracked-files=" + ("all" if untracked else "no")
+		])
+	proc_stdout, proc_stderr = await _communicate(command)
+
+	# Check for errors
+	if not _proc_output(command, proc_stdout.replace("\0", "\n"), proc_stderr, quiet=quiet):
+		return None
+
+	if porcelain:
+		return _parse_porcelain_v2(proc_stdout)
+	return _parse_status_text(proc_stdout)
+
+async def add(pattern : str, repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"add",
+		str(pattern)
+	]
+	return await _run(command, quiet)
+
+async def add_many(paths : "list[str | Path]", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	if len(paths) == 0:
+		return True
+
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"add",
+		"--pathspec-from-file=-",
+		"--pathspec-file-nul"
+	]
+	return await _run(command, quiet, _make_pathspec_input(paths))
+
+async def commit(message : str = "", repo_root : "str | Path" = ".", quiet : bool = False, paths : "list[str | Path] | None" = None) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"commit",
+		"-m", str(message)
+	]
+
+	proc_input = None
+	if paths is not None:
+		command.extend([
+			"--pathspec-from-file=-",
+			"--pathspec-file-nul"
+		])
+		proc_input = _make_pathspec_input(paths)
+
+	result = await _run(command, quiet, proc_input)
+	_refs_changed(repo_root)
+	return result
+
+async def push(auto_set_upstream : bool = False, remote_name : str = "origin", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"push"
+	]
+
+	if auto_set_upstream:
+		info = repo_info(repo_root)
+		if info is not None and not info.is_detached():
+			_branch = info.current_branch()
+		else:
+			_branch, _ = await branch(repo_root=repo_root, quiet=quiet)
+		command.extend(["--set-upstream", str(remote_name), str(_branch)])
+
+	result = await _run(command, quiet)
+	_refs_changed(repo_root)
+	return result
+
+async def pull(auto_set_upstream : bool = False, remote_name : str = "origin", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"pull"
+	]
+	result = await _run(command, quiet)
+	_refs_changed(repo_root)
+	return result
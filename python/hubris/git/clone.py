@@ -0,0 +1,161 @@
+#
+# Cloning, with an optional local cache of bare mirrors to borrow objects from
+#
+
+import contextlib
+import hashlib
+import os
+import re
+import subprocess
+import sys
+
+import hubris
+from hubris.filesystem import Path as Path
+
+from .git import _proc_output
+
+
+
+# Environment variable holding the default mirror cache directory
+MIRROR_CACHE_ENV = "HUBRIS_GIT_MIRROR_CACHE"
+
+_MIRROR_NAME_INVALID_REGEX = re.compile("[^a-zA-Z0-9_\-.]")
+
+
+def _run(command : "list[str]", quiet : bool) -> bool :
+	proc = subprocess.Popen(
+		command,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE,
+		text=True)
+
+	proc_stdout, proc_stderr = proc.communicate()
+	proc.wait()
+
+	if proc.returncode != 0 and len(proc_stderr) == 0:
+		proc_stderr = f"error: git exited with {proc.returncode}"
+
+	# Check for errors
+	return _proc_output(command, proc_stdout, proc_stderr, quiet=quiet)
+
+def mirror_path(url : str, mirror_cache : "str | Path") -> Path :
+	"""
+	Gets the path of the bare mirror for a url within a mirror cache directory.
+	"""
+	name = url.rstrip("/").split("/")[-1].removesuffix(".git")
+	name = _MIRROR_NAME_INVALID_REGEX.sub("_", name)
+	digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+	return Path(mirror_cache).joinpath(f"{name}-{digest}.git")
+
+@contextlib.contextmanager
+def _mirror_lock(path : Path):
+	"""
+	Holds an exclusive lock on a mirror, so concurrent configures don't fetch into it at once.
+	"""
+	os.makedirs(path.parent, exist_ok=True)
+	with open(f"{path}.lock", "a+b") as f:
+		if sys.platform.startswith("win32"):
+			import msvcrt
+			f.seek(0)
+			while True:
+				try:
+					msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+					break
+				except OSError:
+					# LK_LOCK gives up after 10 seconds, keep waiting
+					continue
+			try:
+				yield
+			finally:
+				f.seek(0)
+				msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+		else:
+			import fcntl
+			fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def update_mirror(url : str, mirror_cache : "str | Path", quiet : bool = False) -> "Path | None" :
+	"""
+	Creates or fetches the bare mirror of url in the mirror cache.
+	Returns the mirror's path, or None if it couldn't be made.
+
+	Refs deleted upstream are kept, clones that didn't dissociate may still borrow their
+	objects and pruning them would corrupt those clones.
+	"""
+	path = mirror_path(url, mirror_cache)
+	with _mirror_lock(path):
+		if path.is_dir():
+			command = [
+				"git",
+				"-C", str(path),
+				"fetch",
+				"--quiet",
+				"origin"
+			]
+		else:
+			command = [
+				"git",
+				"clone",
+				"--mirror",
+				"--quiet",
+				url,
+				str(path)
+			]
+
+		if not _run(command, quiet):
+			return None
+	return path
+
+def clone(url : str,
+	dest : "str | Path",
+	branch : "str | None" = None,
+	depth : "int | None" = None,
+	filter : "str | None" = None,
+	single_branch : bool = False,
+	reference : "str | Path | None" = None,
+	mirror_cache : "str | Path | None" = None,
+	dissociate : bool = True,
+	quiet : bool = False) -> bool :
+	"""
+	Clones a repository.
+
+	branch : Branch or tag to check out instead of the remote HEAD.
+	depth : Create a shallow clone with this many commits. Local remotes must use a file:// url.
+	filter : Partial clone filter, ie "blob:none".
+	single_branch : Only fetch the history of the checked out branch.
+	reference : Borrow objects from this repository if it exists (--reference-if-able).
+	mirror_cache : Directory of bare mirrors, the mirror for url is created or updated and used
+		as the reference. Defaults to the HUBRIS_GIT_MIRROR_CACHE environment variable.
+	dissociate : Copy borrowed objects so the clone doesn't depend on the reference afterwards.
+		Without it a prune or gc of the reference can corrupt the clone.
+	"""
+	mirror_cache = mirror_cache or os.getenv(MIRROR_CACHE_ENV) or None
+	if mirror_cache is not None and reference is None:
+		reference = update_mirror(url, mirror_cache, quiet=quiet)
+		if reference is None:
+			hubris.log_warn(f"Failed to update the mirror of {url}, cloning without it")
+
+	command = [
+		"git",
+		"clone",
+		"--quiet"
+	]
+	if branch is not None:
+		command.extend(["--branch", str(branch)])
+	if depth is not None:
+		command.extend(["--depth", str(depth)])
+	if filter is not None:
+		command.append(f"--filter={filter}")
+	if single_branch:
+		command.append("--single-branch")
+	if reference is not None:
+		command.extend(["--reference-if-able", str(reference)])
+		if dissociate:
+			command.append("--dissociate")
+	command.extend([url, str(dest)])
+
+	hubris.log_debug(f"{command}")
+	return _run(command, quiet)
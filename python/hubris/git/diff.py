@@ -0,0 +1,57 @@
+#
+# Files changed between revisions
+#
+
+import hubris
+from hubris.filesystem import Path as Path
+
+from .stream import stream
+
+
+
+def _read_paths(args : "list[str]", repo_root : "str | Path", quiet : bool) -> "list[Path] | None" :
+	proc = stream(args, repo_root=repo_root, separator="\0")
+	with proc:
+		o = [Path(v) for v in proc if len(v) != 0]
+
+	if proc.error is not None or proc.returncode != 0:
+		if not quiet:
+			hubris.log_error(f"{proc.name}\n\t" + "\n".join(proc.stderr_tail).strip())
+		return None
+	return o
+
+def changed_files(since : str = "HEAD",
+	until : "str | None" = None,
+	untracked : bool = True,
+	repo_root : "str | Path" = ".",
+	quiet : bool = False) -> "list[Path] | None" :
+	"""
+	Lists the files changed since a revision, relative to repo_root. Renames count as both the
+	old and the new path. Returns None if git failed, ie because the revision doesn't exist.
+
+	since : Anything `git diff` accepts as a revision, ie "origin/main" or a merge base.
+	until : Revision to compare against, the working tree (uncommitted changes included) if None.
+	untracked : Add untracked files that aren't ignored, only used when comparing the working tree.
+	"""
+	args = [
+		"diff",
+		"--name-only",
+		"-z",
+		"--no-renames",
+		"--relative",
+		since
+	]
+	if until is not None:
+		args.append(until)
+	args.append("--")
+
+	o = _read_paths(args, repo_root, quiet)
+	if o is None:
+		return None
+
+	if untracked and until is None:
+		others = _read_paths(["ls-files", "--others", "--exclude-standard", "-z"], repo_root, quiet)
+		if others is None:
+			return None
+		o.extend(others)
+	return o
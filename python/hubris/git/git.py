@@ -1,10 +1,14 @@
+import os
 import subprocess
 
 import re
 import hubris
-import hubris.filesystem as fs
 from hubris.filesystem import Path as Path
 
+from .session import GitSession, active_session, invalidate_session
+from .repoinfo import repo_info, invalidate_repo_info
+from .stream import stream
+
 
 
 _FATAL_BRANCH_REGEX = re.compile("fatal:")
@@ -62,7 +66,38 @@ def _proc_output(command : "list[str]", stdout : str, stderr : str, quiet : bool
 	return True
 
 
+def _refs_changed(repo_root : "str | Path"):
+	"""
+	Drops cached ref data for a repository after a command that may have moved HEAD or refs.
+	"""
+	invalidate_session(repo_root)
+	invalidate_repo_info(repo_root)
+
+def _parse_branch_output(stream : str) -> "tuple[str, list[str]]" :
+	current_branch = ""
+	branches = []
+
+	lines = stream.splitlines(False)
+	for v in lines:
+		s = v.strip()
+		if s.startswith("*"):
+			s = s.removeprefix("*").strip()
+			current_branch = s
+		branches.append(s)
+
+	return current_branch, branches
+
 def branch(repo_root : "str | Path" = ".", quiet : bool = False):
+	# Answer from the active session's pipes if there is one
+	session = active_session(repo_root)
+	if session is not None:
+		return session.branch()
+
+	# Read straight from the .git directory when HEAD is on a branch
+	info = repo_info(repo_root)
+	if info is not None and not info.is_detached() and info.head_sha() is not None:
+		return info.current_branch(), info.branches()
+
 	command = [
 		"git",
 		"-C", str(repo_root),
@@ -80,20 +115,43 @@ def branch(repo_root : "str | Path" = ".", quiet : bool = False):
 	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
 		return None
 
-	# Parse current branch
+	return _parse_branch_output(proc_stdout)
 
-	current_branch = ""
-	branches = []
+def _session_query(repo_root : "str | Path", query):
+	session = active_session(repo_root)
+	if session is not None:
+		return query(session)
 
-	lines = proc_stdout.splitlines(False)
-	for v in lines:
-		s = v.strip()
-		if s.startswith("*"):
-			s = s.removeprefix("*").strip()
-			current_branch = s
-		branches.append(s)
+	# A throwaway session only starts the one process the query needs
+	session = GitSession(repo_root)
+	try:
+		return query(session)
+	finally:
+		session.close()
 
-	return current_branch, branches
+def refs(repo_root : "str | Path" = ".") -> "dict[str, str] | None" :
+	"""
+	Gets a mapping of full ref names to the object they point at, or None on failure.
+	"""
+	return _session_query(repo_root, lambda session: session.refs())
+
+def rev_parse(rev : str, repo_root : "str | Path" = ".") -> "str | None" :
+	"""
+	Resolves a revision to its object id, or None if it doesn't exist.
+	"""
+	return _session_query(repo_root, lambda session: session.rev_parse(rev))
+
+def object_info(rev : str, repo_root : "str | Path" = ".") -> "ObjectInfo | None" :
+	"""
+	Gets the id, type and size of an object, or None if it doesn't exist.
+	"""
+	return _session_query(repo_root, lambda session: session.object_info(rev))
+
+def read_object(rev : str, repo_root : "str | Path" = ".") -> "tuple[ObjectInfo, bytes] | None" :
+	"""
+	Reads the raw contents of an object, or None if it doesn't exist.
+	"""
+	return _session_query(repo_root, lambda session: session.read_object(rev))
 
 def rename_branch(new_name : str, repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
 	
@@ -111,6 +169,7 @@ def rename_branch(new_name : str, repo_root : "str | Path" = ".", quiet : bool =
 	
 	proc_stdout, proc_stderr = proc.communicate()
 	proc.wait()
+	_refs_changed(repo_root)
 
 	# Check for errors
 	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
@@ -137,6 +196,7 @@ def delete_branch(branch_name : str, force : bool = False, repo_root : "str | Pa
 	
 	proc_stdout, proc_stderr = proc.communicate()
 	proc.wait()
+	_refs_changed(repo_root)
 
 	# Check for errors
 	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
@@ -159,6 +219,7 @@ def create_branch(branch_name : str, repo_root : "str | Path" = ".", quiet : boo
 	
 	proc_stdout, proc_stderr = proc.communicate()
 	proc.wait()
+	_refs_changed(repo_root)
 
 	# Check for errors
 	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
@@ -184,6 +245,7 @@ def checkout(branch_name : str, repo_root : "str | Path" = ".", quiet : bool = F
 	
 	proc_stdout, proc_stderr = proc.communicate()
 	proc.wait()
+	_refs_changed(repo_root)
 
 	# Check for errors
 	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
@@ -195,55 +257,141 @@ class ChangeType:
 	modified = "modified"
 	new = "new file"
 	deleted = "deleted"
+	renamed = "renamed"
+	copied = "copied"
+	type_changed = "typechange"
+	unmerged = "unmerged"
+	untracked = "untracked"
 
 class Change:
+	__slots__ = ("file", "type", "orig_file", "conflict")
+
 	def __str__(self) -> str :
 		return str(self.file)
-	def __init__(self, file : "Path | str", type : ChangeType):
+	def __init__(self, file : "Path | str", type : ChangeType, orig_file : "Path | str | None" = None, conflict : "str | None" = None):
 		self.file = Path(file)
 		self.type = type
 
+		# Source path of a rename or copy
+		self.orig_file = Path(orig_file) if orig_file is not None else None
+
+		# Porcelain XY code of an unmerged path, ie "UU" or "AA"
+		self.conflict = conflict
+
+def _index_changes(changes : "list[Change]") -> "dict[Path, Change]" :
+	index = {}
+	for v in changes:
+		index.setdefault(v.file, v)
+	return index
+
 class StatusResult:
-	def __init__(self, staged : "list[Change]" = [], unstaged : "list[Change]" = []):
-		self.staged : "list[Change]" = staged
-		self.unstaged : "list[Change]" = unstaged
-		
-		self.all : "list[Change]" = []
-		self.all.extend(staged)
-
-		for v in unstaged:
-			found = False
-			for q in self.all:
-				if v.file == q.file:
-					found = True
-					break
-			if not found:
+
+	def by_path(self, path : "Path | str") -> "Change | None" :
+		"""
+		Gets the change recorded for a path, staged changes take priority over unstaged ones.
+		"""
+		return self._index.get(Path(path))
+
+	def staged_paths(self) -> "list[Path]" :
+		return list(self._staged_index.keys())
+
+	def unstaged_paths(self) -> "list[Path]" :
+		return list(self._unstaged_index.keys())
+
+	def __init__(self, staged : "list[Change] | None" = None, unstaged : "list[Change] | None" = None,
+		untracked : "list[Change] | None" = None, conflicted : "list[Change] | None" = None):
+		self.staged : "list[Change]" = staged if staged is not None else []
+		self.unstaged : "list[Change]" = unstaged if unstaged is not None else []
+		self.untracked : "list[Change]" = untracked if untracked is not None else []
+		self.conflicted : "list[Change]" = conflicted if conflicted is not None else []
+
+		self._staged_index = _index_changes(self.staged)
+		self._unstaged_index = _index_changes(self.unstaged)
+
+		# Staged changes first, then any unstaged change to a path not already staged
+		self._index : "dict[Path, Change]" = dict(self._staged_index)
+		self.all : "list[Change]" = list(self._staged_index.values())
+		for path, v in self._unstaged_index.items():
+			if path not in self._index:
+				self._index[path] = v
 				self.all.append(v)
 
+		for v in self.conflicted:
+			self._index.setdefault(v.file, v)
+		for v in self.untracked:
+			self._index.setdefault(v.file, v)
 
 
 
-def status(repo_root : "str | Path" = ".", quiet : bool = False) -> "StatusResult | None" :
 
-	command = [
-		"git",
-		"-C", str(repo_root),
-		"status",
-	]
-	proc = subprocess.Popen(
-		command,
-		stdout=subprocess.PIPE,
-		stderr=subprocess.PIPE,
-		text=True)
-	
-	proc_stdout, proc_stderr = proc.communicate()
-	proc.wait()
+# Maps a porcelain v2 X or Y status letter to a change type
+_PORCELAIN_CHANGE_TYPES = {
+	"M" : ChangeType.modified,
+	"T" : ChangeType.type_changed,
+	"A" : ChangeType.new,
+	"D" : ChangeType.deleted,
+	"R" : ChangeType.renamed,
+	"C" : ChangeType.copied,
+}
 
-	# Check for errors
-	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
-		return None
+# Number of space separated fields preceding the path in each porcelain v2 record type
+_PORCELAIN_ORDINARY_FIELDS = 8
+_PORCELAIN_RENAMED_FIELDS = 9
+_PORCELAIN_UNMERGED_FIELDS = 10
 
-	# Parse modified files list
+def _parse_porcelain_v2(stream : str) -> StatusResult :
+	"""
+	Parses the output of `git status --porcelain=v2 -z` in a single pass.
+	"""
+	staged = []
+	unstaged = []
+	untracked = []
+	conflicted = []
+
+	records = stream.split("\0")
+	n = 0
+	count = len(records)
+	while n < count:
+		record = records[n]
+		n += 1
+		if len(record) == 0:
+			continue
+
+		kind = record[0]
+		if kind == "1" or kind == "2":
+			if kind == "1":
+				fields = record.split(" ", _PORCELAIN_ORDINARY_FIELDS)
+				path = fields[_PORCELAIN_ORDINARY_FIELDS]
+				orig_path = None
+			else:
+				# Renames and copies carry the original path as the following record
+				fields = record.split(" ", _PORCELAIN_RENAMED_FIELDS)
+				path = fields[_PORCELAIN_RENAMED_FIELDS]
+				orig_path = records[n]
+				n += 1
+
+			x = fields[1][0]
+			y = fields[1][1]
+			if x != ".":
+				staged.append(Change(path, _PORCELAIN_CHANGE_TYPES.get(x, ChangeType.modified), orig_path))
+			if y != ".":
+				unstaged.append(Change(path, _PORCELAIN_CHANGE_TYPES.get(y, ChangeType.modified)))
+
+		elif kind == "u":
+			fields = record.split(" ", _PORCELAIN_UNMERGED_FIELDS)
+			conflicted.append(Change(fields[_PORCELAIN_UNMERGED_FIELDS], ChangeType.unmerged, conflict=fields[1]))
+
+		elif kind == "?":
+			untracked.append(Change(record[2:], ChangeType.untracked))
+
+		# "!" ignored entries and "#" headers are not reported
+
+	return StatusResult(staged, unstaged, untracked, conflicted)
+
+def _parse_status_text(stream : str) -> StatusResult :
+	"""
+	Scrapes the human readable output of `git status`.
+	"""
 	staged = []
 	unstaged = []
 	
@@ -257,7 +405,7 @@ def status(repo_root : "str | Path" = ".", quiet : bool = False) -> "StatusResul
 
 	push = push_other
 
-	lines = proc_stdout.splitlines()
+	lines = stream.splitlines()
 	for v in lines:
 		s = v.strip()
 		
@@ -297,15 +445,47 @@ def status(repo_root : "str | Path" = ".", quiet : bool = False) -> "StatusResul
 		
 	return StatusResult(staged, unstaged)
 
-def add(pattern : "str", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+def _status_porcelain(repo_root : "str | Path", untracked : bool, quiet : bool) -> "StatusResult | None" :
 
 	command = [
 		"git",
 		"-C", str(repo_root),
-		"add",
-		str(pattern)
+		"status",
+		"--porcelain=v2",
+		"-z",
+		"--untracked-files=" + ("all" if untracked else "no")
 	]
+	proc = subprocess.Popen(
+		command,
+		stdout=subprocess.PIPE,
+		stderr=subprocess.PIPE,
+		text=True)
 	
+	proc_stdout, proc_stderr = proc.communicate()
+	proc.wait()
+
+	# Check for errors
+	if not _proc_output(command, proc_stdout.replace("\0", "\n"), proc_stderr, quiet=quiet):
+		return None
+
+	return _parse_porcelain_v2(proc_stdout)
+
+def status(repo_root : "str | Path" = ".", quiet : bool = False, porcelain : bool = True, untracked : bool = False) -> "StatusResult | None" :
+	"""
+	Gets the changes in the working tree and index.
+
+	porcelain : Parse git's machine readable output, this handles any path and also reports
+		renames, copies and conflicts. When False the human readable output is scraped instead.
+	untracked : Also report untracked files, only supported with porcelain.
+	"""
+	if porcelain:
+		return _status_porcelain(repo_root, untracked=untracked, quiet=quiet)
+
+	command = [
+		"git",
+		"-C", str(repo_root),
+		"status",
+	]
 	proc = subprocess.Popen(
 		command,
 		stdout=subprocess.PIPE,
@@ -317,18 +497,20 @@ def add(pattern : "str", repo_root : "str | Path" = ".", quiet : bool = False) -
 
 	# Check for errors
 	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
-		return False
+		return None
 
-	return True
+	return _parse_status_text(proc_stdout)
 
+def _make_pathspec_input(paths : "list[str | Path]") -> str :
+	return "\0".join(str(v) for v in paths)
 
-def commit(message : str = "", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+def add(pattern : "str", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
 
 	command = [
 		"git",
 		"-C", str(repo_root),
-		"commit",
-		"-m", str(message)
+		"add",
+		str(pattern)
 	]
 	
 	proc = subprocess.Popen(
@@ -346,25 +528,29 @@ def commit(message : str = "", repo_root : "str | Path" = ".", quiet : bool = Fa
 
 	return True
 
-def push(auto_set_upstream : bool = False, remote_name : str = "origin", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
-	
+def add_many(paths : "list[str | Path]", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	"""
+	Stages a list of paths using a single git invocation, the list is streamed over stdin.
+	"""
+	if len(paths) == 0:
+		return True
+
 	command = [
 		"git",
 		"-C", str(repo_root),
-		"push"
+		"add",
+		"--pathspec-from-file=-",
+		"--pathspec-file-nul"
 	]
-
-	if auto_set_upstream:
-		_branch, _ = branch(repo_root=repo_root, quiet=quiet)
-		command.extend(["--set-upstream", str(remote_name), str(_branch)])
-			
+	
 	proc = subprocess.Popen(
 		command,
+		stdin=subprocess.PIPE,
 		stdout=subprocess.PIPE,
 		stderr=subprocess.PIPE,
 		text=True)
 	
-	proc_stdout, proc_stderr = proc.communicate()
+	proc_stdout, proc_stderr = proc.communicate(_make_pathspec_input(paths))
 	proc.wait()
 
 	# Check for errors
@@ -373,22 +559,37 @@ def push(auto_set_upstream : bool = False, remote_name : str = "origin", repo_ro
 
 	return True
 
-def pull(auto_set_upstream : bool = False, remote_name : str = "origin", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+
+def commit(message : str = "", repo_root : "str | Path" = ".", quiet : bool = False, paths : "list[str | Path] | None" = None) -> bool :
+	"""
+	paths : Only commit these paths, in the same form as add_many(). When None the index is committed.
+	"""
 
 	command = [
 		"git",
 		"-C", str(repo_root),
-		"pull"
+		"commit",
+		"-m", str(message)
 	]
+
+	proc_input = None
+	if paths is not None:
+		command.extend([
+			"--pathspec-from-file=-",
+			"--pathspec-file-nul"
+		])
+		proc_input = _make_pathspec_input(paths)
 	
 	proc = subprocess.Popen(
 		command,
+		stdin=subprocess.PIPE if proc_input is not None else None,
 		stdout=subprocess.PIPE,
 		stderr=subprocess.PIPE,
 		text=True)
 	
-	proc_stdout, proc_stderr = proc.communicate()
+	proc_stdout, proc_stderr = proc.communicate(proc_input)
 	proc.wait()
+	_refs_changed(repo_root)
 
 	# Check for errors
 	if not _proc_output(command, proc_stdout, proc_stderr, quiet=quiet):
@@ -396,27 +597,39 @@ def pull(auto_set_upstream : bool = False, remote_name : str = "origin", repo_ro
 
 	return True
 
+def push(auto_set_upstream : bool = False, remote_name : str = "origin", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
+	
+	args = [
+		"push"
+	]
 
+	if auto_set_upstream:
+		info = repo_info(repo_root)
+		if info is not None and not info.is_detached():
+			_branch = info.current_branch()
+		else:
+			_branch, _ = branch(repo_root=repo_root, quiet=quiet)
+		args.extend(["--set-upstream", str(remote_name), str(_branch)])
+
+	# Streamed so only the tail of the output is held onto
+	proc = stream(args, repo_root=repo_root)
+	result = proc.finish(quiet=quiet)
+	_refs_changed(repo_root)
+	return result
 
-def is_local_repo(repo_root : "str | fs.Path" = ".") -> bool :
-	"""
-	Checks if a directory is a git repository.
-	"""
-	# Fix arg
-	repo_root = Path(repo_root).resolve()
+def pull(auto_set_upstream : bool = False, remote_name : str = "origin", repo_root : "str | Path" = ".", quiet : bool = False) -> bool :
 
-	# Ensure we got a directory path
-	if not repo_root.is_dir():
-		return False
+	# Streamed so only the tail of the output is held onto
+	proc = stream(["pull"], repo_root=repo_root)
+	result = proc.finish(quiet=quiet)
+	_refs_changed(repo_root)
+	return result
 
-	# Look for a .git directory
-	repo_git_dir_path = repo_root.joinpath(".git")
-	if repo_git_dir_path.exists() and repo_git_dir_path.is_dir():
-		return True
-	else:
-		# I know returning bool like this is stupid and I could just evaluate the if condition.
-		# It's probably seems reasonably that I am using python and would therefore think this is fine.
-		# 
-		# Fuck off, I'll write an "is_even()" function next
-		return False
 
+
+def is_local_repo(repo_root : "str | Path" = ".") -> bool :
+	"""
+	Checks if a directory is a git repository.
+	"""
+	# A single stat, the .git directory can only exist if repo_root is a directory
+	return os.path.isdir(os.path.join(str(repo_root), ".git"))
@@ -0,0 +1,117 @@
+#
+# Lazy commit history queries
+#
+
+import hubris
+from hubris.filesystem import Path as Path
+
+from .error import GitError
+from .stream import stream
+
+
+
+_FIELD_SEPERATOR = "\x1f"
+
+# Commit fields and the `git log --format` placeholder each is read from
+_FIELD_PLACEHOLDERS = {
+	"sha" : "%H",
+	"parents" : "%P",
+	"tree" : "%T",
+	"author_name" : "%an",
+	"author_email" : "%ae",
+	"author_time" : "%at",
+	"committer_name" : "%cn",
+	"committer_email" : "%ce",
+	"commit_time" : "%ct",
+	"subject" : "%s",
+	"body" : "%b",
+}
+
+_INT_FIELDS = ("author_time", "commit_time")
+
+DEFAULT_FIELDS = ("sha", "parents", "author_name", "author_email", "author_time", "subject")
+
+
+class Commit:
+	"""
+	A commit read by log(). Fields that weren't requested are None.
+	parents is a list of object ids, times are unix timestamps.
+	"""
+	__slots__ = tuple(_FIELD_PLACEHOLDERS.keys())
+
+	def __str__(self) -> str :
+		return str(self.sha)
+
+	def __init__(self, **fields):
+		for v in Commit.__slots__:
+			setattr(self, v, fields.get(v))
+
+
+def _make_format(fields : "tuple[str, ...]") -> str :
+	parts = []
+	for v in fields:
+		placeholder = _FIELD_PLACEHOLDERS.get(v)
+		if placeholder is None:
+			raise ValueError(f"Unknown commit field {v}")
+		parts.append(placeholder)
+	return "%x1f".join(parts)
+
+def _parse_commit(record : str, fields : "tuple[str, ...]") -> Commit :
+	values = record.split(_FIELD_SEPERATOR, len(fields) - 1)
+	commit = Commit()
+	for name, value in zip(fields, values):
+		if name == "parents":
+			value = value.split()
+		elif name in _INT_FIELDS:
+			value = int(value)
+		elif name == "body":
+			value = value.rstrip("\n")
+		setattr(commit, name, value)
+	return commit
+
+def log(rev_range : "str | None" = "HEAD",
+	paths : "list[str | Path] | None" = None,
+	fields : "tuple[str, ...]" = DEFAULT_FIELDS,
+	max_count : "int | None" = None,
+	first_parent : bool = False,
+	repo_root : "str | Path" = ".",
+	quiet : bool = False):
+	"""
+	Lazily yields a Commit for each commit in rev_range, newest first.
+	Commits are parsed as git produces them so walking a long history doesn't hold it in memory.
+	Raises GitError once git fails, ie on a bad revision or outside a repository, so a failure
+	can't be mistaken for an empty history.
+
+	rev_range : Anything `git log` accepts, ie "v1.0..HEAD". None walks HEAD.
+	paths : Only include commits touching these paths.
+	fields : Names of the Commit fields to read, see _FIELD_PLACEHOLDERS.
+	max_count : Stop after this many commits.
+	first_parent : Only follow the first parent of merge commits.
+	"""
+	fields = tuple(fields)
+	args = [
+		"log",
+		"-z",
+		"--format=" + _make_format(fields)
+	]
+	if max_count is not None:
+		args.append(f"--max-count={max_count}")
+	if first_parent:
+		args.append("--first-parent")
+	if rev_range is not None:
+		args.append(str(rev_range))
+	args.append("--")
+	if paths is not None:
+		args.extend(str(v) for v in paths)
+
+	proc = stream(args, repo_root=repo_root, separator="\0")
+	with proc:
+		for record in proc:
+			if len(record) != 0:
+				yield _parse_commit(record, fields)
+
+	if not proc.wait():
+		stderr = "\n".join(proc.stderr_tail).strip() or f"error: git exited with {proc.returncode}"
+		if not quiet:
+			hubris.log_error(f"{proc.name}\n\t{stderr}")
+		raise GitError(f"{proc.name} failed : {stderr}")
@@ -0,0 +1,98 @@
+#
+# Runs hubris.git commands across many repositories at once
+#
+
+import concurrent.futures
+import time
+
+import hubris
+from hubris.filesystem import Path as Path
+
+from . import git
+
+
+
+_DEFAULT_MAX_WORKERS = 8
+
+
+class RepoResult:
+	"""
+	Outcome of running an operation on a single repository.
+
+	value : Whatever the operation returned.
+	ok : False if the operation returned False/None, raised, or was cancelled by fail_fast.
+	elapsed : Wall time in seconds spent running the operation.
+	"""
+	__slots__ = ("repo_root", "value", "ok", "elapsed", "error", "cancelled")
+
+	def __str__(self) -> str :
+		state = "ok" if self.ok else ("cancelled" if self.cancelled else "failed")
+		return f"{self.repo_root} {state} ({self.elapsed:.2f}s)"
+
+	def __init__(self, repo_root : "str | Path", value = None, ok : bool = False, elapsed : float = 0.0,
+		error : "BaseException | None" = None, cancelled : bool = False):
+		self.repo_root = repo_root
+		self.value = value
+		self.ok = ok
+		self.elapsed = elapsed
+		self.error = error
+		self.cancelled = cancelled
+
+
+def _run_one(operation, repo_root : "str | Path", kwargs : dict) -> RepoResult :
+	start = time.perf_counter()
+	try:
+		value = operation(repo_root=repo_root, **kwargs)
+	except Exception as exc:
+		return RepoResult(repo_root, ok=False, elapsed=time.perf_counter() - start, error=exc)
+	ok = value is not None and value is not False
+	return RepoResult(repo_root, value=value, ok=ok, elapsed=time.perf_counter() - start)
+
+def run(repo_roots : "list[str | Path]", operation, max_workers : "int | None" = None,
+	fail_fast : bool = False, **kwargs) -> "list[RepoResult]" :
+	"""
+	Runs operation(repo_root=..., **kwargs) for every repo root on a bounded thread pool.
+	Results are returned in the same order as repo_roots.
+
+	operation : Any hubris.git command, or a callable with the same repo_root keyword.
+	max_workers : Upper bound on concurrently running operations.
+	fail_fast : Cancel operations that haven't started yet once one fails.
+	"""
+	results : "list[RepoResult | None]" = [None] * len(repo_roots)
+	if len(repo_roots) == 0:
+		return []
+
+	max_workers = max_workers or min(_DEFAULT_MAX_WORKERS, len(repo_roots))
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+		futures = {}
+		for n, v in enumerate(repo_roots):
+			futures[pool.submit(_run_one, operation, v, kwargs)] = n
+
+		failed = False
+		for future in concurrent.futures.as_completed(futures):
+			if future.cancelled():
+				continue
+			result = future.result()
+			results[futures[future]] = result
+			if not result.ok and fail_fast and not failed:
+				failed = True
+				hubris.log_error(f"Stopping, {result.repo_root} failed")
+				for f in futures:
+					f.cancel()
+
+		# Fill in the operations that never started
+		for future, n in futures.items():
+			if results[n] is None:
+				results[n] = RepoResult(repo_roots[n], ok=False, cancelled=True)
+
+	return results
+
+
+def status(repo_roots : "list[str | Path]", max_workers : "int | None" = None, fail_fast : bool = False, **kwargs) -> "list[RepoResult]" :
+	return run(repo_roots, git.status, max_workers=max_workers, fail_fast=fail_fast, **kwargs)
+
+def pull(repo_roots : "list[str | Path]", max_workers : "int | None" = None, fail_fast : bool = False, **kwargs) -> "list[RepoResult]" :
+	return run(repo_roots, git.pull, max_workers=max_workers, fail_fast=fail_fast, **kwargs)
+
+def push(repo_roots : "list[str | Path]", max_workers : "int | None" = None, fail_fast : bool = False, **kwargs) -> "list[RepoResult]" :
+	return run(repo_roots, git.push, max_workers=max_workers, fail_fast=fail_fast, **kwargs)
@@ -0,0 +1,227 @@
+#
+# Cached repository metadata read straight from the .git directory
+#
+
+import os
+import subprocess
+
+from hubris.filesystem import Path as Path
+
+
+
+_HEAD_REF_PREFIX = "ref: "
+_HEADS_PREFIX = "refs/heads/"
+
+# Cached infos keyed by absolute repo root
+_REPO_INFOS : "dict[str, RepoInfo]" = {}
+
+
+def _repo_key(repo_root : "str | Path") -> str :
+	return os.path.abspath(str(repo_root))
+
+def _read_text(path : str) -> "str | None" :
+	try:
+		with open(path, "r") as f:
+			return f.read()
+	except OSError:
+		return None
+
+def _stat_key(path : str) -> "tuple[int, int] | None" :
+	try:
+		st = os.stat(path)
+	except OSError:
+		return None
+	return st.st_mtime_ns, st.st_size
+
+def _find_git_dir(repo_root : str) -> "str | None" :
+	"""
+	Finds the git directory for a repo root, following the `gitdir:` file used by
+	worktrees and submodules.
+	"""
+	dot_git = os.path.join(repo_root, ".git")
+	if os.path.isdir(dot_git):
+		return dot_git
+
+	data = _read_text(dot_git)
+	if data is None or not data.startswith("gitdir:"):
+		return None
+	git_dir = data.removeprefix("gitdir:").strip()
+	if not os.path.isabs(git_dir):
+		git_dir = os.path.join(repo_root, git_dir)
+	if not os.path.isdir(git_dir):
+		return None
+	return git_dir
+
+
+class RepoInfo:
+	"""
+	Memoizes the current branch, branch list, HEAD object id and upstream of a repository.
+
+	Values are read from HEAD, loose refs and packed-refs without running git where
+	possible. Everything is dropped when the mtime of HEAD, the index, packed-refs,
+	any directory under refs/heads, the current branch's ref or the config changes, so a
+	repeated query costs a handful of stats.
+	"""
+
+	def _fingerprint(self) -> tuple :
+		o = [
+			_stat_key(self._head_path),
+			_stat_key(self._index_path),
+			_stat_key(self._packed_refs_path),
+			_stat_key(self._config_path),
+		]
+		# Refs are written through a rename, so adding, moving or deleting a nested branch
+		# like feature/x only shows on the mtime of its own directory
+		for root, _, _ in os.walk(self._heads_path):
+			o.append((root, _stat_key(root)))
+		head_ref = self._values.get("head_ref")
+		if head_ref is not None:
+			o.append(_stat_key(os.path.join(self._common_dir, head_ref)))
+		return tuple(o)
+
+	def _validate(self):
+		fingerprint = self._fingerprint()
+		if fingerprint != self._fingerprint_value:
+			self._values = {}
+			self._read_head()
+			self._fingerprint_value = self._fingerprint()
+
+	def _read_head(self):
+		data = _read_text(self._head_path)
+		head = data.strip() if data is not None else ""
+		if head.startswith(_HEAD_REF_PREFIX):
+			self._values["head_ref"] = head.removeprefix(_HEAD_REF_PREFIX)
+			self._values["detached_sha"] = None
+		else:
+			self._values["head_ref"] = None
+			self._values["detached_sha"] = head or None
+
+	def _packed_refs(self) -> "dict[str, str]" :
+		if "packed_refs" not in self._values:
+			refs = {}
+			data = _read_text(self._packed_refs_path) or ""
+			for line in data.splitlines():
+				if len(line) == 0 or line[0] == "#" or line[0] == "^":
+					continue
+				parts = line.split(" ", 1)
+				if len(parts) == 2:
+					refs[parts[1]] = parts[0]
+			self._values["packed_refs"] = refs
+		return self._values["packed_refs"]
+
+	def _resolve_ref(self, ref : str) -> "str | None" :
+		data = _read_text(os.path.join(self._common_dir, ref))
+		if data is not None:
+			data = data.strip()
+			if data.startswith(_HEAD_REF_PREFIX):
+				return self._resolve_ref(data.removeprefix(_HEAD_REF_PREFIX))
+			return data
+		return self._packed_refs().get(ref)
+
+	def invalidate(self):
+		self._values = {}
+		self._fingerprint_value = None
+
+	def is_detached(self) -> bool :
+		self._validate()
+		return self._values["head_ref"] is None
+
+	def current_branch(self) -> "str | None" :
+		"""
+		Gets the checked out branch name, or None if HEAD is detached.
+		"""
+		self._validate()
+		head_ref = self._values["head_ref"]
+		if head_ref is None:
+			return None
+		return head_ref.removeprefix(_HEADS_PREFIX)
+
+	def head_sha(self) -> "str | None" :
+		"""
+		Gets the object id HEAD points at, or None on an unborn branch.
+		"""
+		self._validate()
+		if "head_sha" not in self._values:
+			head_ref = self._values["head_ref"]
+			if head_ref is None:
+				self._values["head_sha"] = self._values["detached_sha"]
+			else:
+				self._values["head_sha"] = self._resolve_ref(head_ref)
+		return self._values["head_sha"]
+
+	def branches(self) -> "list[str]" :
+		"""
+		Gets the names of all local branches, sorted the same way `git branch` sorts them.
+		"""
+		self._validate()
+		if "branches" not in self._values:
+			names = set()
+			for ref in self._packed_refs().keys():
+				if ref.startswith(_HEADS_PREFIX):
+					names.add(ref.removeprefix(_HEADS_PREFIX))
+			for root, _, files in os.walk(self._heads_path):
+				for v in files:
+					name = os.path.relpath(os.path.join(root, v), self._heads_path)
+					names.add(name.replace(os.sep, "/"))
+			self._values["branches"] = sorted(names)
+		return self._values["branches"]
+
+	def upstream(self) -> "str | None" :
+		"""
+		Gets the upstream of the current branch, ie "origin/main", or None if it has none.
+		"""
+		self._validate()
+		if "upstream" not in self._values:
+			# Config can include other files and has its own quoting rules, let git read it
+			proc = subprocess.run(
+				["git", "-C", self.repo_root, "rev-parse", "--abbrev-ref", "--symbolic-full-name", "@{upstream}"],
+				stdout=subprocess.PIPE,
+				stderr=subprocess.DEVNULL,
+				text=True)
+			upstream = proc.stdout.strip()
+			self._values["upstream"] = upstream if proc.returncode == 0 and len(upstream) != 0 else None
+		return self._values["upstream"]
+
+	def __init__(self, repo_root : str, git_dir : str):
+		self.repo_root = repo_root
+		self.git_dir = git_dir
+
+		# Linked worktrees keep their refs in the main repository's git directory
+		common_dir = _read_text(os.path.join(git_dir, "commondir"))
+		if common_dir is not None:
+			common_dir = common_dir.strip()
+			if not os.path.isabs(common_dir):
+				common_dir = os.path.normpath(os.path.join(git_dir, common_dir))
+		self._common_dir = common_dir or git_dir
+
+		self._head_path = os.path.join(git_dir, "HEAD")
+		self._index_path = os.path.join(git_dir, "index")
+		self._packed_refs_path = os.path.join(self._common_dir, "packed-refs")
+		self._heads_path = os.path.join(self._common_dir, "refs", "heads")
+		self._config_path = os.path.join(self._common_dir, "config")
+
+		self._values : dict = {}
+		self._fingerprint_value : "tuple | None" = None
+
+
+def repo_info(repo_root : "str | Path" = ".") -> "RepoInfo | None" :
+	"""
+	Gets the cached RepoInfo for a repository root.
+	Returns None if repo_root isn't the top level of a repository.
+	"""
+	key = _repo_key(repo_root)
+	info = _REPO_INFOS.get(key)
+	if info is not None:
+		return info
+
+	git_dir = _find_git_dir(key)
+	if git_dir is None:
+		return None
+	info = RepoInfo(key, git_dir)
+	_REPO_INFOS[key] = info
+	return info
+
+def invalidate_repo_info(repo_root : "str | Path" = "."):
+	info = _REPO_INFOS.get(_repo_key(repo_root))
+	if info is not None:
+		info.invalidate()
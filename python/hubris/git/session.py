@@ -0,0 +1,248 @@
+#
+# Long lived git pipes for answering ref and object queries without a fork per call
+#
+
+import subprocess
+import threading
+
+import hubris
+from hubris.filesystem import Path as Path
+
+
+
+# Sessions registered as active, keyed by their resolved repo root
+_ACTIVE_SESSIONS : "dict[str, GitSession]" = {}
+
+_REF_FIELD_SEPERATOR = "\x00"
+_REF_FORMAT = "%(HEAD)%00%(refname)%00%(objectname)"
+_HEADS_PREFIX = "refs/heads/"
+
+
+def _session_key(repo_root : "str | Path") -> str :
+	return str(Path(repo_root).resolve())
+
+def active_session(repo_root : "str | Path" = ".") -> "GitSession | None" :
+	"""
+	Gets the session registered as active for a repo root, or None if there isn't one.
+	"""
+	if len(_ACTIVE_SESSIONS) == 0:
+		return None
+	return _ACTIVE_SESSIONS.get(_session_key(repo_root))
+
+def invalidate_session(repo_root : "str | Path" = "."):
+	"""
+	Drops cached ref data held by the active session for a repo root, if any.
+	Called by commands that move HEAD or change refs.
+	"""
+	session = active_session(repo_root)
+	if session is not None:
+		session.invalidate()
+
+
+class ObjectInfo:
+	__slots__ = ("sha", "type", "size")
+
+	def __str__(self) -> str :
+		return f"{self.sha} {self.type} {self.size}"
+
+	def __init__(self, sha : str, type : str, size : int):
+		self.sha = sha
+		self.type = type
+		self.size = size
+
+class _BatchPipe:
+	"""
+	A single `git cat-file` process fed queries over stdin.
+	"""
+
+	def _start(self):
+		self._proc = subprocess.Popen(self._command,
+			stdin=subprocess.PIPE,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.DEVNULL)
+
+	def query(self, rev : str) -> "tuple[ObjectInfo, bytes | None] | None" :
+		if "\n" in rev:
+			return None
+
+		if self._proc is None or self._proc.poll() is not None:
+			self._start()
+
+		try:
+			self._proc.stdin.write(rev.encode() + b"\n")
+			self._proc.stdin.flush()
+			header = self._proc.stdout.readline()
+		except (BrokenPipeError, OSError):
+			self.close()
+			return None
+
+		# Process exited, most likely not a repository
+		if len(header) == 0:
+			self.close()
+			return None
+
+		parts = header.decode().split()
+		if len(parts) != 3:
+			# "<rev> missing" or "<rev> ambiguous"
+			return None
+
+		info = ObjectInfo(parts[0], parts[1], int(parts[2]))
+		data = None
+		if self._with_contents:
+			data = self._proc.stdout.read(info.size)
+			self._proc.stdout.read(1)
+		return info, data
+
+	def close(self):
+		if self._proc is not None:
+			try:
+				self._proc.stdin.close()
+			except OSError:
+				pass
+			self._proc.wait()
+			self._proc = None
+
+	def __init__(self, repo_root : str, with_contents : bool):
+		self._with_contents = with_contents
+		self._command = [
+			"git",
+			"-C", repo_root,
+			"cat-file",
+			"--batch" if with_contents else "--batch-check"
+		]
+		self._proc : "subprocess.Popen | None" = None
+
+
+class GitSession:
+	"""
+	Keeps `git cat-file --batch-check` / `--batch` processes open for a repository and
+	answers branch, ref and object queries over them.
+
+	While a session is active (see activate() or use it as a context manager) the module
+	level functions in hubris.git delegate their read-only queries to it.
+
+	`git for-each-ref` has no stdin query mode, so its output is snapshotted once and reused
+	until invalidate() is called. The hubris.git commands that change refs do this for you.
+	"""
+
+	def _load_refs(self) -> bool :
+		command = [
+			"git",
+			"-C", self.repo_root,
+			"for-each-ref",
+			f"--format={_REF_FORMAT}"
+		]
+		proc = subprocess.run(command,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.PIPE,
+			text=True)
+		if proc.returncode != 0:
+			hubris.log_error(f"git for-each-ref\n\t{proc.stderr.strip()}")
+			return False
+
+		refs = {}
+		head_ref = None
+		for line in proc.stdout.splitlines(False):
+			parts = line.split(_REF_FIELD_SEPERATOR)
+			if len(parts) != 3:
+				continue
+			if parts[0] == "*":
+				head_ref = parts[1]
+			refs[parts[1]] = parts[2]
+
+		self._refs = refs
+		self._head_ref = head_ref
+		return True
+
+	def refs(self) -> "dict[str, str] | None" :
+		"""
+		Gets a mapping of full ref names to the object they point at.
+		"""
+		with self._lock:
+			if self._refs is None and not self._load_refs():
+				return None
+			return self._refs
+
+	def branch(self) -> "tuple[str, list[str]] | None" :
+		"""
+		Same result as hubris.git.branch(), the current branch and a list of all local branches.
+		"""
+		with self._lock:
+			if self._refs is None and not self._load_refs():
+				return None
+
+			current_branch = ""
+			branches = []
+			for name in self._refs.keys():
+				if name.startswith(_HEADS_PREFIX):
+					branches.append(name.removeprefix(_HEADS_PREFIX))
+
+			if self._head_ref is not None:
+				current_branch = self._head_ref.removeprefix(_HEADS_PREFIX)
+			else:
+				# Detached HEAD, mirror what `git branch` prints
+				result = self._check.query("HEAD")
+				if result is not None:
+					current_branch = f"(HEAD detached at {result[0].sha[:7]})"
+					branches.insert(0, current_branch)
+
+			return current_branch, branches
+
+	def rev_parse(self, rev : str) -> "str | None" :
+		"""
+		Resolves a revision to its object id, or None if it doesn't exist.
+		"""
+		info = self.object_info(rev)
+		if info is None:
+			return None
+		return info.sha
+
+	def object_info(self, rev : str) -> "ObjectInfo | None" :
+		with self._lock:
+			result = self._check.query(rev)
+		if result is None:
+			return None
+		return result[0]
+
+	def read_object(self, rev : str) -> "tuple[ObjectInfo, bytes] | None" :
+		"""
+		Reads the raw contents of an object.
+		"""
+		with self._lock:
+			return self._batch.query(rev)
+
+	def invalidate(self):
+		with self._lock:
+			self._refs = None
+			self._head_ref = None
+
+	def activate(self):
+		_ACTIVE_SESSIONS[self._key] = self
+
+	def deactivate(self):
+		if _ACTIVE_SESSIONS.get(self._key) is self:
+			del _ACTIVE_SESSIONS[self._key]
+
+	def close(self):
+		self.deactivate()
+		with self._lock:
+			self._check.close()
+			self._batch.close()
+
+	def __enter__(self):
+		self.activate()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+	def __init__(self, repo_root : "str | Path" = "."):
+		self._key = _session_key(repo_root)
+		self.repo_root = self._key
+		self._lock = threading.RLock()
+
+		self._check = _BatchPipe(self.repo_root, with_contents=False)
+		self._batch = _BatchPipe(self.repo_root, with_contents=True)
+
+		self._refs : "dict[str, str] | None" = None
+		self._head_ref : "str | None" = None
@@ -0,0 +1,187 @@
+#
+# Streaming execution of git commands
+#
+# Output is decoded and handed out a record at a time as git produces it, errors on
+# stderr are seen as they arrive, and only the most recent lines are kept for logging.
+#
+
+import collections
+import re
+import subprocess
+import threading
+
+import hubris
+from hubris.filesystem import Path as Path
+
+
+
+_ERROR_LINE_REGEX = re.compile("(fatal|error):")
+
+# Number of stdout/stderr lines retained for logging once the command finishes
+_DEFAULT_MAX_RETAINED_LINES = 200
+
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_records(stream, separator : bytes):
+	"""
+	Yields separator terminated records from a binary stream without reading it all in.
+	"""
+	if separator == b"\n":
+		for line in stream:
+			yield line.rstrip(b"\r\n")
+		return
+
+	pending = b""
+	while True:
+		chunk = stream.read1(_READ_CHUNK_SIZE)
+		if len(chunk) == 0:
+			break
+		pending += chunk
+		records = pending.split(separator)
+		pending = records.pop()
+		for v in records:
+			yield v
+	if len(pending) != 0:
+		yield pending
+
+
+class GitProcess:
+	"""
+	A running git command. Iterating it yields stdout records as they are produced.
+
+	stdout_tail, stderr_tail : The last few lines of output, bounded by max_retained_lines.
+	error : The first "fatal:" or "error:" line seen on stderr, None if there wasn't one.
+	aborted : True if the command was killed, because of an error or by abort().
+	"""
+
+	def _write_stdin(self, input : bytes):
+		try:
+			self._proc.stdin.write(input)
+			self._proc.stdin.close()
+		except (BrokenPipeError, OSError):
+			pass
+
+	def _read_stderr(self):
+		for v in _iter_records(self._proc.stderr, b"\n"):
+			line = v.decode(errors="replace")
+			self.stderr_tail.append(line)
+			if self._on_stderr is not None:
+				self._on_stderr(line)
+			if self.error is None and _ERROR_LINE_REGEX.search(line):
+				self.error = line
+				if self._abort_on_error:
+					self.abort()
+
+	def __iter__(self):
+		for v in _iter_records(self._proc.stdout, self._separator):
+			if self.aborted:
+				break
+			record = v.decode(errors="replace")
+			self.stdout_tail.append(record)
+			yield record
+
+	def abort(self):
+		if self._proc.poll() is None:
+			self.aborted = True
+			self._proc.kill()
+
+	def wait(self) -> bool :
+		"""
+		Drains any unread output and waits for the command to exit.
+		Returns False if an error was reported or git exited with a nonzero returncode.
+		"""
+		if self.returncode is None:
+			for _ in self:
+				pass
+			self.returncode = self._proc.wait()
+			self._stderr_thread.join()
+			self._proc.stdout.close()
+			self._proc.stderr.close()
+		return self.error is None and not self.aborted and self.returncode == 0
+
+	def finish(self, quiet : bool = False) -> bool :
+		"""
+		Waits for the command and logs its retained output, the same way the hubris.git commands do.
+		"""
+		result = self.wait()
+		if not result:
+			if not quiet:
+				stderr = "\n".join(self.stderr_tail).strip() or f"error: git exited with {self.returncode}"
+				hubris.log_error(f"{self.name}\n\t{stderr}")
+			return False
+
+		if not quiet and len(self.stdout_tail) != 0:
+			stdout = "\n".join(self.stdout_tail).strip()
+			if len(stdout) != 0:
+				hubris.log_info(f"{self.name}\n\t{stdout}")
+		return True
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		# Only stop git when the caller bailed out, otherwise let it finish what it was doing
+		if exc_type is not None:
+			self.abort()
+		self.wait()
+
+	def __init__(self, command : "list[str]", name : str, separator : bytes, max_retained_lines : int,
+		abort_on_error : bool, on_stderr, input : "bytes | None"):
+		self.name = name
+		self.returncode : "int | None" = None
+		self.error : "str | None" = None
+		self.aborted = False
+		self.stdout_tail : "collections.deque[str]" = collections.deque(maxlen=max_retained_lines)
+		self.stderr_tail : "collections.deque[str]" = collections.deque(maxlen=max_retained_lines)
+
+		self._separator = separator
+		self._abort_on_error = abort_on_error
+		self._on_stderr = on_stderr
+
+		self._proc = subprocess.Popen(
+			command,
+			stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.PIPE)
+
+		self._stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+		self._stderr_thread.start()
+
+		# Feed stdin from its own thread so a large input can't deadlock against a full stdout pipe
+		if input is not None:
+			threading.Thread(target=self._write_stdin, args=(input,), daemon=True).start()
+
+
+def stream(args : "list[str]",
+	repo_root : "str | Path" = ".",
+	separator : str = "\n",
+	max_retained_lines : int = _DEFAULT_MAX_RETAINED_LINES,
+	abort_on_error : bool = False,
+	on_stderr = None,
+	input : "str | None" = None) -> GitProcess :
+	"""
+	Starts `git -C <repo_root> <args...>` and returns a GitProcess to iterate its output.
+
+	separator : Record separator of stdout, use "\\0" for -z output.
+	abort_on_error : Kill the command as soon as stderr reports "fatal:" or "error:". Only use it
+		for read-only commands, killing one that writes can leave locks or a half done merge behind.
+	on_stderr : Optional callable invoked with each stderr line, ie to show progress.
+	"""
+	command = [
+		"git",
+		"-C", str(repo_root)
+	]
+	command.extend(args)
+
+	name = "git"
+	if len(args) != 0:
+		name += " " + str(args[0])
+
+	return GitProcess(command,
+		name=name,
+		separator=separator.encode(),
+		max_retained_lines=max_retained_lines,
+		abort_on_error=abort_on_error,
+		on_stderr=on_stderr,
+		input=input.encode() if input is not None else None)
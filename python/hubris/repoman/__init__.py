@@ -1,2 +1,13 @@
 from .repoman import RepoMan
 from .cmake import CMake, CMakeDef
+from .compiler_cache import CompilerCache, CompilerCacheStats
+from .buildlog import Diagnostic, DiagnosticSeverity, parse_diagnostic
+from .telemetry import BuildReport, make_build_report
+from .unity import UnityBuild
+from .pch import PrecompiledHeaders
+from .artifact_cache import ArtifactCache
+from .install import InstallStats, sync_tree
+from .matrix import BuildVariant, VariantResult, build_matrix, make_matrix
+from .modules import Module, ModuleResult, ModuleState, build_modules, find_modules
+from .fileapi import CodeModel, CodeModelTarget, Toolchain, read_codemodel
+from .affected import Affected, find_affected
@@ -0,0 +1,167 @@
+#
+# Targets and modules affected by a change
+#
+# Changed files are mapped to the targets of the CMake code model that own them, then to
+# every target depending on those, directly or not. CI can build and test only those
+# instead of the whole tree when a change touches a single module.
+#
+
+import json
+import os
+import re
+import subprocess
+import typing
+
+import hubris
+
+from .fileapi import CodeModel
+
+if typing.TYPE_CHECKING:
+	import pathlib
+
+
+
+# Files cmake reads before any CMakeLists, they can change how every target builds
+_PRESET_FILES = ("CMakePresets.json", "CMakeUserPresets.json")
+
+def _is_cmake_input(model : CodeModel, path : str) -> bool :
+	name = os.path.basename(path)
+	return name == "CMakeLists.txt" or name.endswith(".cmake") or name in _PRESET_FILES or model.is_cmake_input(path)
+
+def _is_toolchain_file(model : CodeModel, path : str) -> bool :
+	toolchain_file = model.cache.get("CMAKE_TOOLCHAIN_FILE")
+	if not toolchain_file:
+		return False
+	toolchain_file = os.path.normpath(os.path.join(model.source_root, toolchain_file))
+	return os.path.normcase(toolchain_file) == os.path.normcase(path)
+
+def _is_under(path : str, root : str) -> bool :
+	return os.path.commonpath([os.path.normcase(path), os.path.normcase(root)]) == os.path.normcase(root)
+
+
+class Affected:
+	"""
+	What a set of changed files affects.
+
+	changed : Absolute paths of the changed files.
+	owned : Names of the targets owning a changed file.
+	targets : Names of the owning targets and every target depending on them, sorted.
+	modules : Names of the modules holding an affected target or a changed file, sorted.
+	"""
+
+	def __str__(self) -> str :
+		return f"{len(self.changed)} changed file(s) affect {len(self.targets)} target(s) in {len(self.modules)} module(s)"
+
+	def __init__(self, changed : "list[str]"):
+		self.changed = changed
+		self.owned : "list[str]" = []
+		self.targets : "list[str]" = []
+		self.modules : "list[str]" = []
+
+
+def _owning_targets(model : CodeModel, path : str) -> "list[str]" :
+	"""
+	Finds the targets a changed file belongs to. A source belongs to the targets compiling it,
+	a CMakeLists.txt to every target added below its directory, anything else (ie headers) to
+	the targets added by the closest directory above it with any.
+
+	Other CMake inputs, ie modules brought in with include(), presets and the toolchain file,
+	can be read from anywhere so they belong to every target. So does a CMakeLists.txt with
+	no target below it.
+	"""
+	owners = model.targets_of_source(path)
+	if len(owners) != 0:
+		return [v.name for v in owners]
+
+	d = os.path.dirname(path)
+	if _is_cmake_input(model, path) or _is_toolchain_file(model, path):
+		if os.path.basename(path) == "CMakeLists.txt":
+			owners = [v.name for v in model.targets.values() if _is_under(v.source_dir, d)]
+			if len(owners) != 0:
+				return owners
+		return list(model.targets.keys())
+
+	while True:
+		owners = [v.name for v in model.targets.values() if os.path.normcase(v.source_dir) == os.path.normcase(d)]
+		if len(owners) != 0:
+			return owners
+		parent = os.path.dirname(d)
+		if parent == d or not _is_under(d, model.source_root):
+			return []
+		d = parent
+
+def find_affected(model : CodeModel, changed : "list[str | os.PathLike]",
+	modules : "dict[str, Module] | None" = None) -> Affected :
+	"""
+	Maps changed files to the targets owning them and those depending on them.
+
+	changed : Paths of the changed files, relative ones are relative to the model's source root.
+	modules : Modules of the tree (see find_modules()) to report the affected ones of.
+	"""
+	changed = [os.path.normpath(os.path.join(model.source_root, str(v))) for v in changed]
+	o = Affected(changed)
+
+	owned = set()
+	for v in changed:
+		owned.update(_owning_targets(model, v))
+	o.owned = sorted(owned)
+
+	# Walk the dependency edges backwards
+	affected = set(owned)
+	pending = list(owned)
+	while len(pending) != 0:
+		for v in model.dependents(pending.pop()):
+			if v.name not in affected:
+				affected.add(v.name)
+				pending.append(v.name)
+	o.targets = sorted(affected)
+
+	if modules is not None:
+		names = set()
+		for module in modules.values():
+			if any(v in affected for v in module.targets):
+				names.add(module.name)
+		# The innermost module holding a changed file, nested modules sit under their parent's root
+		for v in changed:
+			holders = [m for m in modules.values() if _is_under(v, m.root)]
+			if len(holders) != 0:
+				names.add(max(holders, key=lambda m: len(m.root)).name)
+		o.modules = sorted(names)
+	return o
+
+
+def find_tests(build_root : "str | pathlib.Path", model : CodeModel, targets : "list[str]",
+	config : "str | None" = None) -> "list[str] | None" :
+	"""
+	Finds the CTest tests running an artifact of one of the targets. Returns None if ctest failed.
+	"""
+	artifacts = set()
+	for v in targets:
+		target = model.targets.get(v)
+		if target is not None:
+			artifacts.update(os.path.normcase(a) for a in target.artifacts)
+
+	command = ["ctest", "--show-only=json-v1"]
+	if config is not None:
+		command.extend(["-C", config])
+	try:
+		result = subprocess.run(command, cwd=str(build_root), capture_output=True, text=True)
+	except FileNotFoundError:
+		hubris.log_error("Missing ctest, please install cmake and ensure it is available on the path")
+		return None
+	if result.returncode != 0:
+		hubris.log_error(result.stderr.strip())
+		return None
+
+	o = []
+	for test in json.loads(result.stdout).get("tests", []):
+		args = [os.path.normcase(os.path.normpath(v)) for v in test.get("command", [])]
+		if any(v in artifacts for v in args):
+			o.append(test["name"])
+	return o
+
+def make_test_regex(tests : "list[str]") -> str :
+	"""
+	Makes a ctest -R expression matching exactly the given test names.
+	"""
+	return "^(" + "|".join(re.escape(v) for v in tests) + ")$"
@@ -0,0 +1,281 @@
+#
+# Content addressed cache of installed build outputs
+#
+# An entry holds the tree `cmake --install` produced for a module, keyed by a hash of
+# the module's sources and everything else that changes the build (compiler, config,
+# definitions, flags). Restoring an entry places its files with reflinks or hardlinks
+# instead of copying them. The least recently used entries are evicted past a size cap.
+# A second cache on a shared directory can back the local one, standing in for a remote.
+#
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+import tempfile
+import time
+
+import hubris
+from hubris.filesystem.link import LinkMode, clone_tree
+
+
+
+_ENTRIES_DIR = "entries"
+_TMP_DIR = "tmp"
+_TREE_DIR = "tree"
+_META_FILE = "meta.json"
+
+# Touched whenever an entry is used, its mtime orders the entries for eviction
+_USED_FILE = "used"
+
+_DEFAULT_CACHE_ENV = "HUBRIS_ARTIFACT_CACHE"
+_DEFAULT_CACHE_PATH = pathlib.Path.home().joinpath(".cache", "hubris", "artifacts")
+
+# Environment variables that change the build outputs without being in the cmake command
+_KEY_ENV_VARS = ("CC", "CXX", "CFLAGS", "CXXFLAGS", "LDFLAGS")
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Hardlinked files are removed before cmake installs over them, see install.break_hardlinks()
+_DEFAULT_RESTORE_MODES = (LinkMode.reflink, LinkMode.hardlink, LinkMode.copy)
+
+# compiler_identity() results by (path, mtime, size) of the compiler
+_compiler_identities : "dict[tuple, str]" = {}
+
+
+def hash_source_tree(source_root : "str | pathlib.Path", exclude : "list[str | pathlib.Path] | None" = None) -> str :
+	"""
+	Hashes the path and contents of every file under source_root. Build/output ("_*")
+	and hidden directories are skipped, the same as for the configure fingerprint.
+
+	exclude : Directories under source_root to skip as well.
+	"""
+	h = hashlib.sha256()
+	source_root = str(source_root)
+	excluded = set(os.path.normcase(os.path.abspath(v)) for v in exclude or [])
+	for root, dirs, files in os.walk(source_root):
+		dirs[:] = sorted(v for v in dirs if not v.startswith("_") and not v.startswith(".")
+			and os.path.normcase(os.path.abspath(os.path.join(root, v))) not in excluded)
+		for v in sorted(files):
+			path = os.path.join(root, v)
+			if os.path.islink(path) or not os.path.isfile(path):
+				continue
+			h.update(os.path.relpath(path, source_root).replace("\\", "/").encode())
+			h.update(b"\0")
+			with open(path, "rb") as f:
+				while True:
+					chunk = f.read(_HASH_CHUNK_SIZE)
+					if len(chunk) == 0:
+						break
+					h.update(chunk)
+			h.update(b"\0")
+	return h.hexdigest()
+
+def compiler_identity(compiler : str, env = None) -> str :
+	"""
+	Identifies a compiler by its resolved path and --version output, so that upgrading it or
+	switching toolchains changes the artifact keys. The compiler is looked up on env's PATH,
+	the version is only asked again once the executable changed.
+	"""
+	env = env or os.environ
+	path = shutil.which(compiler, path=env.get("PATH"))
+	if path is None:
+		return compiler
+	path = os.path.realpath(path)
+	try:
+		st = os.stat(path)
+	except OSError:
+		return path
+	stamp = (path, st.st_mtime_ns, st.st_size)
+	o = _compiler_identities.get(stamp)
+	if o is not None:
+		return o
+	try:
+		# cl takes no --version and prints its banner to stderr instead
+		result = subprocess.run([path, "--version"], capture_output=True, text=True, env=env)
+		version = (result.stdout or result.stderr).strip()
+	except OSError as exc:
+		hubris.log_warn(f"Failed to run {path} --version : {exc}")
+		version = ""
+	o = f"{path}\n{version}"
+	_compiler_identities[stamp] = o
+	return o
+
+def make_artifact_key(source_root : "str | pathlib.Path",
+	compiler : "str | None" = None,
+	config : "str | None" = None,
+	defs : "list | None" = None,
+	generator : "str | None" = None,
+	target_platform : "str | None" = None,
+	env = None,
+	extra : "list[str] | None" = None) -> str :
+	"""
+	Makes the cache key of a module's installed outputs.
+
+	compiler : Name or path of the C++ compiler, identified with compiler_identity().
+		Defaults to $CXX, or c++ as cmake would.
+	extra : Anything else the outputs depend on, ie the keys of the modules it links against.
+	"""
+	env = env or os.environ
+	h = hashlib.sha256()
+	h.update(hash_source_tree(source_root).encode())
+	compiler = compiler or env.get("CXX") or "c++"
+	for v in (compiler_identity(compiler, env), config, generator, target_platform):
+		h.update(f"{v}\n".encode())
+	for v in defs or []:
+		h.update(f"{v}\n".encode())
+	for v in _KEY_ENV_VARS:
+		h.update(f"{v}={env.get(v, '')}\n".encode())
+	for v in extra or []:
+		h.update(f"{v}\n".encode())
+	return h.hexdigest()
+
+
+def _tree_size(path : str) -> int :
+	n = 0
+	for root, dirs, files in os.walk(path):
+		for v in files:
+			n += os.lstat(os.path.join(root, v)).st_size
+	return n
+
+
+class ArtifactCache:
+	"""
+	A directory of cached install trees.
+
+	root : Directory holding the cache, defaults to $HUBRIS_ARTIFACT_CACHE or ~/.cache/hubris/artifacts.
+	max_size : Size cap in bytes, the least recently used entries are evicted past it. None for no cap.
+	shared : Optional cache on a shared directory, looked up on a local miss and written through on store.
+	link_modes : How restored files are placed, see hubris.filesystem.link.clone_file(). Defaults
+		to reflinks, then hardlinks, then copies.
+	"""
+
+	def _entry_path(self, key : str) -> pathlib.Path :
+		return self.root.joinpath(_ENTRIES_DIR, key[:2], key)
+
+	def contains(self, key : str) -> bool :
+		return self._entry_path(key).joinpath(_META_FILE).exists()
+
+	def _touch(self, key : str):
+		path = self._entry_path(key).joinpath(_USED_FILE)
+		try:
+			path.touch()
+		except OSError:
+			pass
+
+	def store(self, key : str, tree : "str | pathlib.Path", meta : "dict | None" = None) -> bool :
+		"""
+		Stores a copy of tree under key. The entry only appears once it is complete,
+		so readers sharing the cache never see a partial one.
+		"""
+		if self.contains(key):
+			self._touch(key)
+			return True
+
+		tmp_root = self.root.joinpath(_TMP_DIR)
+		os.makedirs(tmp_root, exist_ok=True)
+		tmp = tempfile.mkdtemp(prefix=key[:8] + "-", dir=tmp_root)
+		try:
+			# Copied, a link would let later writes to the install tree change the entry
+			clone_tree(tree, os.path.join(tmp, _TREE_DIR), modes=(LinkMode.reflink, LinkMode.copy))
+			data = dict(meta or {})
+			data["key"] = key
+			data["size"] = _tree_size(tmp)
+			data["created"] = time.time()
+			pathlib.Path(tmp).joinpath(_META_FILE).write_text(json.dumps(data, indent=4))
+			pathlib.Path(tmp).joinpath(_USED_FILE).touch()
+
+			entry = self._entry_path(key)
+			os.makedirs(entry.parent, exist_ok=True)
+			try:
+				os.rename(tmp, entry)
+			except OSError:
+				# Stored by someone else in the meantime
+				if not self.contains(key):
+					raise
+		except OSError as exc:
+			hubris.log_warn(f"Failed to store {key} in the artifact cache {str(self.root)} : {exc}")
+			return False
+		finally:
+			if os.path.exists(tmp):
+				shutil.rmtree(tmp, ignore_errors=True)
+
+		if self.shared is not None:
+			self.shared.store(key, tree, meta)
+		self.evict()
+		return True
+
+	def restore(self, key : str, dst : "str | pathlib.Path") -> bool :
+		"""
+		Places the files of the entry under key into dst, replacing files that exist.
+		Returns False on a miss.
+		"""
+		if not self.contains(key):
+			if self.shared is None or not self.shared.contains(key):
+				return False
+			# Pulled into the local cache first so the restore below can link instead of copy
+			hubris.log_info(f"Fetching {key[:12]} from the shared artifact cache {str(self.shared.root)}")
+			if not self.store(key, self.shared._entry_path(key).joinpath(_TREE_DIR), self.shared.meta(key)):
+				return False
+			self.shared._touch(key)
+
+		counts = clone_tree(self._entry_path(key).joinpath(_TREE_DIR), dst, modes=self.link_modes)
+		self._touch(key)
+		hubris.log_debug(f"Restored {key[:12]} to {str(dst)} : {counts}")
+		return True
+
+	def meta(self, key : str) -> "dict | None" :
+		try:
+			return json.loads(self._entry_path(key).joinpath(_META_FILE).read_text())
+		except (OSError, ValueError):
+			return None
+
+	def entries(self) -> "list[tuple[str, int, float]]" :
+		"""
+		Lists (key, size, last used) of every entry.
+		"""
+		o = []
+		entries_dir = self.root.joinpath(_ENTRIES_DIR)
+		if not entries_dir.exists():
+			return o
+		for prefix in entries_dir.iterdir():
+			for entry in prefix.iterdir():
+				meta = self.meta(entry.name)
+				if meta is None:
+					continue
+				try:
+					used = entry.joinpath(_USED_FILE).stat().st_mtime
+				except OSError:
+					used = meta.get("created", 0.0)
+				o.append((entry.name, int(meta.get("size", 0)), used))
+		return o
+
+	def evict(self):
+		"""
+		Removes the least recently used entries until the cache fits in max_size.
+		"""
+		if self.max_size is None:
+			return
+		entries = self.entries()
+		total = sum(v[1] for v in entries)
+		if total <= self.max_size:
+			return
+		entries.sort(key=lambda v: v[2])
+		for key, size, _ in entries:
+			if total <= self.max_size:
+				break
+			hubris.log_debug(f"Evicting {key[:12]} from the artifact cache")
+			shutil.rmtree(self._entry_path(key), ignore_errors=True)
+			total -= size
+
+	def __init__(self,
+		root : "str | pathlib.Path | None" = None,
+		max_size : "int | None" = None,
+		shared : "ArtifactCache | None" = None,
+		link_modes : "tuple[str, ...]" = _DEFAULT_RESTORE_MODES):
+		self.root = pathlib.Path(root or os.getenv(_DEFAULT_CACHE_ENV) or _DEFAULT_CACHE_PATH)
+		self.max_size = max_size
+		self.shared = shared
+		self.link_modes = link_modes
@@ -0,0 +1,211 @@
+#
+# Streaming build output parsing
+#
+# Build output is tee'd to a log file and parsed a line at a time as the build produces
+# it, so diagnostics are reported as soon as they occur and the log is never read back.
+#
+
+import collections
+import re
+import subprocess
+
+import hubris
+
+
+
+class DiagnosticSeverity:
+	fatal="fatal error"
+	error="error"
+	warning="warning"
+	note="note"
+
+_ERROR_SEVERITIES = (DiagnosticSeverity.fatal, DiagnosticSeverity.error)
+
+
+class Diagnostic:
+	"""
+	A single compiler, linker or build tool message parsed from build output.
+	line and col are None when the tool didn't report them, file is None for messages
+	that aren't about a file (ie "clang: error: linker command failed").
+	"""
+	__slots__ = ("file", "line", "col", "severity", "message")
+
+	def is_error(self) -> bool :
+		return self.severity in _ERROR_SEVERITIES
+
+	def __str__(self) -> str :
+		location = self.file or ""
+		if self.line is not None:
+			location += f":{self.line}"
+			if self.col is not None:
+				location += f":{self.col}"
+		if len(location) != 0:
+			return f"{location}: {self.severity}: {self.message}"
+		return f"{self.severity}: {self.message}"
+
+	def __repr__(self) -> str :
+		return f"Diagnostic({self.file!r}, {self.line!r}, {self.col!r}, {self.severity!r}, {self.message!r})"
+
+	def __init__(self, file : "str | None", line : "int | None", col : "int | None", severity : str, message : str):
+		self.file = file
+		self.line = line
+		self.col = col
+		self.severity = severity
+		self.message = message
+
+
+# clang/gcc : "path/file.cpp:12:5: error: message", the column is optional
+_GNU_DIAGNOSTIC_REGEX = re.compile(
+	r"^(?P<file>.+?):(?P<line>\d+):(?:(?P<col>\d+):)?\s*(?P<severity>fatal error|error|warning|note):\s*(?P<message>.*)$")
+
+# MSVC : "path\file.cpp(12,5): error C2065: message", the column and code are optional
+_MSVC_DIAGNOSTIC_REGEX = re.compile(
+	r"^(?P<file>.+?)\((?P<line>\d+)(?:,(?P<col>\d+))?\)\s*:\s*(?P<severity>fatal error|error|warning|note)\s*(?P<code>[A-Z]+\d+)?\s*:\s*(?P<message>.*)$")
+
+# Tool level messages without a location, ie "clang: error: ..." or "LINK : fatal error LNK1104: ..."
+_TOOL_DIAGNOSTIC_REGEX = re.compile(
+	r"^(?P<tool>[\w.+-]+)\s*:\s*(?P<severity>fatal error|error|warning)\s*(?P<code>[A-Z]+\d+)?\s*:\s*(?P<message>.*)$")
+
+# ninja : "FAILED: CMakeFiles/target.dir/file.cpp.o", ninja 1.13 adds the exit code as "FAILED: [code=1] ..."
+_NINJA_FAILED_REGEX = re.compile(r"^FAILED: (?:\[code=\d+\] )?(?P<target>.*)$")
+
+# msbuild appends the project to every message, ie " [C:\build\target.vcxproj]"
+_MSBUILD_PROJECT_SUFFIX_REGEX = re.compile(r"\s+\[[^\]]+\.(?:vcxproj|csproj|proj)\]$")
+
+
+def _int_or_none(value : "str | None") -> "int | None" :
+	if value is None:
+		return None
+	return int(value)
+
+def parse_diagnostic(line : str) -> "Diagnostic | None" :
+	"""
+	Parses a single line of clang, gcc, MSVC or ninja output.
+	Returns None if the line isn't a diagnostic.
+	"""
+	line = _MSBUILD_PROJECT_SUFFIX_REGEX.sub("", line.strip())
+	if len(line) == 0:
+		return None
+
+	match = _NINJA_FAILED_REGEX.match(line)
+	if match:
+		return Diagnostic(match.group("target"), None, None, DiagnosticSeverity.error, line)
+
+	match = _GNU_DIAGNOSTIC_REGEX.match(line) or _MSVC_DIAGNOSTIC_REGEX.match(line)
+	if match:
+		message = match.group("message")
+		code = match.groupdict().get("code")
+		if code is not None:
+			message = f"{code}: {message}"
+		return Diagnostic(
+			match.group("file"),
+			int(match.group("line")),
+			_int_or_none(match.group("col")),
+			match.group("severity"),
+			message)
+
+	match = _TOOL_DIAGNOSTIC_REGEX.match(line)
+	if match:
+		message = match.group("message")
+		if match.group("code") is not None:
+			message = f"{match.group('code')}: {message}"
+		return Diagnostic(None, None, None, match.group("severity"), f"{match.group('tool')}: {message}")
+
+	return None
+
+
+# Number of output lines retained for logging once a failed build finishes
+_DEFAULT_MAX_RETAINED_LINES = 200
+
+
+class BuildLog:
+	"""
+	Result of run_build().
+
+	diagnostics : Every diagnostic parsed from the output, in order.
+	tail : The last few output lines, without warnings and their context if hide_warnings was set.
+	returncode : Exit code of the build command.
+	compiler_cache_stats : Hits and misses of the compiler cache, set by CMake.build() when one is configured.
+	report : Timing report of the build, set by CMake.build() for Ninja builds.
+
+	True when the build succeeded, see succeeded().
+	"""
+
+	@property
+	def errors(self) -> "list[Diagnostic]" :
+		return [v for v in self.diagnostics if v.is_error()]
+
+	@property
+	def warnings(self) -> "list[Diagnostic]" :
+		return [v for v in self.diagnostics if v.severity == DiagnosticSeverity.warning]
+
+	def succeeded(self) -> bool :
+		"""
+		True if the build exited cleanly and reported no errors, ninja may exit
+		with 0 after a "FAILED:" when asked to keep going.
+		"""
+		return self.returncode == 0 and len(self.errors) == 0
+
+	def __bool__(self) -> bool :
+		return self.succeeded()
+
+	def __init__(self, max_retained_lines : int):
+		self.diagnostics : "list[Diagnostic]" = []
+		self.tail : "collections.deque[str]" = collections.deque(maxlen=max_retained_lines)
+		self.returncode : "int | None" = None
+		self.compiler_cache_stats = None
+		self.report = None
+
+
+def run_build(command : "list[str]",
+	log_file_path,
+	hide_warnings : bool = True,
+	on_diagnostic = None,
+	max_retained_lines : int = _DEFAULT_MAX_RETAINED_LINES,
+	env = None) -> BuildLog :
+	"""
+	Runs a build command, writing its combined stdout and stderr to log_file_path while
+	parsing it line by line. Errors are logged as soon as they are seen, warnings too
+	unless hide_warnings is set.
+
+	on_diagnostic : Optional callable invoked with each Diagnostic as it is parsed.
+	"""
+	result = BuildLog(max_retained_lines)
+
+	# Lines following a warning are its context (source excerpt, notes) until the next diagnostic
+	in_warning = False
+
+	with open(log_file_path, "w", encoding="utf-8", errors="replace") as log_file:
+		proc = subprocess.Popen(
+			command,
+			stdin=subprocess.DEVNULL,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT,
+			env=env)
+
+		for raw in proc.stdout:
+			line = raw.decode(errors="replace").rstrip("\r\n")
+			log_file.write(line)
+			log_file.write("\n")
+
+			diagnostic = parse_diagnostic(line)
+			if diagnostic is not None:
+				result.diagnostics.append(diagnostic)
+				if on_diagnostic is not None:
+					on_diagnostic(diagnostic)
+
+				if diagnostic.is_error():
+					in_warning = False
+					hubris.log_error(str(diagnostic))
+				elif diagnostic.severity == DiagnosticSeverity.warning:
+					in_warning = True
+					if not hide_warnings:
+						hubris.log_warn(str(diagnostic))
+
+			if not (hide_warnings and in_warning):
+				result.tail.append(line)
+
+		proc.stdout.close()
+		result.returncode = proc.wait()
+
+	return result
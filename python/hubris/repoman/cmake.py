@@ -1,13 +1,34 @@
+import hashlib
+import json
 import os
 import pathlib
-import re
+import shutil
 import subprocess
+import sys
+import typing
 import hubris
 
+from .buildlog import run_build
+from . import compiler_cache as _compiler_cache
+from .compiler_cache import CompilerCacheConfig
+from .telemetry import NINJA_LOG_FILE, BuildReport, make_build_report, read_ninja_log_entries
+from .unity import UnityBuild, exclude_failures, revert_failures
+from .pch import PrecompiledHeaders
+from .artifact_cache import make_artifact_key
+from .install import STAGE_DIR, break_hardlinks, manifest_path, sync_tree
+from .fileapi import read_codemodel, write_query
+from .affected import find_affected, find_tests, make_test_regex
+from hubris.filesystem.link import DEFAULT_LINK_MODES
+import hubris.git
+from hubris.distbuild import WORKERS_ENV, WorkerPool
+
+if typing.TYPE_CHECKING:
+	from .buildlog import BuildLog
+	from .compiler_cache import CompilerCache
+	from .artifact_cache import ArtifactCache
+	from .fileapi import CodeModel
+	from .affected import Affected
 
-_CLANG_WARNING_REGEX = re.compile("warning:")
-_CMAKE_FAILED_REGEX = re.compile("FAILED:")
-	
 
 class CMakeLogLevel:
 	warning="WARNING"
@@ -84,6 +105,107 @@ def _make_cmake_generate_command(
 	
 	return command
 
+# Written to the build root after a successful configure, see _make_configure_fingerprint()
+_CONFIGURE_FINGERPRINT_FILE = "hubris_configure.fingerprint"
+
+# Environment variables that change the result of a configure
+_CONFIGURE_ENV_VARS = [
+	"CC",
+	"CXX",
+	"CFLAGS",
+	"CXXFLAGS",
+	"LDFLAGS",
+	"CMAKE_PREFIX_PATH",
+	"CMAKE_GENERATOR",
+	"CMAKE_TOOLCHAIN_FILE",
+	"PKG_CONFIG_PATH",
+	"PATH",
+]
+
+def _is_cmake_input(name : str) -> bool :
+	return name == "CMakeLists.txt" or name.endswith(".cmake")
+
+def _find_cmake_inputs(source_root : pathlib.Path, build_root : pathlib.Path) -> "list[tuple[str, int, int]]" :
+	"""
+	Lists (path, mtime, size) of every CMakeLists.txt and .cmake file under the source root.
+	Build/output directories ("_*/" by convention), hidden directories and the build root are skipped.
+	"""
+	o = []
+	build_root = str(build_root)
+	for root, dirs, files in os.walk(source_root):
+		dirs[:] = [v for v in dirs
+			if not v.startswith("_") and not v.startswith(".") and os.path.join(root, v) != build_root]
+		for v in files:
+			if _is_cmake_input(v):
+				path = os.path.join(root, v)
+				st = os.stat(path)
+				o.append((os.path.relpath(path, source_root), st.st_mtime_ns, st.st_size))
+	o.sort()
+	return o
+
+def _make_configure_fingerprint(command : "list[str]", env, source_root : pathlib.Path, build_root : pathlib.Path,
+	generated : "list[str] | None" = None) -> str :
+	"""
+	Hashes everything a configure depends on, the full cmake command (definitions, compiler,
+	generator and platform), the relevant environment and the cmake files of the source tree.
+	generated : Contents of files written to the build root for the configure to read.
+	"""
+	h = hashlib.sha256()
+	h.update(repr(command).encode())
+	for v in generated or []:
+		h.update(v.encode())
+	for v in _CONFIGURE_ENV_VARS:
+		h.update(f"{v}={env.get(v, '')}\n".encode())
+	for v in _find_cmake_inputs(source_root, build_root):
+		h.update(repr(v).encode())
+	return h.hexdigest()
+
+def _read_configure_fingerprint(build_root : pathlib.Path) -> "str | None" :
+	try:
+		return build_root.joinpath(_CONFIGURE_FINGERPRINT_FILE).read_text().strip()
+	except OSError:
+		return None
+
+# Written to the build root after a successful configure, the cache variables hubris set itself
+_OWNED_DEFS_FILE = "hubris_defs.json"
+
+# Set by hubris unless the caller defines them, without any option asking for it
+_DEFAULT_OWNED_DEFS = ("CMAKE_EXPORT_COMPILE_COMMANDS",)
+
+_LAUNCHER_DEFS = ("CMAKE_C_COMPILER_LAUNCHER", "CMAKE_CXX_COMPILER_LAUNCHER")
+
+def _def_name(definition : "CMakeDef | str") -> "str | None" :
+	"""
+	Gets the variable name of a CMakeDef or a "-DNAME[:TYPE]=VALUE" / "-UNAME" argument.
+	"""
+	if isinstance(definition, CMakeDef):
+		return definition.name
+	definition = str(definition)
+	if definition.startswith("-D"):
+		return definition[2:].split("=", 1)[0].split(":", 1)[0]
+	if definition.startswith("-U"):
+		return definition[2:]
+	return None
+
+def _read_owned_defs(build_root : pathlib.Path) -> "list[str]" :
+	try:
+		return json.loads(build_root.joinpath(_OWNED_DEFS_FILE).read_text())
+	except (OSError, ValueError):
+		return []
+
+def _is_unity_configured(build_root : pathlib.Path) -> bool :
+	"""
+	Checks the CMake cache of a build root for CMAKE_UNITY_BUILD being on.
+	"""
+	try:
+		with open(build_root.joinpath("CMakeCache.txt"), "r", errors="replace") as f:
+			for line in f:
+				if line.startswith("CMAKE_UNITY_BUILD:"):
+					return line.split("=", 1)[-1].strip().upper() in ("ON", "TRUE", "1", "YES")
+	except OSError:
+		pass
+	return False
+
 def does_generator_support_platform_option(generator : str):
 	if generator == "Ninja":
 		return False
@@ -94,6 +216,13 @@ def does_generator_support_platform_option(generator : str):
 
 class CMake:
 
+	@property
+	def repo_root(self) -> pathlib.Path :
+		"""
+		Root of the repository, relative build and source roots are resolved against it.
+		"""
+		return self._repo_root
+
 	def generate(self,
 		defs : "list[CMakeDef]" = None,
 		build_root : "pathlib.Path" = "_build",
@@ -101,14 +230,31 @@ class CMake:
 		compiler : Compiler = None,
 		env = None,
 		generator : str | None = None,
-		target_platform : str | None = None):	
+		target_platform : str | None = None,
+		force : bool = False,
+		compiler_cache : "CompilerCache | None" = None,
+		compiler_cache_dir : "pathlib.Path | str | None" = None,
+		compiler_cache_size : "str | None" = None,
+		unity : "UnityBuild | bool | None" = None,
+		pch : "PrecompiledHeaders | bool | None" = None,
+		distributed : bool = False):	
 		"""
 		defs : Additional definitions to give to cmake.
 		build_root : Path to the build directory root relative to the repository root dir. 
+		force : Configure even if nothing changed since the last successful configure.
+		compiler_cache : Compile through ccache or sccache, CompilerCache.auto uses whichever is installed.
+		compiler_cache_dir : Cache directory, defaults to "<build_root>-cache" next to the build root.
+		compiler_cache_size : Maximum cache size, ie "5G", defaults to the cache's own default.
+		unity : Build with CMAKE_UNITY_BUILD, True uses the default batch size. Exclusions found by
+			earlier builds of the build root are kept, see generate_and_build().
+		pch : Precompile the system and dependency headers most of each target's sources include,
+			True uses the default threshold. The selection is remeasured on every generate.
+		distributed : Launch the compilers through hubris.distbuild so build() can hand compiles
+			to workers, see build(). Not combined with a compiler cache.
 		"""
 
-		if defs is None:
-			defs = []
+		# Copied as compiler and platform arguments are appended below
+		defs = list(defs or [])
 
 		build_root = pathlib.Path(build_root)
 		source_root = pathlib.Path(source_root)
@@ -120,8 +266,9 @@ class CMake:
 		else:
 			compiler = None
 
-		# Create our custom environment
-		_env = env or os.environ
+		# Create our custom environment, copied so the compiler set below doesn't leak into
+		# the caller's environment or into other configures running at the same time
+		_env = dict(env or os.environ)
 
 		if not build_root.is_absolute():
 			build_root = self._repo_root.joinpath(build_root).resolve()
@@ -148,6 +295,85 @@ class CMake:
 			else:
 				cmake_generate_extra_args.extend([f'-DCMAKE_CXX_FLAGS="--target={target_platform}-unknown-unknown"'])
 
+		# Cache variables hubris sets, a definition given by the caller always wins over them
+		user_defs = set(v for v in (_def_name(d) for d in defs) if v is not None)
+		owned_defs = []
+
+		if any(v in user_defs for v in _LAUNCHER_DEFS) and (compiler_cache is not None or distributed):
+			hubris.log_warn("A compiler launcher was given in defs, compiling without the compiler cache or workers")
+			compiler_cache = None
+			distributed = False
+
+		# If a compiler cache was requested, launch the compilers through it
+		cache_config = None
+		if compiler_cache is not None:
+			found = _compiler_cache.find_compiler_cache(compiler_cache)
+			if found is None:
+				hubris.log_warn(f"Compiler cache {compiler_cache} was requested but isn't installed, building without it")
+			else:
+				cache_dir = pathlib.Path(compiler_cache_dir or build_root.with_name(build_root.name + "-cache"))
+				if not cache_dir.is_absolute():
+					cache_dir = self._repo_root.joinpath(cache_dir).resolve()
+				cache_config = CompilerCacheConfig(found[0], found[1], cache_dir, compiler_cache_size)
+				owned_defs.extend(cache_config.make_defs())
+				hubris.log_debug(f"Using {found[0]} with cache directory {str(cache_dir)}")
+		if cache_config is None and distributed:
+			# Compiles run locally unless the build is given workers
+			python_root = os.path.dirname(os.path.dirname(os.path.abspath(hubris.__file__)))
+			launcher = ";".join([shutil.which("cmake") or "cmake", "-E", "env", f"PYTHONPATH={python_root}",
+				sys.executable, "-m", "hubris.distbuild"])
+			owned_defs.extend([f"-D{v}={launcher}" for v in _LAUNCHER_DEFS])
+		elif distributed:
+			hubris.log_warn("Distributed compiles aren't combined with a compiler cache, compiling locally")
+
+		# Compile commands, read by hubris.distbuild.read_compile_commands() and editors
+		owned_defs.append("-DCMAKE_EXPORT_COMPILE_COMMANDS=ON")
+
+		# Unity builds, the settings are applied by a script written to the build root
+		generated = []
+		if unity:
+			if unity is True:
+				unity = UnityBuild()
+			if not build_root.exists():
+				os.makedirs(build_root)
+			previous = UnityBuild.load(build_root)
+			if previous is not None:
+				unity.merge(previous)
+			if not _is_unity_configured(build_root):
+				unity.baseline_time = self._read_report_total_time(build_root) or unity.baseline_time
+			owned_defs.extend(unity.make_defs(build_root))
+			generated.append(unity.make_script())
+
+		# Precompiled headers, the pch.hpp files are rewritten here when the selection changes
+		if pch:
+			if pch is True:
+				pch = PrecompiledHeaders()
+			if not build_root.exists():
+				os.makedirs(build_root)
+			# The code model of the last configure knows every target's sources and include directories
+			pch.update(source_root, build_root, model=read_codemodel(build_root))
+			owned_defs.extend(pch.make_defs(build_root))
+			generated.append(pch.make_script(build_root))
+
+		# Ask for the code model so the targets can be read back without running cmake again
+		if not build_root.exists():
+			os.makedirs(build_root)
+		generated.append(write_query(build_root))
+
+		# What hubris set last time and no longer wants is removed from the cache, ie a launcher
+		# or CMAKE_UNITY_BUILD, anything else in the cache was put there by someone else
+		owned = {}
+		for v in owned_defs:
+			name = _def_name(v)
+			if name in user_defs:
+				if name not in _DEFAULT_OWNED_DEFS:
+					hubris.log_warn(f"{name} was given in defs, hubris' own value isn't applied")
+				continue
+			owned[name] = v
+		cmake_generate_extra_args.extend(owned.values())
+		cmake_generate_extra_args.extend([f"-U{v}" for v in _read_owned_defs(build_root)
+			if v not in owned and v not in user_defs])
+
 		defs.extend(cmake_generate_extra_args)
 		cmake_generate_command = _make_cmake_generate_command(
 			defs,
@@ -158,6 +384,14 @@ class CMake:
 		)
 		hubris.log_debug(f"{cmake_generate_command}")
 
+		# Skip configuring if none of its inputs changed since the last time it succeeded
+		fingerprint = _make_configure_fingerprint(cmake_generate_command, _env, source_root, build_root, generated)
+		fingerprint_path = build_root.joinpath(_CONFIGURE_FINGERPRINT_FILE)
+		if not force and build_root.joinpath("CMakeCache.txt").exists() and \
+			_read_configure_fingerprint(build_root) == fingerprint:
+			hubris.log_info("CMake configuration is up to date, skipping generate")
+			return True
+
 		try:
 			result = subprocess.run(cmake_generate_command, env=_env)
 		except FileNotFoundError as exc:
@@ -165,8 +399,20 @@ class CMake:
 			exit(1)
 
 		if result.returncode == 0:
+			fingerprint_path.write_text(fingerprint)
+			build_root.joinpath(_OWNED_DEFS_FILE).write_text(json.dumps(sorted(owned.keys())))
+			if cache_config is not None:
+				cache_config.save(build_root)
+			else:
+				CompilerCacheConfig.remove(build_root)
+			if unity:
+				unity.save(build_root)
+			# Parsed and pickled now so the tools reading it later load it at once
+			read_codemodel(build_root)
 			return True
 		else:
+			if fingerprint_path.exists():
+				os.remove(fingerprint_path)
 			return False
 
 	def build(self,
@@ -177,7 +423,35 @@ class CMake:
 		hide_warnings : bool = True,
 		compiler : Compiler = None,
 		target_platform : str | None = None,
-		generator : str | None = None):
+		generator : str | None = None,
+		env = None,
+		on_diagnostic = None,
+		report : bool = True,
+		time_trace : bool = False,
+		critical_path : bool = False,
+		targets : "list[str] | None" = None,
+		workers : "list[str] | None" = None,
+		keep_going : bool = False) -> "BuildLog" :
+		"""
+		env : Environment to run the build with, defaults to the current one.
+		targets : Only build these targets (and what they depend on), defaults to all.
+		keep_going : Keep building what doesn't depend on a failed step, so every failure is reported.
+			Ninja and make stop at the first one otherwise, Visual Studio always keeps going.
+		workers : Addresses of hubris.distbuild workers to compile on, the build root must have been
+			generated with distributed=True. The jobs are raised by the slots of the reachable ones,
+			compiles that no worker takes run locally.
+		report : Write a timing report of the build, see _write_build_report().
+		time_trace : Add header parse times from clang's -ftime-trace output to the report,
+			the project has to be compiled with -ftime-trace.
+		critical_path : Add the critical path of the build to the report, reading the build graph
+			back from ninja takes about as long as a no-op build.
+		hide_warnings : Don't log warnings, or their context in the output shown on failure.
+		on_diagnostic : Optional callable invoked with each Diagnostic as soon as the build reports it.
+		
+		Returns the BuildLog of the build, True if it succeeded. It holds the diagnostics, the hits
+		and misses of the compiler cache configured by generate() and the timing report. Nothing
+		is kept on the instance, builds of other variants may be running on it at the same time.
+		"""
 
 		build_root = pathlib.Path(build_root)
 
@@ -197,7 +471,7 @@ class CMake:
 		cmake_build_command = [
 			"cmake",
 			"--build",
-			f'"{str(build_root.resolve())}"',
+			str(build_root.resolve()),
 		]
 	
 		# Set the config if one was specified.
@@ -207,10 +481,26 @@ class CMake:
 				config
 			])
 
+		# Build only the given targets if specified.
+		if targets is not None:
+			cmake_build_command.append("--target")
+			cmake_build_command.extend(targets)
+
 		# If clean_first was specified, add it to the command.
 		if clean_first:
 			cmake_build_command.append("--clean-first")
 
+		# Hand the compiles to the reachable workers through the launcher set by generate()
+		if workers is not None:
+			slots = WorkerPool(workers).probe()
+			if len(slots) == 0:
+				hubris.log_warn("None of the compile workers are reachable, compiling locally")
+			else:
+				env = dict(env or os.environ)
+				env[WORKERS_ENV] = ",".join(slots)
+				jobs = (jobs or os.cpu_count() or 1) + sum(slots.values())
+				hubris.log_info(f"Compiling on {len(slots)} worker(s) with {sum(slots.values())} slot(s)")
+
 		# Set the job count if specified.
 		if jobs is not None:
 			cmake_build_command.extend([
@@ -218,64 +508,135 @@ class CMake:
 				str(jobs)
 			])
 
-
-
-		# Run cmake build and redirect output to a file
-		log_file = open(log_file_path, "w")
-		print(" ".join(cmake_build_command))
-		result = subprocess.run(" ".join(cmake_build_command), stdout=log_file)
-		log_file.close()
-
-		# Read in the logged information
-		log_file_data = open(log_file_path, "r").read()
-		warning_match = _CLANG_WARNING_REGEX.search(log_file_data)
-		if warning_match:
-			for warning in warning_match.groups():
-				hubris.log_warn(warning)
+		# Options of the native build tool go last
+		if keep_going:
+			if generator.startswith("Ninja"):
+				cmake_build_command.extend(["--", "-k", "0"])
+			elif generator.endswith("Makefiles"):
+				cmake_build_command.extend(["--", "-k"])
 
 
 
-		if result.returncode == 0:
+		# The log's entries from before tell the steps of this build apart
+		ninja_log = None
+		if report:
+			try:
+				ninja_log = read_ninja_log_entries(build_root.joinpath(NINJA_LOG_FILE))
+			except (OSError, ValueError) as exc:
+				hubris.log_warn(f"Failed to read {str(build_root.joinpath(NINJA_LOG_FILE))} : {exc}")
 
-			# Check log file for errors
-			failed_match = _CMAKE_FAILED_REGEX.search(log_file_data)
-			if failed_match:
-				hubris.log_error("Failed to build the CMake project")
-				hubris.log_error(log_file_data)
-				return False
+		# Count only this build's compiler cache hits and misses, the cache's own counters are
+		# shared with other builds using it so they're compared rather than zeroed
+		cache_config = CompilerCacheConfig.load(build_root)
+		cache_stats = None
+		if cache_config is not None:
+			cache_stats = _compiler_cache.read_stats(cache_config)
 
-			return True
-		else:
-			log_file_data = open(log_file_path, "r").read()
-			hubris.log_error("Failed to build the CMake project")
-
-			if hide_warnings:
-				msg_lines = []
-				ignoring = False
-				for line in log_file_data.splitlines(False):
-					if line.count(" warning: ") != 0:
-						ignoring = True
-					else:
-						if line.count("error") != 0:
-							ignoring = False
-						if not ignoring:
-							msg_lines.append(line)
-				msg = "\n".join(msg_lines)
-				hubris.log_error(msg)
+		# Run cmake build, output is tee'd to the log file and parsed as it arrives
+		hubris.log_info(" ".join(cmake_build_command))
+		try:
+			build_log = run_build(cmake_build_command, log_file_path,
+				hide_warnings=hide_warnings,
+				on_diagnostic=on_diagnostic,
+				env=env)
+		except FileNotFoundError as exc:
+			hubris.log_error("Missing cmake, please install it and ensure it is available on the path")
+			exit(1)
+		if cache_stats is not None:
+			after = _compiler_cache.read_stats(cache_config)
+			if after is not None:
+				build_log.compiler_cache_stats = after - cache_stats
+			if build_log.compiler_cache_stats is not None:
+				hubris.log_info(f"{cache_config.kind} : {str(build_log.compiler_cache_stats)}")
+
+		if report:
+			build_log.report = self._write_build_report(build_root, jobs, time_trace, critical_path, ninja_log)
+			if build_log.report is not None and _is_unity_configured(build_root):
+				self._log_unity_delta(build_root, build_log.report)
+
+		warnings = build_log.warnings
+		if len(warnings) != 0:
+			hubris.log_info(f"Build produced {len(warnings)} warning(s), see {str(log_file_path)}")
+
+		if build_log.succeeded():
+			return build_log
+
+		hubris.log_error("Failed to build the CMake project")
+		if len(build_log.tail) != 0:
+			hubris.log_error("\n".join(build_log.tail))
+		hubris.log_error(f"Full build output written to {str(log_file_path)}")
+		return build_log
+
+	def _write_build_report(self, build_root : pathlib.Path, jobs : "int | None", time_trace : bool,
+		critical_path : bool, before : "dict | None") -> "BuildReport | None" :
+		"""
+		Reads the timing of the build from .ninja_log and writes it to the build root as
+		build_report.json, and as build_trace.json for chrome://tracing or Perfetto.
+		Only Ninja builds have a .ninja_log, None is returned for other generators.
+		"""
+		build_report = make_build_report(build_root, jobs=jobs or os.cpu_count(), time_trace=time_trace,
+			critical_path=critical_path, before=before)
+		if build_report is None:
+			return None
+
+		build_report.write_json(build_root.joinpath("build_report.json"))
+		build_report.write_chrome_trace(build_root.joinpath("build_trace.json"))
+
+		summary = f"Built {len(build_report.edges)} step(s) in {build_report.wall_time / 1000.0:.2f}s"
+		if build_report.critical_path is not None:
+			summary += f", critical path {build_report.critical_path / 1000.0:.2f}s"
+		summary += f", {build_report.parallelism:.1f} jobs busy on average"
+		hubris.log_info(summary)
+		for v in build_report.slowest_units(5):
+			hubris.log_debug(f"{v.duration / 1000.0:.2f}s {v.source} ({v.target})")
+		return build_report
+
+	def _read_report_total_time(self, build_root : pathlib.Path) -> "int | None" :
+		try:
+			return json.loads(build_root.joinpath("build_report.json").read_text())["total_time"]
+		except (OSError, ValueError, KeyError):
+			return None
 
-			else:
-				hubris.log_error(log_file_data)
-			return False
+	def _log_unity_delta(self, build_root : pathlib.Path, build_report : BuildReport):
+		"""
+		Compares the time spent in build steps with the last build before unity was enabled.
+		Only meaningful when both were full builds.
+		"""
+		unity = UnityBuild.load(build_root)
+		if unity is None or not unity.baseline_time:
+			return
+		delta = build_report.total_time - unity.baseline_time
+		hubris.log_info(f"Unity build step time {build_report.total_time / 1000.0:.2f}s, "
+			f"{delta / 1000.0:+.2f}s ({delta * 100.0 / unity.baseline_time:+.1f}%) from {unity.baseline_time / 1000.0:.2f}s without unity")
 
 	def install(self,
 		build_root : "pathlib.Path | str" = "_build",
 		install_prefix : "pathlib.Path | str" = "_install",
 		component : "str | None" = None,
-		config : "str | None" = None):
+		config : "str | None" = None,
+		incremental : bool = False,
+		link_modes : "tuple[str, ...]" = DEFAULT_LINK_MODES):
+		"""
+		incremental : Install to a staging directory in the build root and only place the files
+			that changed since the last install in the prefix, with reflinks or hardlinks where
+			the filesystem allows (see link_modes). A manifest is kept in the prefix for the next one.
+		link_modes : How changed files are placed in the prefix, see hubris.filesystem.clone_file().
+		"""
 
 		build_root = pathlib.Path(build_root)
 		install_prefix = pathlib.Path(install_prefix)
 
+		# Ensure the build root exists
+		if not build_root.exists():
+			os.makedirs(build_root)
+		log_file_path = build_root.joinpath("install_log.txt")
+
+		target_prefix = install_prefix.resolve()
+		if incremental:
+			install_prefix = build_root.joinpath(STAGE_DIR)
+		else:
+			break_hardlinks(build_root, target_prefix)
+
 		cmake_install_command = [
 			"cmake",
 			"--install",
@@ -298,26 +659,240 @@ class CMake:
 				config
 			])
 
-		# Ensure the build root exists
-		if not build_root.exists():
-			os.makedirs(build_root)
-		log_file_path = build_root.joinpath("install_log.txt")
+		# Output is written to the log file as it arrives, only its tail is kept for reporting
+		install_log = run_build(cmake_install_command, log_file_path, hide_warnings=False)
+		log_output = "\n".join(install_log.tail)
+		if install_log.returncode != 0:
+			hubris.log_error(log_output)
+			return False
+		hubris.log_debug(log_output)
+
+		if incremental:
+			stats = sync_tree(install_prefix, target_prefix, manifest_path(target_prefix, build_root.resolve()), link_modes)
+			hubris.log_info(f"Installed to {str(target_prefix)} : {str(stats)}")
+		return True
+
+	def build_and_install(self,
+		artifact_cache : "ArtifactCache | None" = None,
+		install_prefix : "pathlib.Path | str" = "_install",
+		component : "str | None" = None,
+		defs : "list[CMakeDef] | None" = None,
+		build_root : "pathlib.Path" = "_build",
+		source_root : "pathlib.Path" = ".",
+		compiler : Compiler = Compiler.clang,
+		env = None,
+		generator : str | None = None,
+		target_platform : str | None = None,
+		config : "str | None" = None,
+		artifact_key_extra : "list[str] | None" = None,
+		**build_args):
+		"""
+		Builds and installs the module, or restores its install outputs from artifact_cache
+		when the sources, compiler, config and definitions match a cached build.
 
-		with open(log_file_path, "w") as logfile:
-			result = subprocess.run(cmake_install_command, stdout=logfile)
-
-			# Snag the log output
-			log_output = ""
-			with open(log_file_path, "r") as f:
-				log_output = f.read()
-			
-			# Report result, log as needed
-			if result.returncode == 0:
-				hubris.log_debug(log_output)
+		artifact_key_extra : Anything else the outputs depend on, ie the cache keys of the
+			modules it links against.
+		build_args : Forwarded to generate_and_build().
+		"""
+		defs = defs or []
+		build_root = pathlib.Path(build_root)
+		if not build_root.is_absolute():
+			build_root = self._repo_root.joinpath(build_root).resolve()
+		source_root = pathlib.Path(source_root)
+		if not source_root.is_absolute():
+			source_root = self._repo_root.joinpath(source_root).resolve()
+		install_prefix = pathlib.Path(install_prefix).resolve()
+
+		key = None
+		if artifact_cache is not None:
+			compiler_name = _COMPILER_NAMES[compiler].cpp if compiler is not None else None
+			# The defs are passed last, a compiler given there is the one cmake uses
+			for v in defs:
+				if _def_name(v) == "CMAKE_CXX_COMPILER":
+					compiler_name = str(v).split("=", 1)[1]
+			key = make_artifact_key(source_root,
+				compiler=compiler_name,
+				config=config,
+				defs=[str(v) for v in defs],
+				generator=generator or _CMAKE_DEFAULT_GENERATOR,
+				target_platform=target_platform,
+				env=env,
+				extra=(artifact_key_extra or []) + ([component] if component is not None else []))
+			if artifact_cache.restore(key, install_prefix):
+				hubris.log_info(f"Restored {str(source_root)} from the artifact cache ({key[:12]})")
 				return True
-			else:
-				hubris.log_error(log_output)
-				return False
+
+		if not self.generate_and_build(
+			defs=defs,
+			build_root=build_root,
+			source_root=source_root,
+			compiler=compiler,
+			env=env,
+			generator=generator,
+			target_platform=target_platform,
+			config=config,
+			**build_args
+		):
+			return False
+
+		if artifact_cache is None:
+			return self.install(build_root=build_root, install_prefix=install_prefix, component=component, config=config)
+
+		# Installed on its own first so the entry only holds this module's outputs
+		stage = build_root.joinpath(STAGE_DIR)
+		if stage.exists():
+			shutil.rmtree(stage)
+		if not self.install(build_root=build_root, install_prefix=stage, component=component, config=config):
+			return False
+		if artifact_cache.store(key, stage, meta={ "source_root" : str(source_root), "config" : config }) and \
+			artifact_cache.restore(key, install_prefix):
+			return True
+		return self.install(build_root=build_root, install_prefix=install_prefix, component=component, config=config)
+
+	def codemodel(self,
+		build_root : "pathlib.Path | str" = "_build",
+		config : "str | None" = None) -> "CodeModel | None" :
+		"""
+		Gets the targets, sources, include directories and dependencies cmake found in the last
+		configure of a build root, see fileapi.read_codemodel(). Returns None if it was never configured.
+		"""
+		build_root = pathlib.Path(build_root)
+		if not build_root.is_absolute():
+			build_root = self._repo_root.joinpath(build_root).resolve()
+		return read_codemodel(build_root, config)
+
+	def test(self,
+		build_root : "pathlib.Path | str" = "_build",
+		config : "str | None" = None,
+		tests : "str | None" = None,
+		jobs : "int | None" = None,
+		env = None):
+		"""
+		Runs the CTest tests of a build root.
+
+		tests : Only run the tests matching this regular expression (ctest -R).
+		jobs : Number of tests run at once.
+		"""
+		build_root = pathlib.Path(build_root)
+		if not build_root.is_absolute():
+			build_root = self._repo_root.joinpath(build_root).resolve()
+
+		ctest_command = [
+			"ctest",
+			"--test-dir",
+			str(build_root),
+			"--output-on-failure",
+		]
+		if config is not None:
+			ctest_command.extend(["-C", config])
+		if tests is not None:
+			ctest_command.extend(["-R", tests])
+		if jobs is not None:
+			ctest_command.extend(["--parallel", str(jobs)])
+
+		hubris.log_info(" ".join(ctest_command))
+		log_file_path = build_root.joinpath("test_log.txt")
+		try:
+			test_log = run_build(ctest_command, log_file_path, hide_warnings=False, env=env)
+		except FileNotFoundError as exc:
+			hubris.log_error("Missing ctest, please install cmake and ensure it is available on the path")
+			exit(1)
+		if test_log.returncode == 0:
+			return True
+
+		hubris.log_error("Tests failed")
+		if len(test_log.tail) != 0:
+			hubris.log_error("\n".join(test_log.tail))
+		hubris.log_error(f"Full test output written to {str(log_file_path)}")
+		return False
+
+	def build_affected(self,
+		since : str,
+		build_root : "pathlib.Path | str" = "_build",
+		source_root : "pathlib.Path | str" = ".",
+		config : "str | None" = None,
+		test : bool = True,
+		jobs : "int | None" = None,
+		hide_warnings : bool = True,
+		env = None,
+		generator : "str | None" = None,
+		compiler : "Compiler | None" = None,
+		target_platform : "str | None" = None,
+		on_diagnostic = None,
+		**generate_args) -> "tuple[bool, Affected | None]" :
+		"""
+		Configures, then only builds and tests the targets affected by the files changed since
+		a revision, see affected.find_affected(). Falls back to building everything when the
+		code model isn't available.
+
+		since : Revision to compare the working tree against, ie "origin/main".
+		test : Run the CTest tests of the affected targets after building them.
+		generate_args : Forwarded to generate(), ie defs or compiler_cache.
+
+		Returns whether the build and tests succeeded along with what was affected, None when
+		it couldn't be found out. Nothing is kept on the instance, see build().
+		"""
+		source_root = pathlib.Path(source_root)
+		if not source_root.is_absolute():
+			source_root = self._repo_root.joinpath(source_root).resolve()
+		build_root = pathlib.Path(build_root)
+		if not build_root.is_absolute():
+			build_root = self._repo_root.joinpath(build_root).resolve()
+
+		if not self.generate(
+			build_root=build_root,
+			source_root=source_root,
+			compiler=compiler,
+			env=env,
+			generator=generator,
+			target_platform=target_platform,
+			**generate_args
+		):
+			return False, None
+
+		build_args = {
+			"config" : config,
+			"build_root" : build_root,
+			"jobs" : jobs,
+			"hide_warnings" : hide_warnings,
+			"compiler" : compiler,
+			"target_platform" : target_platform,
+			"generator" : generator,
+			"env" : env,
+			"on_diagnostic" : on_diagnostic,
+		}
+
+		model = read_codemodel(build_root, config)
+		if model is None:
+			hubris.log_warn("No CMake code model to find the affected targets in, building everything")
+			if not self.build(**build_args):
+				return False, None
+			return not test or self.test(build_root=build_root, config=config, jobs=jobs, env=env), None
+
+		changed = hubris.git.changed_files(since, repo_root=source_root)
+		if changed is None:
+			return False, None
+		# Imported here as the module scheduler builds on this module
+		from .modules import find_modules
+		affected = find_affected(model, changed, find_modules(source_root))
+		hubris.log_info(f"Changes since {since} : {str(affected)}")
+		if len(affected.targets) == 0:
+			hubris.log_info("Nothing to build")
+			return True, affected
+
+		hubris.log_debug(f"Affected targets : {', '.join(affected.targets)}")
+		if not self.build(targets=affected.targets, **build_args):
+			return False, affected
+		if not test:
+			return True, affected
+
+		tests = find_tests(build_root, model, affected.targets, config)
+		if tests is None:
+			return False, affected
+		if len(tests) == 0:
+			hubris.log_info("No tests run the affected targets")
+			return True, affected
+		return self.test(build_root=build_root, config=config, tests=make_test_regex(tests), jobs=jobs, env=env), affected
 
 	def generate_and_build(self,
 		defs : "list[CMakeDef]" = [],
@@ -330,7 +905,77 @@ class CMake:
 		config : "str | None" = None,
 		clean_first : bool = False,
 		jobs : "int | None" = None,
-		hide_warnings : bool = True):
+		hide_warnings : bool = True,
+		force_generate : bool = False,
+		on_diagnostic = None,
+		compiler_cache : "CompilerCache | None" = None,
+		compiler_cache_dir : "pathlib.Path | str | None" = None,
+		compiler_cache_size : "str | None" = None,
+		unity : "UnityBuild | bool | None" = None,
+		unity_retries : int = 3,
+		pch : "PrecompiledHeaders | bool | None" = None,
+		workers : "list[str] | None" = None):
+		"""
+		unity : Build with CMAKE_UNITY_BUILD, see generate(). When the build fails, the sources
+			whose errors broke a unity batch are excluded from it and the build is retried up to
+			unity_retries times. The exclusions are kept in the build root for later builds once
+			a build with them succeeds, those whose sources fail on their own are taken back.
+		workers : Addresses of hubris.distbuild workers to compile on, see build().
+		"""
+		if unity is True:
+			unity = UnityBuild()
+		resolved_root = pathlib.Path(build_root)
+		if not resolved_root.is_absolute():
+			resolved_root = self._repo_root.joinpath(resolved_root).resolve()
+
+		while True:
+			# Collected per call, other variants may be building on this instance at the same time
+			diagnostics = []
+			def collect(diagnostic, diagnostics=diagnostics):
+				diagnostics.append(diagnostic)
+				if on_diagnostic is not None:
+					on_diagnostic(diagnostic)
+
+			if self._generate_and_build(
+				defs=defs,
+				build_root=build_root,
+				source_root=source_root,
+				compiler=compiler,
+				env=env,
+				generator=generator,
+				target_platform=target_platform,
+				config=config,
+				clean_first=clean_first,
+				jobs=jobs,
+				hide_warnings=hide_warnings,
+				force_generate=force_generate,
+				on_diagnostic=collect,
+				compiler_cache=compiler_cache,
+				compiler_cache_dir=compiler_cache_dir,
+				compiler_cache_size=compiler_cache_size,
+				unity=unity,
+				pch=pch,
+				workers=workers
+			):
+				# generate() saved the settings without the exclusions that weren't built with yet
+				if unity and len(unity.pending) != 0:
+					unity.pending = []
+					unity.save(resolved_root)
+				return True
+
+			if not unity:
+				return False
+			revert_failures(unity, diagnostics, resolved_root)
+			if unity_retries <= 0 or not exclude_failures(unity, diagnostics, resolved_root):
+				return False
+			unity_retries -= 1
+			clean_first = False
+			hubris.log_info("Retrying the unity build with the failing sources excluded")
+
+	def _generate_and_build(self,
+		defs, build_root, source_root, compiler, env, generator, target_platform, config, clean_first,
+		jobs, hide_warnings, force_generate, on_diagnostic, compiler_cache, compiler_cache_dir,
+		compiler_cache_size, unity, pch, workers):
 
 		if not self.generate(
 			defs=defs,
@@ -339,7 +984,14 @@ class CMake:
 			compiler=compiler,
 			env=env,
 			target_platform=target_platform,
-			generator=generator
+			generator=generator,
+			force=force_generate,
+			compiler_cache=compiler_cache,
+			compiler_cache_dir=compiler_cache_dir,
+			compiler_cache_size=compiler_cache_size,
+			unity=unity,
+			pch=pch,
+			distributed=workers is not None
 		):
 			return False
 		
@@ -351,7 +1003,10 @@ class CMake:
 			hide_warnings=hide_warnings,
 			compiler=compiler,
 			target_platform=target_platform,
-			generator=generator
+			generator=generator,
+			env=env,
+			on_diagnostic=on_diagnostic,
+			workers=workers
 		):
 			return False
 
@@ -0,0 +1,207 @@
+#
+# ccache/sccache support for CMake builds
+#
+# The cache is wired in through CMAKE_<LANG>_COMPILER_LAUNCHER. Its directory and size
+# are passed to every compile by the launcher itself, so they apply per build root no
+# matter which environment the build later runs in. sccache compiles through a server
+# that only reads them when it starts, so every cache directory gets a server of its own.
+#
+
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import subprocess
+
+import hubris
+
+
+
+class CompilerCache:
+	auto="auto"
+	ccache="ccache"
+	sccache="sccache"
+
+# Searched in order for CompilerCache.auto
+_AUTO_ORDER = (CompilerCache.sccache, CompilerCache.ccache)
+
+# Environment variables each cache reads its directory and maximum size from
+_ENV_NAMES = {
+	CompilerCache.ccache : ("CCACHE_DIR", "CCACHE_MAXSIZE"),
+	CompilerCache.sccache : ("SCCACHE_DIR", "SCCACHE_CACHE_SIZE"),
+}
+
+# sccache servers listen on a port derived from their cache directory in this range
+_SCCACHE_PORT_ENV = "SCCACHE_SERVER_PORT"
+_SCCACHE_PORT_BASE = 42000
+_SCCACHE_PORT_COUNT = 2000
+
+# Written to the build root by generate() so build() can report statistics
+_CONFIG_FILE = "hubris_compiler_cache.json"
+
+_LANGUAGES = ("C", "CXX")
+
+
+class CompilerCacheStats:
+	"""
+	Cache hits and misses of a single build.
+	"""
+	__slots__ = ("hits", "misses")
+
+	@property
+	def hit_rate(self) -> float :
+		total = self.hits + self.misses
+		if total == 0:
+			return 0.0
+		return self.hits / total
+
+	def __str__(self) -> str :
+		return f"{self.hits} hit(s), {self.misses} miss(es), {self.hit_rate * 100.0:.1f}% hit rate"
+
+	def __sub__(self, other : "CompilerCacheStats") -> "CompilerCacheStats" :
+		# Counters go back to zero when the cache is zeroed or its server restarts
+		if self.hits < other.hits or self.misses < other.misses:
+			return CompilerCacheStats(self.hits, self.misses)
+		return CompilerCacheStats(self.hits - other.hits, self.misses - other.misses)
+
+	def __init__(self, hits : int = 0, misses : int = 0):
+		self.hits = hits
+		self.misses = misses
+
+
+class CompilerCacheConfig:
+	"""
+	A compiler cache as configured for one build root.
+
+	kind : CompilerCache.ccache or CompilerCache.sccache.
+	executable : Full path of the cache executable.
+	cache_dir : Directory the cache stores objects in.
+	max_size : Maximum cache size in the cache's own notation, ie "5G", None leaves its default.
+	"""
+	__slots__ = ("kind", "executable", "cache_dir", "max_size")
+
+	def settings(self) -> "dict[str, str]" :
+		"""
+		Gets the environment variables pointing the cache at cache_dir. An sccache server already
+		running for another directory would ignore them, so sccache also gets a server port of
+		its own for the directory.
+		"""
+		dir_name, size_name = _ENV_NAMES[self.kind]
+		o = { dir_name : str(self.cache_dir) }
+		if self.max_size is not None:
+			o[size_name] = str(self.max_size)
+		if self.kind == CompilerCache.sccache:
+			digest = hashlib.sha256(os.path.normcase(os.path.abspath(str(self.cache_dir))).encode()).digest()
+			o[_SCCACHE_PORT_ENV] = str(_SCCACHE_PORT_BASE + int.from_bytes(digest[:4], "big") % _SCCACHE_PORT_COUNT)
+		return o
+
+	def env(self, env = None) -> dict :
+		"""
+		Returns a copy of env (or the current environment) with settings() applied.
+		"""
+		o = dict(env or os.environ)
+		o.update(self.settings())
+		return o
+
+	def make_launcher(self) -> str :
+		"""
+		Makes the CMake list used as the compiler launcher, "cmake -E env <settings> <cache>".
+		"""
+		launcher = [shutil.which("cmake") or "cmake", "-E", "env"]
+		launcher.extend(f"{k}={v}" for k, v in self.settings().items())
+		launcher.append(self.executable)
+		return ";".join(launcher)
+
+	def make_defs(self) -> "list[str]" :
+		launcher = self.make_launcher()
+		return [f"-DCMAKE_{v}_COMPILER_LAUNCHER={launcher}" for v in _LANGUAGES]
+
+	def save(self, build_root : pathlib.Path):
+		data = {
+			"kind" : self.kind,
+			"executable" : self.executable,
+			"cache_dir" : str(self.cache_dir),
+			"max_size" : self.max_size,
+		}
+		pathlib.Path(build_root).joinpath(_CONFIG_FILE).write_text(json.dumps(data))
+
+	@staticmethod
+	def load(build_root : pathlib.Path) -> "CompilerCacheConfig | None" :
+		try:
+			data = json.loads(pathlib.Path(build_root).joinpath(_CONFIG_FILE).read_text())
+			return CompilerCacheConfig(data["kind"], data["executable"], data["cache_dir"], data["max_size"])
+		except (OSError, ValueError, KeyError):
+			return None
+
+	@staticmethod
+	def remove(build_root : pathlib.Path):
+		path = pathlib.Path(build_root).joinpath(_CONFIG_FILE)
+		if path.exists():
+			os.remove(path)
+
+	def __init__(self, kind : str, executable : str, cache_dir : "str | pathlib.Path", max_size : "str | None" = None):
+		self.kind = kind
+		self.executable = executable
+		self.cache_dir = cache_dir
+		self.max_size = max_size
+
+
+def find_compiler_cache(kind : str = CompilerCache.auto) -> "tuple[str, str] | None" :
+	"""
+	Finds the executable of a compiler cache, any supported one for CompilerCache.auto.
+	Returns (kind, path) or None if it isn't installed.
+	"""
+	if kind == CompilerCache.auto:
+		kinds = _AUTO_ORDER
+	elif kind in _ENV_NAMES:
+		kinds = (kind,)
+	else:
+		raise ValueError(f"Unknown compiler cache {kind}")
+
+	for v in kinds:
+		path = shutil.which(v)
+		if path is not None:
+			return (v, path)
+	return None
+
+
+def _run_cache(config : CompilerCacheConfig, args : "list[str]") -> "subprocess.CompletedProcess | None" :
+	try:
+		return subprocess.run([config.executable] + args, env=config.env(), capture_output=True, text=True)
+	except OSError as exc:
+		hubris.log_debug(f"Failed to run {config.executable} : {exc}")
+		return None
+
+def _sum_counts(value) -> int :
+	# sccache reports per language counts, ie {"counts": {"C/C++": 12}}
+	if isinstance(value, dict):
+		return sum(int(v) for v in value.get("counts", {}).values())
+	return int(value or 0)
+
+def read_stats(config : CompilerCacheConfig) -> "CompilerCacheStats | None" :
+	"""
+	Reads the hits and misses the cache counted so far, None if it couldn't report them. These
+	are shared by every build using the cache, a build's own are the difference between the
+	counts before and after it. For sccache this starts the server of the cache directory.
+	"""
+	if config.kind == CompilerCache.ccache:
+		result = _run_cache(config, ["--print-stats"])
+		if result is None or result.returncode != 0:
+			return None
+		values = {}
+		for line in result.stdout.splitlines():
+			parts = line.split("\t")
+			if len(parts) == 2 and parts[1].isdigit():
+				values[parts[0]] = int(parts[1])
+		hits = values.get("direct_cache_hit", 0) + values.get("preprocessed_cache_hit", 0)
+		return CompilerCacheStats(hits, values.get("cache_miss", 0))
+
+	result = _run_cache(config, ["--show-stats", "--stats-format=json"])
+	if result is None or result.returncode != 0:
+		return None
+	try:
+		stats = json.loads(result.stdout).get("stats", {})
+		return CompilerCacheStats(_sum_counts(stats.get("cache_hits")), _sum_counts(stats.get("cache_misses")))
+	except (ValueError, TypeError, AttributeError):
+		return None
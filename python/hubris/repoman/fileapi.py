@@ -0,0 +1,333 @@
+#
+# CMake File API
+#
+# A query written to the build root asks cmake to describe the project each time it
+# configures, see https://cmake.org/cmake/help/latest/manual/cmake-file-api.7.html.
+# The replies are read back here instead of parsing CMakeLists or the generated build files,
+# into a model indexed for lookups that is pickled next to them so it reloads without
+# parsing the replies again until the next configure.
+#
+
+import json
+import os
+import pathlib
+import pickle
+
+import hubris
+
+
+
+_API_DIR = pathlib.Path(".cmake", "api", "v1")
+_CLIENT = "client-hubris"
+_QUERY_FILE = "query.json"
+
+_QUERY = {
+	"requests" : [
+		{ "kind" : "codemodel", "version" : 2 },
+		{ "kind" : "cache", "version" : 2 },
+		{ "kind" : "toolchains", "version" : 1 },
+		{ "kind" : "cmakeFiles", "version" : 1 },
+	]
+}
+
+# Written to the build root, one per configuration
+_PICKLE_FILE = "hubris_codemodel{}.pickle"
+
+# Bumped when the pickled classes change so older pickles are reread
+_PICKLE_VERSION = 2
+
+# Targets every Visual Studio/Xcode project has that don't build anything of the project
+_GENERATOR_TARGETS = ("ALL_BUILD", "ZERO_CHECK", "INSTALL", "RUN_TESTS", "PACKAGE")
+
+
+def write_query(build_root : "str | pathlib.Path") -> str :
+	"""
+	Writes the hubris query to the build root, if it isn't there already.
+	Returns its contents so they can be part of the configure fingerprint.
+	"""
+	text = json.dumps(_QUERY, indent=4)
+	path = pathlib.Path(build_root).joinpath(_API_DIR, "query", _CLIENT, _QUERY_FILE)
+	if not path.exists() or path.read_text() != text:
+		os.makedirs(path.parent, exist_ok=True)
+		path.write_text(text)
+	return text
+
+def _read_json(path : pathlib.Path) -> "dict | None" :
+	try:
+		return json.loads(path.read_text())
+	except (OSError, ValueError):
+		return None
+
+def _find_index(build_root : pathlib.Path) -> "pathlib.Path | None" :
+	"""
+	Finds the reply index of the last configure, a new one is written every time.
+	"""
+	reply_dir = build_root.joinpath(_API_DIR, "reply")
+	try:
+		indices = sorted(v for v in os.listdir(reply_dir) if v.startswith("index-") and v.endswith(".json"))
+	except OSError:
+		return None
+	if len(indices) == 0:
+		return None
+	return reply_dir.joinpath(indices[-1])
+
+def _read_responses(index_path : pathlib.Path) -> "dict[str, pathlib.Path]" :
+	"""
+	Finds the reply files answering the hubris query, keyed by kind.
+	"""
+	reply_dir = index_path.parent
+	index = _read_json(index_path)
+	if index is None:
+		return {}
+	o = {}
+	responses = index.get("reply", {}).get(_CLIENT, {}).get(_QUERY_FILE, {}).get("responses", [])
+	for v in responses:
+		if "jsonFile" in v and "kind" in v:
+			o[v["kind"]] = reply_dir.joinpath(v["jsonFile"])
+	return o
+
+
+class CodeModelTarget:
+	"""
+	A target of the code model.
+
+	type : EXECUTABLE, STATIC_LIBRARY, SHARED_LIBRARY, MODULE_LIBRARY, OBJECT_LIBRARY, INTERFACE_LIBRARY or UTILITY.
+	source_dir : Absolute path of the directory whose CMakeLists added it.
+	sources : Absolute paths of its sources, generated ones included.
+	include_dirs : Absolute paths of the include directories its sources are compiled with, in order.
+	dependencies : Ids of the targets it depends on.
+	artifacts : Absolute paths of the files it builds.
+	"""
+	__slots__ = ("name", "id", "type", "source_dir", "sources", "include_dirs", "dependencies", "artifacts")
+
+	def __str__(self) -> str :
+		return self.name
+
+	def __init__(self, name : str, id : str, type : str, source_dir : str):
+		self.name = name
+		self.id = id
+		self.type = type
+		self.source_dir = source_dir
+		self.sources : "list[str]" = []
+		self.include_dirs : "list[str]" = []
+		self.dependencies : "list[str]" = []
+		self.artifacts : "list[str]" = []
+
+
+class Toolchain:
+	"""
+	A compiler the project was configured with.
+
+	language : ie "C" or "CXX".
+	compiler_id : ie "GNU", "Clang" or "MSVC", empty when cmake couldn't tell.
+	include_dirs : Directories the compiler searches without being told to.
+	"""
+	__slots__ = ("language", "compiler_id", "compiler_path", "version", "include_dirs")
+
+	def __init__(self, language : str, compiler_id : str, compiler_path : str, version : str,
+		include_dirs : "list[str]"):
+		self.language = language
+		self.compiler_id = compiler_id
+		self.compiler_path = compiler_path
+		self.version = version
+		self.include_dirs = include_dirs
+
+
+class CodeModel:
+	"""
+	The targets of one configuration of a build root, keyed by name, with the cache entries,
+	toolchains and CMake input files of the configure that described it.
+
+	cmake_inputs : Absolute paths of the project's files cmake read while configuring, ie every
+		CMakeLists.txt and included module. Files of cmake itself and generated ones are left out.
+	"""
+
+	def by_id(self, id : str) -> "CodeModelTarget | None" :
+		return self._by_id.get(id)
+
+	def targets_of_source(self, path : "str | os.PathLike") -> "list[CodeModelTarget]" :
+		"""
+		Finds the targets compiling a source, by absolute path.
+		"""
+		return self._by_source.get(os.path.normcase(os.path.normpath(str(path))), [])
+
+	def is_cmake_input(self, path : "str | os.PathLike") -> bool :
+		"""
+		Checks if cmake read a file, by absolute path, while configuring.
+		"""
+		return os.path.normcase(os.path.normpath(str(path))) in self._cmake_inputs
+
+	def dependents(self, name : str) -> "list[CodeModelTarget]" :
+		"""
+		Finds the targets depending directly on the named one.
+		"""
+		return self._dependents.get(name, [])
+
+	def include_dirs(self, in_tree : bool = True) -> "list[str]" :
+		"""
+		Collects the include directories of every target in order, without duplicates.
+		in_tree : Leave out the directories outside the source and build roots.
+		"""
+		roots = [os.path.normcase(self.source_root), os.path.normcase(self.build_root)]
+		o = []
+		for target in self.targets.values():
+			for v in target.include_dirs:
+				if v in o:
+					continue
+				if in_tree and not any(os.path.commonpath([os.path.normcase(v), r]) == r for r in roots):
+					continue
+				o.append(v)
+		return o
+
+	def _index(self):
+		self._by_id = { v.id : v for v in self.targets.values() }
+		self._by_source : "dict[str, list[CodeModelTarget]]" = {}
+		self._dependents : "dict[str, list[CodeModelTarget]]" = {}
+		self._cmake_inputs = set(os.path.normcase(v) for v in self.cmake_inputs)
+		for target in self.targets.values():
+			for v in target.sources:
+				self._by_source.setdefault(os.path.normcase(v), []).append(target)
+			for v in target.dependencies:
+				dep = self._by_id.get(v)
+				if dep is not None:
+					self._dependents.setdefault(dep.name, []).append(target)
+
+	def __getstate__(self) -> dict :
+		# The indices are rebuilt on load, they'd only make the pickle bigger
+		return { k : v for k, v in self.__dict__.items() if not k.startswith("_") }
+
+	def __setstate__(self, state : dict):
+		self.__dict__.update(state)
+		self._index()
+
+	def __init__(self, source_root : str, build_root : str, config : str, targets : "list[CodeModelTarget]",
+		cache : "dict[str, str] | None" = None, toolchains : "dict[str, Toolchain] | None" = None,
+		cmake_inputs : "list[str] | None" = None):
+		self.source_root = source_root
+		self.build_root = build_root
+		self.config = config
+		self.targets = { v.name : v for v in targets }
+		self.cache = cache or {}
+		self.toolchains = toolchains or {}
+		self.cmake_inputs = cmake_inputs or []
+		self._index()
+
+
+def _read_target(path : pathlib.Path, source_root : str, build_root : str) -> "CodeModelTarget | None" :
+	data = _read_json(path)
+	if data is None:
+		return None
+	target = CodeModelTarget(
+		data["name"],
+		data["id"],
+		data.get("type", ""),
+		os.path.normpath(os.path.join(source_root, data.get("paths", {}).get("source", "."))))
+	for v in data.get("sources", []):
+		target.sources.append(os.path.normpath(os.path.join(source_root, v["path"])))
+	for group in data.get("compileGroups", []):
+		for v in group.get("includes", []):
+			path = os.path.normpath(os.path.join(source_root, v["path"]))
+			if path not in target.include_dirs:
+				target.include_dirs.append(path)
+	for v in data.get("dependencies", []):
+		target.dependencies.append(v["id"])
+	for v in data.get("artifacts", []):
+		target.artifacts.append(os.path.normpath(os.path.join(build_root, v["path"])))
+	return target
+
+def _read_cache(path : "pathlib.Path | None") -> "dict[str, str]" :
+	data = _read_json(path) if path is not None else None
+	if data is None:
+		return {}
+	return { v["name"] : v.get("value", "") for v in data.get("entries", []) }
+
+def _read_toolchains(path : "pathlib.Path | None") -> "dict[str, Toolchain]" :
+	data = _read_json(path) if path is not None else None
+	if data is None:
+		return {}
+	o = {}
+	for v in data.get("toolchains", []):
+		compiler = v.get("compiler", {})
+		o[v["language"]] = Toolchain(
+			v["language"],
+			compiler.get("id", ""),
+			compiler.get("path", ""),
+			compiler.get("version", ""),
+			[os.path.normpath(d) for d in compiler.get("implicit", {}).get("includeDirectories", [])])
+	return o
+
+def _read_cmake_inputs(path : "pathlib.Path | None", source_root : str) -> "list[str]" :
+	data = _read_json(path) if path is not None else None
+	if data is None:
+		return []
+	o = []
+	for v in data.get("inputs", []):
+		if v.get("isCMake") or v.get("isGenerated"):
+			continue
+		o.append(os.path.normpath(os.path.join(source_root, v["path"])))
+	return o
+
+def _read_codemodel(index_path : pathlib.Path, config : "str | None") -> "CodeModel | None" :
+	responses = _read_responses(index_path)
+	path = responses.get("codemodel")
+	data = _read_json(path) if path is not None else None
+	if data is None:
+		return None
+
+	configs = data.get("configurations", [])
+	if len(configs) == 0:
+		return None
+	selected = configs[0]
+	if config is not None:
+		selected = next((v for v in configs if v["name"].lower() == config.lower()), selected)
+
+	source_root = data["paths"]["source"]
+	build_root = data["paths"]["build"]
+	targets = []
+	for v in selected.get("targets", []):
+		if v["name"] in _GENERATOR_TARGETS:
+			continue
+		target = _read_target(path.parent.joinpath(v["jsonFile"]), source_root, build_root)
+		if target is not None:
+			targets.append(target)
+	return CodeModel(source_root, build_root, selected["name"], targets,
+		cache=_read_cache(responses.get("cache")),
+		toolchains=_read_toolchains(responses.get("toolchains")),
+		cmake_inputs=_read_cmake_inputs(responses.get("cmakeFiles"), source_root))
+
+def read_codemodel(build_root : "str | pathlib.Path", config : "str | None" = None) -> "CodeModel | None" :
+	"""
+	Reads the code model of the last configure of build_root, which must have been configured
+	with the hubris query (see CMake.generate()). Multi config generators describe every
+	configuration, config picks one and defaults to the first. Returns None without a reply.
+
+	The model is pickled to the build root the first time it's read after a configure, and
+	loaded from there until the next one.
+	"""
+	build_root = pathlib.Path(build_root)
+	index_path = _find_index(build_root)
+	if index_path is None:
+		hubris.log_debug(f"No CMake File API reply in {str(build_root)}")
+		return None
+
+	# The reply index is named after the configure that wrote it
+	key = (_PICKLE_VERSION, index_path.name, config)
+	pickle_path = build_root.joinpath(_PICKLE_FILE.format("" if config is None else "-" + config.lower()))
+	try:
+		with open(pickle_path, "rb") as f:
+			cached_key, model = pickle.load(f)
+		if cached_key == key:
+			return model
+	except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError, ImportError):
+		pass
+
+	model = _read_codemodel(index_path, config)
+	if model is None:
+		hubris.log_debug(f"No CMake File API code model in {str(build_root)}")
+		return None
+	try:
+		with open(pickle_path, "wb") as f:
+			pickle.dump((key, model), f, protocol=pickle.HIGHEST_PROTOCOL)
+	except OSError as exc:
+		hubris.log_debug(f"Failed to write {str(pickle_path)} : {exc}")
+	return model
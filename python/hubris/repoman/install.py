@@ -0,0 +1,185 @@
+#
+# Incremental installs
+#
+# `cmake --install` goes to a staging directory kept in the build root, where it already
+# skips files that are up to date. The staged files are then placed in the prefix with
+# reflinks or hardlinks, and only those that changed since the last install according to
+# a manifest of size, mtime and content hash kept per build root in the prefix.
+#
+
+import hashlib
+import json
+import os
+import pathlib
+
+import hubris
+from hubris.filesystem.link import DEFAULT_LINK_MODES, clone_file
+
+
+
+STAGE_DIR = "hubris_install_stage"
+
+# Manifests are kept in the prefix, one per build root installing into it
+_MANIFEST_DIR = ".hubris_install"
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class InstallStats:
+	"""
+	What an incremental install did to the prefix.
+
+	placed : Files added or replaced.
+	unchanged : Files left alone as they matched the manifest.
+	removed : Files no longer installed that were removed.
+	"""
+	__slots__ = ("placed", "unchanged", "removed", "link_modes")
+
+	def __str__(self) -> str :
+		modes = ", ".join(f"{n} {v}" for v, n in sorted(self.link_modes.items()))
+		s = f"{self.placed} placed, {self.unchanged} unchanged, {self.removed} removed"
+		if len(modes) != 0:
+			s += f" ({modes})"
+		return s
+
+	def __init__(self):
+		self.placed = 0
+		self.unchanged = 0
+		self.removed = 0
+		self.link_modes : "dict[str, int]" = {}
+
+
+def _hash_file(path : str) -> str :
+	h = hashlib.sha256()
+	with open(path, "rb") as f:
+		while True:
+			chunk = f.read(_HASH_CHUNK_SIZE)
+			if len(chunk) == 0:
+				break
+			h.update(chunk)
+	return h.hexdigest()
+
+def _stat_key(st : os.stat_result) -> "list[int]" :
+	return [st.st_size, st.st_mtime_ns]
+
+def manifest_path(prefix : "str | pathlib.Path", build_root : "str | pathlib.Path") -> pathlib.Path :
+	name = hashlib.sha256(str(pathlib.Path(build_root).resolve()).encode()).hexdigest()[:16]
+	return pathlib.Path(prefix).joinpath(_MANIFEST_DIR, name + ".json")
+
+def _read_manifest(path : pathlib.Path) -> dict :
+	try:
+		return json.loads(path.read_text())
+	except (OSError, ValueError):
+		return {}
+
+
+def sync_tree(stage : "str | pathlib.Path", prefix : "str | pathlib.Path", manifest : "str | pathlib.Path",
+	link_modes : "tuple[str, ...]" = DEFAULT_LINK_MODES) -> InstallStats :
+	"""
+	Makes the files of stage appear in prefix, touching only what changed since the last sync
+	recorded in manifest. Files a previous sync placed that are gone from stage are removed,
+	anything else in prefix is left alone.
+
+	A file is unchanged when both its staged and installed size and mtime match the manifest, or
+	when the staged one was rewritten with the same content as the installed one. Hashes are only
+	computed for files whose staged size or mtime changed, and kept in the manifest.
+	"""
+	stage = str(stage)
+	prefix = str(prefix)
+	manifest = pathlib.Path(manifest)
+	previous = _read_manifest(manifest)
+	entries = {}
+	stats = InstallStats()
+
+	for root, dirs, files in os.walk(stage):
+		rel_root = os.path.relpath(root, stage)
+		out_root = os.path.normpath(os.path.join(prefix, rel_root))
+		os.makedirs(out_root, exist_ok=True)
+		for v in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+			path = os.path.join(root, v)
+			out_path = os.path.join(out_root, v)
+			rel = os.path.normpath(os.path.join(rel_root, v)).replace("\\", "/")
+
+			if os.path.islink(path):
+				target = os.readlink(path)
+				if not (os.path.islink(out_path) and os.readlink(out_path) == target):
+					if os.path.lexists(out_path):
+						os.remove(out_path)
+					os.symlink(target, out_path)
+					stats.placed += 1
+				else:
+					stats.unchanged += 1
+				entries[rel] = { "link" : target }
+				continue
+
+			staged = _stat_key(os.stat(path))
+			try:
+				installed = _stat_key(os.lstat(out_path))
+			except OSError:
+				installed = None
+
+			old = previous.get(rel)
+			digest = None
+			unchanged = False
+			if old is not None and installed is not None and old.get("installed") == installed:
+				if old.get("staged") == staged:
+					unchanged = True
+					digest = old.get("hash")
+				else:
+					digest = _hash_file(path)
+					unchanged = digest == (old.get("hash") or _hash_file(out_path))
+				if unchanged:
+					stats.unchanged += 1
+					entries[rel] = { "staged" : staged, "installed" : installed, "hash" : digest }
+					continue
+
+			mode = clone_file(path, out_path, link_modes)
+			stats.link_modes[mode] = stats.link_modes.get(mode, 0) + 1
+			stats.placed += 1
+			entries[rel] = {
+				"staged" : staged,
+				"installed" : _stat_key(os.lstat(out_path)),
+				"hash" : digest,
+			}
+
+	# Remove what the last install placed that isn't installed anymore
+	for rel in previous:
+		if rel in entries:
+			continue
+		path = os.path.join(prefix, rel)
+		if os.path.lexists(path):
+			os.remove(path)
+			stats.removed += 1
+
+	os.makedirs(manifest.parent, exist_ok=True)
+	manifest.write_text(json.dumps(entries))
+	return stats
+
+
+def break_hardlinks(build_root : "str | pathlib.Path", prefix : "str | pathlib.Path") -> int :
+	"""
+	Removes the files of prefix the last `cmake --install` of build_root wrote (listed in its
+	install_manifest.txt, files it staged count for prefix too) that are hardlinked elsewhere, ie
+	restored from an artifact cache or placed by sync_tree(). Installing over them could otherwise
+	write through to the other copy. Returns how many were removed.
+	"""
+	n = 0
+	stage = str(pathlib.Path(build_root).joinpath(STAGE_DIR).resolve())
+	try:
+		with open(pathlib.Path(build_root).joinpath("install_manifest.txt"), "r") as f:
+			paths = [v.rstrip("\r\n") for v in f]
+	except OSError:
+		return 0
+	for path in paths:
+		if os.path.commonpath([stage, os.path.abspath(path)]) == stage:
+			path = os.path.join(str(prefix), os.path.relpath(path, stage))
+		try:
+			st = os.lstat(path)
+		except OSError:
+			continue
+		if st.st_nlink > 1:
+			os.remove(path)
+			n += 1
+	if n != 0:
+		hubris.log_debug(f"Removed {n} hardlinked file(s) before installing")
+	return n
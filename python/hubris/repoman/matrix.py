@@ -0,0 +1,236 @@
+#
+# Builds several configurations and/or compilers of a repo at once
+#
+# Every variant gets its own build root. The job budget is shared through a GNU make
+# style jobserver when the generator's ninja supports it, so a variant that finishes
+# early hands its jobs to the others, and is split evenly between the variants otherwise.
+#
+
+import concurrent.futures
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import hubris
+
+from .buildlog import DiagnosticSeverity
+from .cmake import CMakeDef, _COMPILER_NAMES, _CMAKE_DEFAULT_GENERATOR
+
+if typing.TYPE_CHECKING:
+	from .buildlog import Diagnostic
+	from .cmake import Compiler
+
+
+
+# Oldest ninja that can act as a jobserver client, see https://github.com/ninja-build/ninja/pull/2506
+_NINJA_JOBSERVER_VERSION = (1, 13)
+
+_NINJA_VERSION_REGEX = re.compile(r"^(\d+)\.(\d+)")
+
+
+class BuildVariant:
+	"""
+	A single configuration and compiler combination of a build matrix.
+	compiler is None for generators that pick their own (Visual Studio).
+	"""
+	__slots__ = ("config", "compiler", "build_root")
+
+	@property
+	def name(self) -> str :
+		if self.compiler is None:
+			return self.config
+		return f"{self.config}-{_COMPILER_NAMES[self.compiler].c}"
+
+	def __str__(self) -> str :
+		return self.name
+
+	def __init__(self, config : str, compiler : "Compiler | None", build_root : "str | os.PathLike"):
+		self.config = config
+		self.compiler = compiler
+		self.build_root = build_root
+
+
+class VariantResult:
+	"""
+	Outcome of building a single variant.
+
+	ok : False if configuring or building failed or raised.
+	jobs : Jobs given to the build, None when it drew them from the shared jobserver.
+	diagnostics : Diagnostics reported by the build.
+	elapsed : Wall time in seconds spent configuring and building.
+	"""
+	__slots__ = ("variant", "ok", "jobs", "diagnostics", "elapsed", "error")
+
+	@property
+	def errors(self) -> "list[Diagnostic]" :
+		return [v for v in self.diagnostics if v.is_error()]
+
+	@property
+	def warnings(self) -> "list[Diagnostic]" :
+		return [v for v in self.diagnostics if v.severity == DiagnosticSeverity.warning]
+
+	def __str__(self) -> str :
+		state = "ok" if self.ok else "failed"
+		return f"{self.variant} {state} ({self.elapsed:.2f}s, {len(self.errors)} error(s), {len(self.warnings)} warning(s))"
+
+	def __init__(self, variant : BuildVariant, ok : bool = False, jobs : "int | None" = None,
+		elapsed : float = 0.0, error : "BaseException | None" = None):
+		self.variant = variant
+		self.ok = ok
+		self.jobs = jobs
+		self.diagnostics : "list[Diagnostic]" = []
+		self.elapsed = elapsed
+		self.error = error
+
+
+def make_matrix(configs : "list[str]",
+	compilers : "list[Compiler | None] | None" = None,
+	build_root : "str | os.PathLike" = "_build") -> "list[BuildVariant]" :
+	"""
+	Makes a variant for every config and compiler pair, each built in
+	<build_root>/<config>-<compiler> (or <build_root>/<config> without a compiler).
+	"""
+	compilers = compilers or [None]
+	o = []
+	for compiler in compilers:
+		for config in configs:
+			variant = BuildVariant(config, compiler, None)
+			variant.build_root = os.path.join(str(build_root), variant.name.lower())
+			o.append(variant)
+	return o
+
+def split_jobs(jobs : int, count : int) -> "list[int]" :
+	"""
+	Splits a job budget between count builds as evenly as possible, every build gets at least one.
+	"""
+	if count == 0:
+		return []
+	share, extra = divmod(max(jobs, count), count)
+	return [share + 1 if n < extra else share for n in range(count)]
+
+
+def _ninja_supports_jobserver() -> bool :
+	if sys.platform.startswith("win32"):
+		return False
+	ninja = shutil.which("ninja")
+	if ninja is None:
+		return False
+	try:
+		result = subprocess.run([ninja, "--version"], capture_output=True, text=True)
+	except OSError:
+		return False
+	match = _NINJA_VERSION_REGEX.match(result.stdout.strip())
+	if match is None:
+		return False
+	return (int(match.group(1)), int(match.group(2))) >= _NINJA_JOBSERVER_VERSION
+
+
+class _Jobserver:
+	"""
+	A GNU make style jobserver over a named pipe. Each client implicitly owns one job,
+	so the pipe holds jobs - clients tokens to keep the total at the budget.
+	"""
+
+	def env(self, env = None) -> dict :
+		o = dict(env or os.environ)
+		o["MAKEFLAGS"] = f"-j{self.jobs} --jobserver-auth=fifo:{self._path}"
+		# An explicit job count makes ninja ignore the jobserver
+		o.pop("CMAKE_BUILD_PARALLEL_LEVEL", None)
+		return o
+
+	def close(self):
+		os.close(self._fd)
+		shutil.rmtree(self._dir, ignore_errors=True)
+
+	def __init__(self, jobs : int, clients : int):
+		self.jobs = jobs
+		self._dir = tempfile.mkdtemp(prefix="hubris-jobserver-")
+		self._path = os.path.join(self._dir, "fifo")
+		os.mkfifo(self._path, 0o600)
+
+		# Held open for reading and writing so clients never see the pipe close
+		self._fd = os.open(self._path, os.O_RDWR | os.O_NONBLOCK)
+		tokens = max(jobs - clients, 0)
+		if tokens != 0:
+			os.write(self._fd, b"+" * tokens)
+
+
+def _build_one(tool, variant : BuildVariant, jobs : "int | None", env, generator : "str | None", tool_args : dict) -> VariantResult :
+	result = VariantResult(variant, jobs=jobs)
+	start = time.perf_counter()
+
+	# Single config generators only read CMAKE_BUILD_TYPE, multi config ones only --config
+	defs = list(tool_args.pop("defs", None) or [])
+	defs.append(CMakeDef("CMAKE_BUILD_TYPE", variant.config))
+
+	try:
+		result.ok = tool.generate_and_build(
+			defs=defs,
+			build_root=variant.build_root,
+			compiler=variant.compiler,
+			generator=generator,
+			config=variant.config,
+			jobs=jobs,
+			env=env,
+			on_diagnostic=result.diagnostics.append,
+			**tool_args)
+	except Exception as exc:
+		result.ok = False
+		result.error = exc
+	result.elapsed = time.perf_counter() - start
+	return result
+
+def build_matrix(tool,
+	variants : "list[BuildVariant]",
+	jobs : "int | None" = None,
+	generator : "str | None" = None,
+	env = None,
+	**tool_args) -> "list[VariantResult]" :
+	"""
+	Configures and builds every variant concurrently with tool.generate_and_build().
+	Results are returned in the same order as variants.
+
+	jobs : Total job budget shared by all variants, defaults to the cpu count.
+	tool_args : Forwarded to generate_and_build(), ie hide_warnings or clean_first.
+	"""
+	if len(variants) == 0:
+		return []
+
+	jobs = jobs or os.cpu_count() or 1
+	generator = generator or _CMAKE_DEFAULT_GENERATOR
+
+	jobserver = None
+	if len(variants) > 1 and generator == "Ninja" and _ninja_supports_jobserver():
+		jobserver = _Jobserver(jobs, len(variants))
+		variant_jobs = [None] * len(variants)
+		variant_env = jobserver.env(env)
+		hubris.log_info(f"Building {len(variants)} variants sharing {jobs} jobs")
+	else:
+		variant_jobs = split_jobs(jobs, len(variants))
+		variant_env = env
+		hubris.log_info(f"Building {len(variants)} variants with {variant_jobs} jobs")
+
+	results : "list[VariantResult | None]" = [None] * len(variants)
+	try:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=len(variants)) as pool:
+			futures = {}
+			for n, v in enumerate(variants):
+				futures[pool.submit(_build_one, tool, v, variant_jobs[n], variant_env, generator, dict(tool_args))] = n
+
+			for future in concurrent.futures.as_completed(futures):
+				result = future.result()
+				results[futures[future]] = result
+				if result.ok:
+					hubris.log_info(str(result))
+				else:
+					hubris.log_error(str(result))
+	finally:
+		if jobserver is not None:
+			jobserver.close()
+
+	return results
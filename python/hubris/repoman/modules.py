@@ -0,0 +1,507 @@
+#
+# Building the modules of a tree on their own, in dependency order
+#
+# A module is a directory whose CMakeLists.txt calls project(), as hubris.new_module makes
+# them, along with the CMakeLists below it that don't. A module depends on another when it
+# links against one of its targets or declares it with ADD_GIT_DEPENDENCY. The tree is
+# configured once, so modules get the root's utility.cmake and each other's targets, then
+# the targets of every module that changed are built by a single build. The build tool
+# already orders the targets by their dependencies and overlaps the compiles of independent
+# ones with a single job budget, separate builds per module or wave of modules would only
+# split that budget and wait on each other, so there's no pool of builds here. A failure
+# is pinned on the modules owning the targets of the failed steps. A module whose sources
+# and dependencies didn't change since its last successful build is skipped.
+#
+
+import hashlib
+import json
+import os
+import pathlib
+import re
+import time
+
+import hubris
+
+from .artifact_cache import hash_source_tree
+from .buildlog import Diagnostic, DiagnosticSeverity
+from .fileapi import CodeModel
+
+
+
+# Written to the build root holding the module build roots
+_STATE_FILE = "hubris_modules.json"
+
+_CMAKE_COMMENT_REGEX = re.compile(r"#.*")
+_CMAKE_COMMAND_REGEX = re.compile(r"\b(?P<name>\w+)\s*\((?P<args>[^()]*)\)")
+_CMAKE_ARGUMENT_REGEX = re.compile(r'"[^"]*"|[^\s"]+')
+_CMAKE_VARIABLE_REGEX = re.compile(r"\$\{(\w+)\}")
+
+# target_link_libraries() arguments that aren't libraries
+_CMAKE_LINK_KEYWORDS = ("PUBLIC", "PRIVATE", "INTERFACE", "LINK_PUBLIC", "LINK_PRIVATE",
+	"LINK_INTERFACE_LIBRARIES", "debug", "optimized", "general")
+
+_CMAKE_GIT_DEPENDENCY_COMMANDS = ("add_git_dependency", "add_git_dependency_fn")
+
+# Steps building part of a target, ie "CMakeFiles/util.dir/util.cpp.o" or "util/CMakeFiles/util.dir/util.cpp.o"
+_TARGET_STEP_REGEX = re.compile(r"(?:^|/)CMakeFiles/(?P<target>[^/]+)\.dir/")
+
+
+class GitDependency:
+	"""
+	A dependency declared with ADD_GIT_DEPENDENCY(path target repo [branch]).
+	path is absolute, the dependency may not have been cloned there yet.
+	"""
+	__slots__ = ("path", "target", "repo", "branch")
+
+	def __init__(self, path : str, target : str, repo : str, branch : "str | None" = None):
+		self.path = path
+		self.target = target
+		self.repo = repo
+		self.branch = branch
+
+
+class Module:
+	"""
+	A CMake project of the tree.
+
+	targets : Libraries and executables it adds.
+	links : Everything its targets link against, targets of other modules or not.
+	git_deps : Dependencies it declares with ADD_GIT_DEPENDENCY.
+	deps : Names of the modules it depends on, see find_modules().
+	"""
+	__slots__ = ("name", "root", "targets", "links", "git_deps", "deps")
+
+	def __str__(self) -> str :
+		return self.name
+
+	def __init__(self, name : str, root : str):
+		self.name = name
+		self.root = root
+		self.targets : "list[str]" = []
+		self.links : "list[str]" = []
+		self.git_deps : "list[GitDependency]" = []
+		self.deps : "list[str]" = []
+
+
+def _split_args(args : str, variables : "dict[str, str]") -> "list[str]" :
+	args = _CMAKE_VARIABLE_REGEX.sub(lambda m: variables.get(m.group(1), m.group(0)), args)
+	return [v.strip('"') for v in _CMAKE_ARGUMENT_REGEX.findall(args)]
+
+def _read_cmakelists(path : str, module : "Module | None") -> "Module | None" :
+	"""
+	Adds what the CMakeLists at path declares to module, or to a new module if it calls project().
+	Only variables set in the same file are resolved, arguments still naming one are ignored.
+	"""
+	with open(path, "r", errors="replace") as f:
+		text = _CMAKE_COMMENT_REGEX.sub("", f.read())
+
+	root = os.path.dirname(os.path.abspath(path))
+	variables = {
+		"CMAKE_CURRENT_SOURCE_DIR" : root,
+		"CMAKE_CURRENT_LIST_DIR" : root,
+	}
+	if module is not None:
+		variables["PROJECT_NAME"] = module.name
+		variables["PROJECT_SOURCE_DIR"] = module.root
+	for m in _CMAKE_COMMAND_REGEX.finditer(text):
+		command = m.group("name").lower()
+		args = _split_args(m.group("args"), variables)
+		if len(args) == 0:
+			continue
+
+		if command == "project":
+			module = Module(args[0], root)
+			variables["PROJECT_NAME"] = args[0]
+			variables["PROJECT_SOURCE_DIR"] = root
+		elif command == "set":
+			values = args[1:]
+			for v in ("CACHE", "PARENT_SCOPE"):
+				if v in values:
+					values = values[:values.index(v)]
+			variables[args[0]] = " ".join(values)
+		elif module is None:
+			continue
+		elif command in ("add_library", "add_executable"):
+			if "IMPORTED" not in args[1:] and "$" not in args[0]:
+				module.targets.append(args[0])
+		elif command == "target_link_libraries":
+			for v in args[1:]:
+				if v in _CMAKE_LINK_KEYWORDS or "$" in v or v.startswith("-"):
+					continue
+				if v not in module.links:
+					module.links.append(v)
+		elif command in _CMAKE_GIT_DEPENDENCY_COMMANDS and len(args) >= 3:
+			if "$" in args[0] or "$" in args[1]:
+				continue
+			module.git_deps.append(GitDependency(
+				os.path.normpath(os.path.join(root, args[0])),
+				args[1],
+				args[2],
+				args[3] if len(args) > 3 else None))
+	return module
+
+def _scan_modules(source_root : str, modules : "dict[str, Module]"):
+	owners = {}
+	for root, dirs, files in os.walk(source_root):
+		dirs[:] = sorted(v for v in dirs if not v.startswith("_") and not v.startswith("."))
+		parent = owners.get(os.path.dirname(root))
+		if "CMakeLists.txt" not in files:
+			owners[root] = parent
+			continue
+
+		module = _read_cmakelists(os.path.join(root, "CMakeLists.txt"), parent)
+		if module is not None and module is not parent:
+			if module.name in modules:
+				hubris.log_warn(f"Module {module.name} at {root} has the same name as the one at {modules[module.name].root}, ignoring it")
+				module = parent
+			else:
+				modules[module.name] = module
+		owners[root] = module
+
+def find_modules(source_root : "str | pathlib.Path") -> "dict[str, Module]" :
+	"""
+	Finds the modules of a tree, keyed by name, along with the cloned git dependencies they
+	declare. Build/output ("_*") and hidden directories are skipped unless a git dependency
+	was cloned in one. Dependencies between them are filled in from the targets they link against.
+	"""
+	modules = {}
+	_scan_modules(os.path.abspath(str(source_root)), modules)
+
+	# Git dependencies are often cloned to directories the scan skips
+	scanned = set()
+	while True:
+		paths = [d.path for v in list(modules.values()) for d in v.git_deps]
+		paths = [v for v in paths if v not in scanned and os.path.isfile(os.path.join(v, "CMakeLists.txt"))]
+		if len(paths) == 0:
+			break
+		for v in paths:
+			scanned.add(v)
+			if not any(m.root == v for m in modules.values()):
+				_scan_modules(v, modules)
+
+	owners = {}
+	for module in modules.values():
+		for v in module.targets:
+			owners[v] = module.name
+	for module in modules.values():
+		deps = set()
+		for v in module.links + [d.target for d in module.git_deps]:
+			name = owners.get(v)
+			if name is not None and name != module.name:
+				deps.add(name)
+		module.deps = sorted(deps)
+	return modules
+
+def sort_modules(modules : "dict[str, Module]") -> "list[Module] | None" :
+	"""
+	Orders modules so every module comes after the modules it depends on.
+	Returns None if they depend on each other in a cycle.
+	"""
+	o = []
+	state = {}
+
+	def visit(name : str, path : "list[str]") -> bool :
+		if state.get(name) == 2:
+			return True
+		if state.get(name) == 1:
+			cycle = path[path.index(name):] + [name]
+			hubris.log_error(f"Modules depend on each other in a cycle : {' -> '.join(cycle)}")
+			return False
+		state[name] = 1
+		for v in modules[name].deps:
+			if not visit(v, path + [name]):
+				return False
+		state[name] = 2
+		o.append(modules[name])
+		return True
+
+	for v in sorted(modules):
+		if not visit(v, []):
+			return None
+	return o
+
+
+class ModuleState:
+	built="built"
+	up_to_date="up to date"
+	failed="failed"
+	# Not built as a module it depends on failed
+	blocked="blocked"
+	# Reported no errors, but the build failed with errors it couldn't tell the module of
+	unfinished="not finished"
+	# None of its targets are part of the configured tree, ie it is only added on another platform
+	skipped="not configured"
+
+
+class ModuleResult:
+	"""
+	Outcome of building a single module.
+
+	diagnostics : Diagnostics reported by the build.
+	elapsed : Wall time in seconds spent configuring and building.
+	"""
+	__slots__ = ("module", "state", "diagnostics", "elapsed", "error")
+
+	@property
+	def ok(self) -> bool :
+		return self.state in (ModuleState.built, ModuleState.up_to_date, ModuleState.skipped)
+
+	@property
+	def errors(self) -> "list[Diagnostic]" :
+		return [v for v in self.diagnostics if v.is_error()]
+
+	@property
+	def warnings(self) -> "list[Diagnostic]" :
+		return [v for v in self.diagnostics if v.severity == DiagnosticSeverity.warning]
+
+	def __str__(self) -> str :
+		if self.state in (ModuleState.built, ModuleState.failed):
+			return f"{self.module} {self.state} ({self.elapsed:.2f}s, {len(self.errors)} error(s), {len(self.warnings)} warning(s))"
+		return f"{self.module} {self.state}"
+
+	def __init__(self, module : Module, state : str = ModuleState.failed):
+		self.module = module
+		self.state = state
+		self.diagnostics : "list[Diagnostic]" = []
+		self.elapsed = 0.0
+		self.error : "BaseException | None" = None
+
+
+def _hash_file(h, path : str):
+	h.update(path.replace("\\", "/").encode())
+	h.update(b"\0")
+	try:
+		with open(path, "rb") as f:
+			h.update(f.read())
+	except OSError:
+		# Generated sources may only appear once built, their inputs are hashed instead
+		pass
+	h.update(b"\0")
+
+def _is_under(path : str, root : str) -> bool :
+	return os.path.commonpath([os.path.normcase(path), os.path.normcase(root)]) == os.path.normcase(root)
+
+def _owner(path : "str | None", modules : "list[Module]") -> "Module | None" :
+	"""
+	Finds the innermost module whose directory holds path.
+	"""
+	if path is None or not os.path.isabs(path):
+		return None
+	o = None
+	for v in modules:
+		if _is_under(path, v.root) and (o is None or len(v.root) > len(o.root)):
+			o = v
+	return o
+
+def _make_fingerprints(order : "list[Module]", modules : "dict[str, Module]", model : CodeModel,
+	tool_args : dict) -> "dict[str, str]" :
+	"""
+	Hashes the sources of every module, without those of the modules nested in it, the sources
+	its targets compile from elsewhere, the CMake files of the tree as they may change any
+	target's flags, along with the fingerprints of the modules it depends on so a change
+	anywhere below rebuilds it.
+	"""
+	h = hashlib.sha256()
+	h.update(repr(sorted((k, repr(v)) for k, v in tool_args.items())).encode())
+	for v in sorted(model.cmake_inputs):
+		_hash_file(h, v)
+	common = h.hexdigest()
+
+	o = {}
+	for module in order:
+		nested = [v.root for v in modules.values() if v is not module and _is_under(v.root, module.root)]
+		h = hashlib.sha256()
+		h.update(common.encode())
+		h.update(hash_source_tree(module.root, exclude=nested).encode())
+		for target in module.targets:
+			if target not in model.targets:
+				continue
+			for v in model.targets[target].sources:
+				if not _is_under(v, module.root) or any(_is_under(v, n) for n in nested):
+					_hash_file(h, v)
+		for v in module.deps:
+			h.update(f"{v}={o[v]}\n".encode())
+		o[module.name] = h.hexdigest()
+	return o
+
+def _read_state(path : pathlib.Path) -> "dict[str, str]" :
+	try:
+		return json.loads(path.read_text())
+	except (OSError, ValueError):
+		return {}
+
+def _step_owner(output : str, target_owners : "dict[str, Module]", artifact_owners : "dict[str, Module]",
+	build_root : pathlib.Path) -> "Module | None" :
+	"""
+	Finds the module owning the target a build step is part of, from the step's output.
+	"""
+	output = output.replace("\\", "/")
+	match = _TARGET_STEP_REGEX.search(output)
+	if match:
+		return target_owners.get(match.group("target"))
+	return artifact_owners.get(os.path.normcase(os.path.normpath(os.path.join(str(build_root), output))))
+
+def _build_targets(tool, stale : "list[Module]", targets : "dict[str, list[str]]", model : CodeModel,
+	build_args : dict) -> "dict[str, ModuleResult]" :
+	"""
+	Builds the targets of every stale module with a single build that keeps going past
+	failures. The errors following a failed step go to the module owning the step's target,
+	other diagnostics to the module of the file they are about, and those about no module to
+	every module. When the build fails, the modules that reported no errors built unless some
+	errors couldn't be told a module, or none could and they all failed.
+	"""
+	results = { v.name : ModuleResult(v) for v in stale }
+	target_owners = { t : v for v in stale for t in targets[v.name] }
+	artifact_owners = { os.path.normcase(os.path.normpath(a)) : v for t, v in target_owners.items() for a in model.targets[t].artifacts }
+	failed = set()
+	unowned_errors = False
+	step_owner = None
+
+	def collect(diagnostic : Diagnostic):
+		nonlocal step_owner, unowned_errors
+		if diagnostic.message.startswith("FAILED:"):
+			step_owner = _step_owner(diagnostic.file or "", target_owners, artifact_owners, build_args["build_root"])
+		owner = step_owner if diagnostic.is_error() and step_owner is not None else _owner(diagnostic.file, stale)
+		for v in ([owner] if owner is not None else stale):
+			results[v.name].diagnostics.append(diagnostic)
+		if diagnostic.is_error():
+			if owner is not None:
+				failed.add(owner.name)
+			else:
+				unowned_errors = True
+		if build_args.get("on_diagnostic") is not None:
+			build_args["on_diagnostic"](diagnostic)
+
+	stale_targets = [t for v in stale for t in targets[v.name]]
+	start = time.perf_counter()
+	error = None
+	try:
+		# Modules adding no targets themselves, ie one only adding the others, have nothing to build
+		ok = len(stale_targets) == 0 or bool(tool.build(targets=stale_targets, keep_going=True, **dict(build_args, on_diagnostic=collect)))
+	except Exception as exc:
+		ok = False
+		error = exc
+	elapsed = time.perf_counter() - start
+	for v in results.values():
+		if ok:
+			v.state = ModuleState.built
+		elif v.module.name in failed or len(failed) == 0 or error is not None:
+			v.state = ModuleState.failed
+		elif unowned_errors:
+			v.state = ModuleState.unfinished
+		else:
+			v.state = ModuleState.built
+		v.elapsed = elapsed
+		v.error = error
+	return results
+
+def build_modules(tool,
+	modules : "dict[str, Module]",
+	source_root : "str | os.PathLike" = ".",
+	build_root : "str | os.PathLike" = "_build",
+	config : "str | None" = None,
+	jobs : "int | None" = None,
+	hide_warnings : bool = True,
+	generator : "str | None" = None,
+	compiler = None,
+	target_platform : "str | None" = None,
+	env = None,
+	on_diagnostic = None,
+	force : bool = False,
+	**generate_args) -> "list[ModuleResult] | None" :
+	"""
+	Configures the tree at source_root in build_root with tool.generate(), then builds the
+	targets of every module that isn't up to date with a single tool.build(). Returns the
+	results in dependency order, or None if the modules depend on each other in a cycle.
+
+	modules : Modules of the tree, see find_modules().
+	jobs : Job count of the build.
+	force : Build every module, even those that are up to date.
+	generate_args : Forwarded to generate(), ie defs or compiler_cache.
+	"""
+	order = sort_modules(modules)
+	if order is None:
+		return None
+	if len(order) == 0:
+		return []
+
+	source_root = pathlib.Path(source_root)
+	if not source_root.is_absolute():
+		source_root = pathlib.Path(tool.repo_root).joinpath(source_root).resolve()
+	build_root = pathlib.Path(build_root)
+	if not build_root.is_absolute():
+		build_root = pathlib.Path(tool.repo_root).joinpath(build_root).resolve()
+	os.makedirs(build_root, exist_ok=True)
+
+	if not tool.generate(
+		build_root=build_root,
+		source_root=source_root,
+		compiler=compiler,
+		env=env,
+		generator=generator,
+		target_platform=target_platform,
+		**generate_args
+	):
+		for v in order:
+			hubris.log_error(f"{v} not built, the tree failed to configure")
+		return [ModuleResult(v, ModuleState.failed) for v in order]
+
+	build_args = {
+		"config" : config,
+		"build_root" : build_root,
+		"jobs" : jobs,
+		"hide_warnings" : hide_warnings,
+		"compiler" : compiler,
+		"target_platform" : target_platform,
+		"generator" : generator,
+		"env" : env,
+		"on_diagnostic" : on_diagnostic,
+	}
+
+	model = tool.codemodel(build_root, config)
+	if model is None:
+		hubris.log_warn("No CMake code model to find the targets of the modules in, building everything")
+		ok = bool(tool.build(**build_args))
+		return [ModuleResult(v, ModuleState.built if ok else ModuleState.failed) for v in order]
+
+	targets = { v.name : [t for t in v.targets if t in model.targets] for v in order }
+	tool_args = dict(generate_args, config=config, compiler=compiler, target_platform=target_platform,
+		generator=generator)
+	state_path = build_root.joinpath(_STATE_FILE)
+	fingerprints = _make_fingerprints(order, modules, model, tool_args)
+	built = {} if force else _read_state(state_path)
+
+	results : "dict[str, ModuleResult]" = {}
+	stale = []
+	for v in order:
+		if len(v.targets) != 0 and len(targets[v.name]) == 0:
+			results[v.name] = ModuleResult(v, ModuleState.skipped)
+		elif built.get(v.name) == fingerprints[v.name]:
+			# Its fingerprint holds those of its dependencies, so they're up to date as well
+			results[v.name] = ModuleResult(v, ModuleState.up_to_date)
+		else:
+			stale.append(v)
+
+	if len(stale) != 0:
+		hubris.log_info(f"Building module(s) {', '.join(v.name for v in stale)}")
+		results.update(_build_targets(tool, stale, targets, model, build_args))
+
+	for v in order:
+		result = results[v.name]
+		deps = [results[d].state for d in v.deps]
+		if result.state != ModuleState.failed and any(d in (ModuleState.failed, ModuleState.blocked) for d in deps):
+			result = results[v.name] = ModuleResult(v, ModuleState.blocked)
+		elif result.state == ModuleState.built and ModuleState.unfinished in deps:
+			result.state = ModuleState.unfinished
+		if result.state == ModuleState.skipped:
+			hubris.log_warn(f"{result} : none of its targets are part of the configured tree")
+		elif result.ok:
+			hubris.log_info(str(result))
+		else:
+			hubris.log_error(str(result))
+		if result.state == ModuleState.built:
+			built[v.name] = fingerprints[v.name]
+	if any(v.state == ModuleState.built for v in results.values()):
+		state_path.write_text(json.dumps(built, indent=4))
+
+	return [results[v.name] for v in order]
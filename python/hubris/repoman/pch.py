@@ -0,0 +1,258 @@
+#
+# Precompiled headers picked from measured include frequency
+#
+# The include graph of the source tree (see hubris.cpp.include) gives, for every target,
+# the system and dependency headers most of its C++ translation units end up including.
+# Those are written to a pch.hpp per target in the build root and precompiled with
+# target_precompile_headers() from a script CMake includes before project(). The headers
+# are rewritten only when the selection changes, so unchanged selections cost no rebuild.
+#
+
+import hashlib
+import json
+import os
+import pathlib
+import re
+import typing
+
+import hubris
+from hubris.cpp.include import IncludeGraph, scan_includes, tree_stamp
+
+if typing.TYPE_CHECKING:
+	from .fileapi import CodeModel
+
+
+
+# Written to the build root, the headers go in a directory of their own
+_SCRIPT_FILE = "hubris_pch.cmake"
+_HEADER_DIR = "hubris_pch"
+
+# The selection of the last update() and what it was made from, see update()
+_STATE_FILE = "hubris_pch.json"
+
+# Share of a target's translation units that must include a header for it to be precompiled
+DEFAULT_THRESHOLD = 0.5
+
+# Targets with fewer translation units than this gain nothing from a precompiled header
+DEFAULT_MIN_SOURCES = 3
+
+_CXX_SOURCE_EXTENSIONS = (".cc", ".cpp", ".cxx", ".c++", ".mm")
+
+_CMAKE_COMMENT_REGEX = re.compile(r"#.*")
+_CMAKE_PROJECT_REGEX = re.compile(r"\bproject\s*\(\s*([\w.+-]+)", re.IGNORECASE)
+_CMAKE_TARGET_REGEX = re.compile(r"\b(?:add_library|add_executable)\s*\(\s*(?P<name>[\w.+${}-]+)(?P<rest>[^)]*)\)", re.IGNORECASE)
+
+# Libraries without sources of their own
+_CMAKE_SOURCELESS_KEYWORDS = ("INTERFACE", "IMPORTED", "ALIAS")
+
+
+def find_cmake_targets(source_root : "str | pathlib.Path") -> "dict[str, str]" :
+	"""
+	Finds the libraries and executables added by the CMakeLists of a source tree, keyed by
+	name with the directory of the CMakeLists that added them. ${PROJECT_NAME} is resolved,
+	targets named with any other variable are skipped.
+	"""
+	o = {}
+	for root, dirs, files in os.walk(source_root):
+		dirs[:] = [v for v in dirs if not v.startswith("_") and not v.startswith(".")]
+		if "CMakeLists.txt" not in files:
+			continue
+		path = os.path.join(root, "CMakeLists.txt")
+		with open(path, "r", errors="replace") as f:
+			text = _CMAKE_COMMENT_REGEX.sub("", f.read())
+
+		project = _CMAKE_PROJECT_REGEX.search(text)
+		for m in _CMAKE_TARGET_REGEX.finditer(text):
+			name = m.group("name")
+			if project is not None:
+				name = name.replace("${PROJECT_NAME}", project.group(1))
+			if "$" in name:
+				continue
+			if any(v in m.group("rest").split() for v in _CMAKE_SOURCELESS_KEYWORDS):
+				continue
+			o[name] = os.path.abspath(root)
+	return o
+
+def _target_sources(graph : IncludeGraph, targets : "dict[str, str]") -> "dict[str, list[str]]" :
+	"""
+	Assigns every C++ translation unit to the targets of the closest directory above it with any.
+	"""
+	dirs = {}
+	for name, d in targets.items():
+		dirs.setdefault(os.path.normcase(os.path.abspath(d)), []).append(name)
+
+	o = { v : [] for v in targets }
+	for source in graph.sources:
+		if not source.lower().endswith(_CXX_SOURCE_EXTENSIONS):
+			continue
+		d = os.path.dirname(source)
+		while True:
+			names = dirs.get(os.path.normcase(d))
+			if names is not None:
+				for v in names:
+					o[v].append(source)
+				break
+			parent = os.path.dirname(d)
+			if parent == d:
+				break
+			d = parent
+	return o
+
+def select_headers(graph : IncludeGraph, sources : "list[str]",
+	threshold : float = DEFAULT_THRESHOLD) -> "list[str]" :
+	"""
+	Picks the system and dependency headers included by at least threshold of the given
+	translation units, either directly or through an in-tree header. The headers those pull
+	in themselves are internals (ie <bits/...>) that mustn't be included on their own.
+	Headers included inside an #if anywhere are left out, so are those that didn't resolve
+	to a file, ie generated ones, as it isn't known how to reach them.
+	Returns their include names, sorted so the selection is stable.
+	"""
+	if len(sources) == 0:
+		return []
+	counts = {}
+	for v in sources:
+		entries = set()
+		for includer in [v] + [h for h in graph.closure(v) if graph.is_in_tree(h)]:
+			entries.update(graph.includes.get(includer, ()))
+		for header in entries:
+			# Platform specific headers are only ever included conditionally, precompiling them would break
+			if graph.is_external(header) or graph.is_in_tree(header):
+				continue
+			if header in graph.names and header not in graph.conditional:
+				counts[header] = counts.get(header, 0) + 1
+	o = [graph.names[v] for v, n in counts.items() if n / len(sources) >= threshold]
+	return sorted(set(o))
+
+
+class PrecompiledHeaders:
+	"""
+	Precompiled header settings of a build.
+
+	threshold : Share of a target's C++ translation units that must include a header for it to be precompiled.
+	min_sources : Targets with fewer C++ translation units are left alone.
+	targets : Target names with the directory holding their sources, found from the CMakeLists when None.
+	headers : The headers picked for each target by the last update().
+	"""
+
+	def update(self, source_root : "str | pathlib.Path", build_root : "str | pathlib.Path",
+		include_dirs : "list[str | pathlib.Path] | None" = None,
+		model : "CodeModel | None" = None) -> "dict[str, list[str]]" :
+		"""
+		Scans the source tree and rewrites the pch.hpp of every target whose selection changed.
+		The scan is skipped, and the last selection kept, while no source, header or CMakeLists
+		of the tree changed since the last update of the build root with the same settings.
+
+		model : Code model of an earlier configure, gives the exact sources and include
+			directories of every target instead of reading them from the CMakeLists, and the
+			compiler's own include directories that system headers are resolved in.
+		"""
+		if include_dirs is None and model is not None:
+			include_dirs = model.include_dirs(in_tree=False)
+			for toolchain in model.toolchains.values():
+				include_dirs.extend(v for v in toolchain.include_dirs if v not in include_dirs)
+
+		key = hashlib.sha256(repr((
+			tree_stamp(source_root, [build_root]),
+			[str(v) for v in include_dirs] if include_dirs is not None else None,
+			self.threshold,
+			self.min_sources,
+			sorted(self.targets.items()) if self.targets is not None else None,
+			sorted((v.name, v.sources) for v in model.targets.values()) if model is not None else None,
+		)).encode()).hexdigest()
+		state_path = pathlib.Path(build_root).joinpath(_STATE_FILE)
+		try:
+			state = json.loads(state_path.read_text())
+			if state["key"] == key:
+				self.headers = state["headers"]
+				return self.headers
+		except (OSError, ValueError, KeyError):
+			pass
+
+		graph = scan_includes(source_root, include_dirs)
+
+		if model is not None and self.targets is None:
+			scanned = set(graph.sources)
+			target_sources = {}
+			for target in model.targets.values():
+				sources = [v for v in target.sources if v in scanned and v.lower().endswith(_CXX_SOURCE_EXTENSIONS)]
+				if len(sources) != 0:
+					target_sources[target.name] = sources
+		else:
+			target_sources = _target_sources(graph, self.targets or find_cmake_targets(graph.source_root))
+
+		header_dir = pathlib.Path(build_root).joinpath(_HEADER_DIR)
+		if not header_dir.exists():
+			os.makedirs(header_dir)
+
+		self.headers = {}
+		for target, sources in sorted(target_sources.items()):
+			if len(sources) < self.min_sources:
+				continue
+			headers = select_headers(graph, sources, self.threshold)
+			if len(headers) == 0:
+				continue
+			self.headers[target] = headers
+
+			text = "// Generated by hubris.repoman from measured include frequency, changes are overwritten\n"
+			text += "#pragma once\n\n"
+			text += "".join(f"#include <{v}>\n" for v in headers)
+			path = header_dir.joinpath(target + ".hpp")
+			if not path.exists() or path.read_text() != text:
+				path.write_text(text)
+				hubris.log_info(f"Precompiling {len(headers)} header(s) for {target}")
+
+		state_path.write_text(json.dumps({ "key" : key, "headers" : self.headers }))
+		return self.headers
+
+	def make_script(self, build_root : "str | pathlib.Path") -> str :
+		"""
+		Makes the CMAKE_PROJECT_INCLUDE_BEFORE script adding the pch.hpp files to their targets.
+		"""
+		header_dir = pathlib.Path(build_root).joinpath(_HEADER_DIR)
+		lines = [
+			"# Generated by hubris.repoman, changes are overwritten",
+			"include_guard(GLOBAL)",
+			"if (NOT HUBRIS_PCH)",
+			"	return()",
+			"endif()",
+			"",
+			"function(_hubris_apply_pch)",
+		]
+		for target in sorted(self.headers):
+			path = str(header_dir.joinpath(target + ".hpp")).replace("\\", "/")
+			lines.extend([
+				f"	if (TARGET {target})",
+				f'		target_precompile_headers({target} PRIVATE "$<$<COMPILE_LANGUAGE:CXX>:{path}>")',
+				"	endif()",
+			])
+		lines.extend([
+			"endfunction()",
+			"",
+			"# Run once every target of the project has been defined",
+			"cmake_language(DEFER DIRECTORY ${CMAKE_SOURCE_DIR} CALL _hubris_apply_pch)",
+			"",
+		])
+		return "\n".join(lines)
+
+	def make_defs(self, build_root : "str | pathlib.Path") -> "list[str]" :
+		"""
+		Writes the script to the build root and returns the definitions enabling it.
+		"""
+		script_path = pathlib.Path(build_root).joinpath(_SCRIPT_FILE)
+		script = self.make_script(build_root)
+		if not script_path.exists() or script_path.read_text() != script:
+			script_path.write_text(script)
+		return [
+			"-DHUBRIS_PCH=ON",
+			f"-DCMAKE_PROJECT_INCLUDE_BEFORE={str(script_path)}",
+		]
+
+	def __init__(self,
+		threshold : float = DEFAULT_THRESHOLD,
+		min_sources : int = DEFAULT_MIN_SOURCES,
+		targets : "dict[str, str] | None" = None):
+		self.threshold = threshold
+		self.min_sources = min_sources
+		self.targets = targets
+		self.headers : "dict[str, list[str]]" = {}
@@ -5,6 +5,8 @@ import hubris.depget as depget
 
 from .cmake import CMake
 from .cmake import Compiler as CMakeCompiler
+from .matrix import build_matrix, make_matrix
+from .modules import build_modules, find_modules
 
 from pathlib import Path
 
@@ -43,7 +45,22 @@ class RepoMan_Windows:
 				failed = True
 		return not failed
 
-	def build(self, **tool_args):
+	def build(self, configs : "list[str] | None" = None, since : "str | None" = None, **tool_args):
+		"""
+		Configures and builds the repo with generate_and_build().
+
+		configs : Build these configs at once with build_matrix() instead, each with tool_args.
+		since : Only build and test the targets affected by the changes since a revision, see build_affected().
+		"""
+		if since is not None:
+			configs = configs or [tool_args.pop("config", None)]
+			return all(self.build_affected(since, config=v, **tool_args) for v in configs)
+		if configs is not None:
+			compiler = tool_args.pop("compiler", None)
+			results = self.build_matrix(configs, [compiler] if compiler is not None else None, **tool_args)
+			for v in results:
+				hubris.log_info(str(v))
+			return all(v.ok for v in results)
 		if not self.tool.generate_and_build(**tool_args):
 			return False
 		return True
@@ -58,6 +75,55 @@ class RepoMan_Windows:
 			return False
 
 		return True
+
+	def build_matrix(self,
+		configs : "list[str] | None" = None,
+		compilers : "list[CMakeCompiler] | None" = None,
+		build_root : "str | Path" = "_build",
+		jobs : "int | None" = None,
+		**tool_args):
+		"""
+		Builds every config and compiler pair at once, each in its own build root under build_root,
+		sharing a budget of jobs. Returns a list of matrix.VariantResult in the matrix order.
+		"""
+		if configs is None:
+			configs = ["Debug", "Release"]
+		variants = make_matrix(configs, compilers, build_root)
+		return build_matrix(self.tool, variants, jobs=jobs, **tool_args)
+
+	def build_modules(self,
+		source_root : "str | Path" = ".",
+		build_root : "str | Path" = "_build",
+		jobs : "int | None" = None,
+		force : bool = False,
+		**tool_args):
+		"""
+		Configures the repo once and builds the targets of every module and its git dependencies
+		in dependency order, skipping those that didn't change since their last build.
+		Returns False if any failed.
+		"""
+		source_root = Path(source_root)
+		if not source_root.is_absolute():
+			source_root = Path(self.tool.repo_root).joinpath(source_root)
+		modules = find_modules(source_root)
+		results = build_modules(self.tool, modules, source_root=source_root, build_root=build_root, jobs=jobs,
+			force=force, **tool_args)
+		if results is None:
+			return False
+		return all(v.ok for v in results)
+
+	def build_affected(self, since : str, **tool_args):
+		"""
+		Builds and tests only the targets affected by the changes since a revision, see CMake.build_affected().
+		"""
+		ok, _ = self.tool.build_affected(since, **tool_args)
+		return ok
+
+	def build_and_install(self, **tool_args):
+		if not self.tool.build_and_install(**tool_args):
+			return False
+		return True
+
 	def install(self, **tool_args):
 		if not self.tool.install(**tool_args):
 			return False
@@ -0,0 +1,411 @@
+#
+# Build timing reports read from .ninja_log
+#
+# Ninja appends a line per finished edge to .ninja_log in the build root. The edges a
+# build logged, found by comparing the log with its entries from before, are turned into per translation unit and per target timings,
+# the critical path through the build graph and how well the jobs were kept busy.
+#
+
+import collections
+import json
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+
+import hubris
+
+
+
+NINJA_LOG_FILE = ".ninja_log"
+
+_NINJA_LOG_HEADER_REGEX = re.compile(r"^# ninja log v(\d+)")
+
+# Oldest .ninja_log format with the (start, end, mtime, output, hash) columns
+_NINJA_LOG_MIN_VERSION = 5
+
+# Object files CMake writes, ie "CMakeFiles/target.dir/src/file.cpp.o"
+_OBJECT_REGEX = re.compile(r"^(?:.*/)?CMakeFiles/(?P<target>[^/]+)\.dir/(?P<source>.+?)\.(?:o|obj)$")
+
+# Nodes and edges of `ninja -t graph` output
+_GRAPH_NODE_REGEX = re.compile(r'^"(?P<id>0x[0-9a-f]+)" \[label="(?P<label>[^"]*)"(?P<rest>.*)\]$')
+_GRAPH_EDGE_REGEX = re.compile(r'^"(?P<src>0x[0-9a-f]+)" -> "(?P<dst>0x[0-9a-f]+)"')
+
+# Events of clang's -ftime-trace output that are worth reporting
+_TIME_TRACE_SOURCE_EVENT = "Source"
+
+_DEFAULT_TOP_COUNT = 10
+
+
+class EdgeTiming:
+	"""
+	A single build step from .ninja_log, times are in milliseconds since the build started.
+
+	outputs : Every file the step produced.
+	target : The CMake target the step belongs to, or its first output for steps outside of one (ie links).
+	source : The translation unit for compile steps, None otherwise.
+	"""
+	__slots__ = ("outputs", "start", "end", "target", "source")
+
+	@property
+	def duration(self) -> int :
+		return self.end - self.start
+
+	def to_dict(self) -> dict :
+		return {
+			"outputs" : self.outputs,
+			"target" : self.target,
+			"source" : self.source,
+			"start" : self.start,
+			"end" : self.end,
+			"duration" : self.duration,
+		}
+
+	def __init__(self, outputs : "list[str]", start : int, end : int):
+		self.outputs = outputs
+		self.start = start
+		self.end = end
+
+		match = _OBJECT_REGEX.match(outputs[0])
+		if match:
+			self.target = match.group("target")
+			self.source = match.group("source")
+		else:
+			self.target = outputs[0]
+			self.source = None
+
+
+class TargetTiming:
+	"""
+	Time spent building a target, the sum of its steps, in milliseconds.
+	"""
+	__slots__ = ("name", "duration", "steps")
+
+	def to_dict(self) -> dict :
+		return {
+			"name" : self.name,
+			"duration" : self.duration,
+			"steps" : self.steps,
+		}
+
+	def __init__(self, name : str, duration : int = 0, steps : int = 0):
+		self.name = name
+		self.duration = duration
+		self.steps = steps
+
+
+class HeaderTiming:
+	"""
+	Time clang spent parsing a header across every translation unit with -ftime-trace, in milliseconds.
+	"""
+	__slots__ = ("path", "duration", "count")
+
+	def to_dict(self) -> dict :
+		return {
+			"path" : self.path,
+			"duration" : self.duration,
+			"count" : self.count,
+		}
+
+	def __init__(self, path : str, duration : float = 0.0, count : int = 0):
+		self.path = path
+		self.duration = duration
+		self.count = count
+
+
+class BuildReport:
+	"""
+	Timing of the most recent ninja build in a build root, durations are in milliseconds.
+
+	edges : Every step of the build in the order they started.
+	wall_time : Time from the first step starting to the last one finishing.
+	total_time : Sum of the duration of every step.
+	critical_path : Length of the longest chain of dependent steps, None if it wasn't asked for or the
+		build graph couldn't be read.
+	parallelism : Average number of steps running at once.
+	utilization : parallelism as a fraction of the job count, None if the job count isn't known.
+	headers : Header parse times from -ftime-trace, empty unless it was requested.
+	"""
+
+	def slowest_units(self, count : int = _DEFAULT_TOP_COUNT) -> "list[EdgeTiming]" :
+		units = [v for v in self.edges if v.source is not None]
+		units.sort(key=lambda v: v.duration, reverse=True)
+		return units[:count]
+
+	def slowest_targets(self, count : int = _DEFAULT_TOP_COUNT) -> "list[TargetTiming]" :
+		targets = {}
+		for v in self.edges:
+			target = targets.get(v.target)
+			if target is None:
+				target = targets[v.target] = TargetTiming(v.target)
+			target.duration += v.duration
+			target.steps += 1
+		o = sorted(targets.values(), key=lambda v: v.duration, reverse=True)
+		return o[:count]
+
+	def slowest_headers(self, count : int = _DEFAULT_TOP_COUNT) -> "list[HeaderTiming]" :
+		o = sorted(self.headers, key=lambda v: v.duration, reverse=True)
+		return o[:count]
+
+	def to_dict(self, count : int = _DEFAULT_TOP_COUNT) -> dict :
+		return {
+			"wall_time" : self.wall_time,
+			"total_time" : self.total_time,
+			"critical_path" : self.critical_path,
+			"parallelism" : self.parallelism,
+			"utilization" : self.utilization,
+			"jobs" : self.jobs,
+			"steps" : len(self.edges),
+			"slowest_targets" : [v.to_dict() for v in self.slowest_targets(count)],
+			"slowest_units" : [v.to_dict() for v in self.slowest_units(count)],
+			"slowest_headers" : [v.to_dict() for v in self.slowest_headers(count)],
+		}
+
+	def write_json(self, path : "str | pathlib.Path", count : int = _DEFAULT_TOP_COUNT):
+		with open(path, "w") as f:
+			json.dump(self.to_dict(count), f, indent=4)
+
+	def write_chrome_trace(self, path : "str | pathlib.Path"):
+		"""
+		Writes the steps in the Chrome trace event format, viewable in chrome://tracing or Perfetto.
+		Each step is placed on the first lane that is free when it starts.
+		"""
+		lanes : "list[int]" = []
+		events = []
+		for v in self.edges:
+			for n, end in enumerate(lanes):
+				if end <= v.start:
+					lanes[n] = v.end
+					break
+			else:
+				n = len(lanes)
+				lanes.append(v.end)
+			events.append({
+				"name" : v.source or ", ".join(v.outputs),
+				"cat" : v.target,
+				"ph" : "X",
+				"ts" : v.start * 1000,
+				"dur" : v.duration * 1000,
+				"pid" : 0,
+				"tid" : n,
+				"args" : { "outputs" : v.outputs },
+			})
+		with open(path, "w") as f:
+			json.dump({ "traceEvents" : events, "displayTimeUnit" : "ms" }, f)
+
+	def __init__(self, edges : "list[EdgeTiming]", critical_path : "int | None" = None,
+		jobs : "int | None" = None, headers : "list[HeaderTiming] | None" = None):
+		self.edges = sorted(edges, key=lambda v: v.start)
+		self.critical_path = critical_path
+		self.jobs = jobs
+		self.headers = headers or []
+
+		self.total_time = sum(v.duration for v in self.edges)
+		if len(self.edges) != 0:
+			self.wall_time = max(v.end for v in self.edges) - min(v.start for v in self.edges)
+		else:
+			self.wall_time = 0
+		self.parallelism = self.total_time / self.wall_time if self.wall_time != 0 else 0.0
+		self.utilization = self.parallelism / jobs if jobs else None
+
+
+def read_ninja_log_entries(path : "str | pathlib.Path") -> "dict[str, tuple[int, int, int, str]]" :
+	"""
+	Reads the last (start, end, mtime, command hash) logged for every output of a .ninja_log.
+	Returns an empty dict if there is no log yet.
+	"""
+	o = {}
+	try:
+		f = open(path, "r", errors="replace")
+	except FileNotFoundError:
+		return o
+	with f:
+		header = f.readline()
+		match = _NINJA_LOG_HEADER_REGEX.match(header)
+		if match is None or int(match.group(1)) < _NINJA_LOG_MIN_VERSION:
+			raise ValueError(f"Unsupported ninja log format in {str(path)} : {header.strip()}")
+
+		for line in f:
+			if line.startswith("#"):
+				continue
+			parts = line.rstrip("\r\n").split("\t")
+			if len(parts) < 5:
+				continue
+			o[parts[3]] = (int(parts[0]), int(parts[1]), int(parts[2]), parts[4])
+	return o
+
+def read_ninja_log(path : "str | pathlib.Path",
+	before : "dict[str, tuple[int, int, int, str]] | None" = None) -> "list[EdgeTiming]" :
+	"""
+	Reads the steps of a .ninja_log, the last one logged for every output.
+
+	before : The log's entries from before a build (see read_ninja_log_entries()), only the
+		steps the build logged since are read. Ninja recompacts the log in no particular order,
+		so which lines belong to a build can't be told from the file alone.
+	"""
+	# Steps keyed by command hash and times, a step with several outputs has a line per output
+	edges : "collections.OrderedDict[tuple, EdgeTiming]" = collections.OrderedDict()
+	for output, entry in read_ninja_log_entries(path).items():
+		if before is not None and before.get(output) == entry:
+			continue
+		start, end, _, command_hash = entry
+		edge = edges.get((command_hash, start, end))
+		if edge is not None:
+			edge.outputs.append(output)
+		else:
+			edges[(command_hash, start, end)] = EdgeTiming([output], start, end)
+	return list(edges.values())
+
+
+def _read_build_graph(build_root : pathlib.Path) -> "dict[str, list[str]] | None" :
+	"""
+	Reads the direct inputs of every output from `ninja -t graph`, None if ninja couldn't be run.
+	"""
+	ninja = shutil.which("ninja")
+	if ninja is None:
+		return None
+	try:
+		proc = subprocess.Popen([ninja, "-C", str(build_root), "-t", "graph"],
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, errors="replace")
+	except OSError:
+		return None
+
+	labels = {}
+	step_nodes = set()
+	edges = collections.defaultdict(list)
+	for line in proc.stdout:
+		line = line.strip()
+		match = _GRAPH_EDGE_REGEX.match(line)
+		if match:
+			edges[match.group("dst")].append(match.group("src"))
+			continue
+		match = _GRAPH_NODE_REGEX.match(line)
+		if match:
+			labels[match.group("id")] = match.group("label")
+			# Steps with several inputs or outputs are drawn as their own (ellipse) node
+			if "ellipse" in match.group("rest"):
+				step_nodes.add(match.group("id"))
+	proc.stdout.close()
+	if proc.wait() != 0:
+		return None
+
+	def files(node : str) -> "list[str]" :
+		if node in step_nodes:
+			o = []
+			for v in edges.get(node, []):
+				o.extend(files(v))
+			return o
+		return [labels.get(node, node)]
+
+	inputs = {}
+	for dst, srcs in edges.items():
+		if dst in step_nodes:
+			continue
+		o = []
+		for v in srcs:
+			o.extend(files(v))
+		inputs[labels.get(dst, dst)] = o
+	return inputs
+
+def _critical_path(edges : "list[EdgeTiming]", inputs : "dict[str, list[str]]") -> int :
+	"""
+	Longest chain of dependent steps weighted by how long each took in the build.
+	Files that weren't rebuilt cost nothing.
+	"""
+	durations = {}
+	for v in edges:
+		for output in v.outputs:
+			durations[output] = v.duration
+
+	memo = {}
+	visiting = set()
+	for root in inputs:
+		# Iterative post order walk, build graphs can be deeper than the recursion limit
+		stack = [(root, False)]
+		while len(stack) != 0:
+			node, expanded = stack.pop()
+			if node in memo:
+				continue
+			deps = inputs.get(node, [])
+			if expanded:
+				visiting.discard(node)
+				memo[node] = durations.get(node, 0) + max((memo.get(v, 0) for v in deps), default=0)
+				continue
+			# Already being walked, either queued twice or part of a cycle
+			if node in visiting:
+				continue
+			visiting.add(node)
+			stack.append((node, True))
+			for v in deps:
+				if v not in memo and v not in visiting:
+					stack.append((v, False))
+	return max(memo.values(), default=0)
+
+
+def _read_time_traces(build_root : pathlib.Path, edges : "list[EdgeTiming]") -> "list[HeaderTiming]" :
+	"""
+	Sums the header parse times of the -ftime-trace json clang writes next to each object file.
+	"""
+	headers = {}
+	for v in edges:
+		if v.source is None:
+			continue
+		output = v.outputs[0]
+		trace_path = build_root.joinpath(os.path.splitext(output)[0] + ".json")
+		try:
+			with open(trace_path, "r") as f:
+				trace = json.load(f)
+		except (OSError, ValueError):
+			continue
+		for event in trace.get("traceEvents", []):
+			if event.get("name") != _TIME_TRACE_SOURCE_EVENT or event.get("ph") != "X":
+				continue
+			path = event.get("args", {}).get("detail")
+			if path is None:
+				continue
+			header = headers.get(path)
+			if header is None:
+				header = headers[path] = HeaderTiming(path)
+			header.duration += event.get("dur", 0) / 1000.0
+			header.count += 1
+	return list(headers.values())
+
+
+def make_build_report(build_root : "str | pathlib.Path",
+	jobs : "int | None" = None,
+	time_trace : bool = False,
+	critical_path : bool = False,
+	before : "dict[str, tuple[int, int, int, str]] | None" = None) -> "BuildReport | None" :
+	"""
+	Reads a build of a ninja build root, None if it has no .ninja_log.
+
+	jobs : Job count the build ran with, used for the utilization.
+	time_trace : Also read clang -ftime-trace output for header parse times.
+	critical_path : Also work out the critical path, this runs `ninja -t graph` which loads
+		the whole build graph again.
+	before : Entries of the log from before the build, see read_ninja_log(). Without them
+		every step the log holds is reported.
+	"""
+	build_root = pathlib.Path(build_root)
+	log_path = build_root.joinpath(NINJA_LOG_FILE)
+	if not log_path.exists():
+		return None
+
+	try:
+		edges = read_ninja_log(log_path, before)
+	except (OSError, ValueError) as exc:
+		hubris.log_warn(f"Failed to read {str(log_path)} : {exc}")
+		return None
+
+	path_length = None
+	if critical_path:
+		inputs = _read_build_graph(build_root)
+		if inputs is not None:
+			path_length = _critical_path(edges, inputs)
+
+	headers = None
+	if time_trace:
+		headers = _read_time_traces(build_root, edges)
+
+	return BuildReport(edges, critical_path=path_length, jobs=jobs, headers=headers)
@@ -0,0 +1,254 @@
+#
+# Unity (jumbo) builds
+#
+# CMake's CMAKE_UNITY_BUILD compiles batches of a target's sources as one translation
+# unit so shared headers are parsed once per batch. Per target batch sizes and sources
+# that don't compile in a batch are applied by a script CMake includes after project(),
+# and deferred until the targets exist, which needs CMake 3.19.
+#
+
+import json
+import os
+import pathlib
+import re
+import typing
+
+import hubris
+
+if typing.TYPE_CHECKING:
+	from .buildlog import Diagnostic
+
+
+
+# Written to the build root, see UnityBuild.save()
+_STATE_FILE = "hubris_unity.json"
+_SCRIPT_FILE = "hubris_unity.cmake"
+
+DEFAULT_BATCH_SIZE = 8
+
+# Unity sources CMake generates, ie "CMakeFiles/target.dir/Unity/unity_0_cxx.cxx.o"
+_UNITY_OBJECT_REGEX = re.compile(r"(?:^|/)CMakeFiles/(?P<target>[^/]+)\.dir/Unity/unity_\d+_\w+\.\w+\.(?:o|obj)$")
+
+_UNITY_SOURCE_REGEX = re.compile(r"/Unity/unity_\d+_\w+\.\w+$")
+
+# Any object of a target, ie "CMakeFiles/target.dir/src/a.cpp.o"
+_OBJECT_REGEX = re.compile(r"(?:^|/)CMakeFiles/(?P<target>[^/]+)\.dir/.+\.(?:o|obj)$")
+
+_SOURCE_EXTENSIONS = (".c", ".cc", ".cpp", ".cxx", ".c++", ".m", ".mm")
+
+
+def _cmake_quote(s : str) -> str :
+	return '"' + s.replace("\\", "/").replace('"', '\\"') + '"'
+
+
+class UnityBuild:
+	"""
+	Unity build settings of a build root.
+
+	batch_size : Sources per unity translation unit, 0 puts every source of a target in one.
+	target_batch_sizes : Batch size overrides keyed by target name.
+	excluded_sources : Sources compiled on their own, keyed by target name.
+	disabled_targets : Targets built without unity, used when a failure couldn't be pinned on a source.
+	baseline_time : Total step time of the last build before unity was enabled, in milliseconds.
+	pending : Exclusions found by a failed build that aren't saved until a build with them succeeds,
+		(target, source) pairs with None as the source of a disabled target.
+	"""
+
+	def make_script(self) -> str :
+		"""
+		Makes the CMAKE_PROJECT_INCLUDE script applying the per target settings.
+		"""
+		lines = [
+			"# Generated by hubris.repoman, changes are overwritten",
+			"include_guard(GLOBAL)",
+			"if (NOT CMAKE_UNITY_BUILD)",
+			"	return()",
+			"endif()",
+			"",
+			"function(_hubris_apply_unity)",
+		]
+		for target, size in sorted(self.target_batch_sizes.items()):
+			lines.extend([
+				f"	if (TARGET {target})",
+				f"		set_target_properties({target} PROPERTIES UNITY_BUILD_BATCH_SIZE {int(size)})",
+				"	endif()",
+			])
+		for target in sorted(self.disabled_targets):
+			lines.extend([
+				f"	if (TARGET {target})",
+				f"		set_target_properties({target} PROPERTIES UNITY_BUILD OFF)",
+				"	endif()",
+			])
+		for target, sources in sorted(self.excluded_sources.items()):
+			if len(sources) == 0:
+				continue
+			quoted = " ".join(_cmake_quote(v) for v in sorted(sources))
+			lines.extend([
+				f"	if (TARGET {target})",
+				f"		set_source_files_properties({quoted} TARGET_DIRECTORY {target} PROPERTIES SKIP_UNITY_BUILD_INCLUSION ON)",
+				"	endif()",
+			])
+		lines.extend([
+			"endfunction()",
+			"",
+			"# Run once every target of the project has been defined",
+			"cmake_language(DEFER DIRECTORY ${CMAKE_SOURCE_DIR} CALL _hubris_apply_unity)",
+			"",
+		])
+		return "\n".join(lines)
+
+	def make_defs(self, build_root : pathlib.Path) -> "list[str]" :
+		"""
+		Writes the settings script to the build root and returns the definitions enabling it.
+		"""
+		script_path = pathlib.Path(build_root).joinpath(_SCRIPT_FILE)
+		script_path.write_text(self.make_script())
+		return [
+			"-DCMAKE_UNITY_BUILD=ON",
+			f"-DCMAKE_UNITY_BUILD_BATCH_SIZE={int(self.batch_size)}",
+			f"-DCMAKE_PROJECT_INCLUDE={str(script_path)}",
+		]
+
+	def exclude(self, target : str, source : str) -> bool :
+		"""
+		Excludes a source of a target from unity batches, returns False if it already was.
+		"""
+		sources = self.excluded_sources.setdefault(target, [])
+		if source in sources:
+			return False
+		sources.append(source)
+		return True
+
+	def disable(self, target : str) -> bool :
+		if target in self.disabled_targets:
+			return False
+		self.disabled_targets.append(target)
+		return True
+
+	def merge(self, other : "UnityBuild"):
+		"""
+		Adds the exclusions and baseline found by an earlier build.
+		"""
+		for target, sources in other.excluded_sources.items():
+			for v in sources:
+				self.exclude(target, v)
+		for v in other.disabled_targets:
+			self.disable(v)
+		if self.baseline_time is None:
+			self.baseline_time = other.baseline_time
+
+	def save(self, build_root : pathlib.Path):
+		excluded_sources = {}
+		for target, sources in self.excluded_sources.items():
+			kept = [v for v in sources if (target, v) not in self.pending]
+			if len(kept) != 0:
+				excluded_sources[target] = kept
+		data = {
+			"batch_size" : self.batch_size,
+			"target_batch_sizes" : self.target_batch_sizes,
+			"excluded_sources" : excluded_sources,
+			"disabled_targets" : [v for v in self.disabled_targets if (v, None) not in self.pending],
+			"baseline_time" : self.baseline_time,
+		}
+		pathlib.Path(build_root).joinpath(_STATE_FILE).write_text(json.dumps(data, indent=4))
+
+	@staticmethod
+	def load(build_root : pathlib.Path) -> "UnityBuild | None" :
+		try:
+			data = json.loads(pathlib.Path(build_root).joinpath(_STATE_FILE).read_text())
+			return UnityBuild(
+				batch_size=data["batch_size"],
+				target_batch_sizes=data["target_batch_sizes"],
+				excluded_sources=data["excluded_sources"],
+				disabled_targets=data["disabled_targets"],
+				baseline_time=data["baseline_time"])
+		except (OSError, ValueError, KeyError):
+			return None
+
+	def __init__(self,
+		batch_size : int = DEFAULT_BATCH_SIZE,
+		target_batch_sizes : "dict[str, int] | None" = None,
+		excluded_sources : "dict[str, list[str]] | None" = None,
+		disabled_targets : "list[str] | None" = None,
+		baseline_time : "int | None" = None):
+		self.batch_size = batch_size
+		self.target_batch_sizes = dict(target_batch_sizes or {})
+		self.excluded_sources = { k : list(v) for k, v in (excluded_sources or {}).items() }
+		self.disabled_targets = list(disabled_targets or [])
+		self.baseline_time = baseline_time
+		self.pending : "list[tuple[str, str | None]]" = []
+
+
+def _failed_steps(diagnostics : "list[Diagnostic]") -> "list[tuple[str, list[Diagnostic]]]" :
+	"""
+	Groups the errors of a failed build by the ninja "FAILED:" line they follow, as (output, errors).
+	"""
+	o = []
+	for v in diagnostics:
+		if v.message.startswith("FAILED:"):
+			o.append(((v.file or "").replace("\\", "/"), []))
+		elif len(o) != 0 and v.is_error() and v.file is not None:
+			o[-1][1].append(v)
+	return o
+
+
+def exclude_failures(unity : UnityBuild, diagnostics : "list[Diagnostic]", build_root : "str | pathlib.Path") -> bool :
+	"""
+	Excludes the sources whose errors broke a unity translation unit, found from a failed
+	build's diagnostics. A ninja "FAILED:" line is followed by the errors of that step, when
+	none of them are in a source file the whole target is built without unity instead.
+	Relative paths in the diagnostics are relative to the build root the compiler ran in.
+	The exclusions are pending until a build with them succeeds. Returns True if anything
+	new was excluded.
+	"""
+	changed = False
+	for output, errors in _failed_steps(diagnostics):
+		match = _UNITY_OBJECT_REGEX.search(output)
+		if not match:
+			continue
+		target = match.group("target")
+		found_source = False
+		for v in errors:
+			# Errors in the generated unity source itself don't say which source broke it
+			if not v.file.lower().endswith(_SOURCE_EXTENSIONS) or _UNITY_SOURCE_REGEX.search(v.file.replace("\\", "/")):
+				continue
+			found_source = True
+			source = os.path.normpath(os.path.join(str(build_root), v.file))
+			if unity.exclude(target, source):
+				unity.pending.append((target, source))
+				hubris.log_info(f"Excluding {source} from the unity build of {target}")
+				changed = True
+		if not found_source and unity.disable(target):
+			unity.pending.append((target, None))
+			hubris.log_warn(f"Couldn't find the source breaking the unity build of {target}, building it without unity")
+			changed = True
+	return changed
+
+def revert_failures(unity : UnityBuild, diagnostics : "list[Diagnostic]", build_root : "str | pathlib.Path") -> bool :
+	"""
+	Takes back the pending exclusions whose sources failed to compile on their own too, their
+	errors aren't the unity build's. A target built without unity is taken back when any of
+	its sources failed. Returns True if anything was taken back.
+	"""
+	changed = False
+	for output, errors in _failed_steps(diagnostics):
+		match = _OBJECT_REGEX.search(output)
+		if not match or _UNITY_OBJECT_REGEX.search(output):
+			continue
+		target = match.group("target")
+		sources = set(os.path.normpath(os.path.join(str(build_root), v.file)) for v in errors)
+		for v in list(unity.pending):
+			pending_target, source = v
+			if pending_target != target:
+				continue
+			if source is None:
+				unity.disabled_targets.remove(target)
+				hubris.log_info(f"{target} fails without unity too, building it with unity again")
+			elif source in sources:
+				unity.excluded_sources[target].remove(source)
+				hubris.log_info(f"{source} fails on its own too, including it in the unity build of {target} again")
+			else:
+				continue
+			unity.pending.remove(v)
+			changed = True
+	return changed
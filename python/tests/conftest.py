@@ -0,0 +1,8 @@
+#
+# The hubris package is imported from the tree, not an installed copy
+#
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
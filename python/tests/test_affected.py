@@ -0,0 +1,84 @@
+#
+# Mapping changed files to the targets and modules they affect
+#
+
+import os
+
+from hubris.repoman.affected import find_affected
+from hubris.repoman.fileapi import CodeModel, CodeModelTarget
+from hubris.repoman.modules import Module
+
+
+
+def _target(root : str, name : str, sources : "list[str]", deps : "list[str]" = []) -> CodeModelTarget :
+	o = CodeModelTarget(name, f"{name}::@0", "STATIC_LIBRARY", os.path.join(root, name))
+	o.sources = [os.path.join(root, name, v) for v in sources]
+	o.dependencies = [f"{v}::@0" for v in deps]
+	return o
+
+def _model(root : str) -> CodeModel :
+	"""
+	core <- util <- app, with cmake/flags.cmake included by the root CMakeLists.
+	"""
+	targets = [
+		_target(root, "core", ["core.cpp"]),
+		_target(root, "util", ["util.cpp"], ["core"]),
+		_target(root, "app", ["main.cpp"], ["util"]),
+	]
+	inputs = [os.path.join(root, v) for v in ("CMakeLists.txt", "cmake/flags.cmake", "core/CMakeLists.txt",
+		"util/CMakeLists.txt", "app/CMakeLists.txt")]
+	return CodeModel(root, os.path.join(root, "_build"), "Debug", targets, cmake_inputs=inputs)
+
+def _modules(root : str) -> "dict[str, Module]" :
+	o = {}
+	for v in ("core", "util", "app"):
+		o[v] = Module(v, os.path.join(root, v))
+		o[v].targets = [v]
+	return o
+
+
+def test_source_affects_dependents(tmp_path):
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["util/util.cpp"])
+	assert affected.owned == ["util"]
+	assert affected.targets == ["app", "util"]
+
+def test_header_affects_dependents(tmp_path):
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["core/include/core/core.hpp"], _modules(root))
+	assert affected.owned == ["core"]
+	assert affected.targets == ["app", "core", "util"]
+	assert affected.modules == ["app", "core", "util"]
+
+def test_leaf_header_affects_only_its_target(tmp_path):
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["app/app.hpp"], _modules(root))
+	assert affected.targets == ["app"]
+	assert affected.modules == ["app"]
+
+def test_cmake_include_affects_every_target(tmp_path):
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["cmake/flags.cmake"])
+	assert affected.owned == ["app", "core", "util"]
+
+def test_unread_cmake_module_affects_every_target(tmp_path):
+	# Not among the inputs of the last configure yet, ie just added
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["cmake/new.cmake"])
+	assert affected.targets == ["app", "core", "util"]
+
+def test_cmakelists_affects_targets_below_it(tmp_path):
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["util/CMakeLists.txt"])
+	assert affected.owned == ["util"]
+	assert affected.targets == ["app", "util"]
+
+def test_preset_affects_every_target(tmp_path):
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["CMakePresets.json"])
+	assert affected.targets == ["app", "core", "util"]
+
+def test_file_outside_targets_affects_nothing(tmp_path):
+	root = str(tmp_path)
+	affected = find_affected(_model(root), ["README.md"])
+	assert affected.targets == []
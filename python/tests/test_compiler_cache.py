@@ -0,0 +1,27 @@
+#
+# Pointing compiler caches at a build root's directory and counting a build's hits
+#
+
+from hubris.repoman.compiler_cache import CompilerCache, CompilerCacheConfig, CompilerCacheStats
+
+
+
+def test_sccache_server_per_cache_dir(tmp_path):
+	a = CompilerCacheConfig(CompilerCache.sccache, "sccache", str(tmp_path.joinpath("a")))
+	b = CompilerCacheConfig(CompilerCache.sccache, "sccache", str(tmp_path.joinpath("b")))
+	port = a.settings()["SCCACHE_SERVER_PORT"]
+	assert port == CompilerCacheConfig(CompilerCache.sccache, "sccache", str(tmp_path.joinpath("a"))).settings()["SCCACHE_SERVER_PORT"]
+	assert port != b.settings()["SCCACHE_SERVER_PORT"]
+	assert f"SCCACHE_SERVER_PORT={port}" in a.make_launcher().split(";")
+	assert a.env({})["SCCACHE_DIR"] == str(tmp_path.joinpath("a"))
+
+def test_ccache_settings(tmp_path):
+	config = CompilerCacheConfig(CompilerCache.ccache, "ccache", str(tmp_path), "5G")
+	assert config.settings() == { "CCACHE_DIR" : str(tmp_path), "CCACHE_MAXSIZE" : "5G" }
+
+def test_stats_difference():
+	stats = CompilerCacheStats(10, 4) - CompilerCacheStats(7, 1)
+	assert (stats.hits, stats.misses) == (3, 3)
+	# Counted again from zero since
+	stats = CompilerCacheStats(2, 1) - CompilerCacheStats(7, 1)
+	assert (stats.hits, stats.misses) == (2, 1)
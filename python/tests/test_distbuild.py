@@ -0,0 +1,98 @@
+#
+# Splitting compile commands and compiling through local workers
+#
+
+import os
+import shutil
+
+import pytest
+
+from hubris.distbuild import LocalWorkers, WorkerPool, compile_command, split_command
+from hubris.distbuild.command import compiler_version
+
+
+
+def test_split_command():
+	split = split_command(["g++", "-Iinclude", "-isystem", "/opt/dep", "-DNDEBUG", "-MD", "-MF", "a.o.d",
+		"-O2", "-std=c++17", "-c", "src/a.cpp", "-o", "a.o"])
+	assert split is not None
+	assert split.compiler == "g++"
+	assert split.source == "src/a.cpp"
+	assert split.output == "a.o"
+	assert split.language == "c++-cpp-output"
+	assert split.compile_args == ["-O2", "-std=c++17"]
+	assert split.preprocess_args == ["g++", "-Iinclude", "-isystem", "/opt/dep", "-DNDEBUG", "-MD", "-MF", "a.o.d",
+		"-O2", "-std=c++17", "src/a.cpp"]
+
+def test_split_c_command():
+	split = split_command(["/usr/bin/gcc-12", "-c", "a.c", "-oa.o"])
+	assert split is not None
+	assert split.language == "cpp-output"
+	assert split.output == "a.o"
+
+@pytest.mark.parametrize("flags", [
+	["-gsplit-dwarf"],
+	["-gsplit-dwarf=single"],
+	["--coverage"],
+	["-fprofile-arcs"],
+	["-ftest-coverage"],
+	["-ftime-trace"],
+	["-ftime-trace=trace.json"],
+	["-ftime-trace-granularity=100"],
+	["-fstack-usage"],
+	["-dumpdir", "out/"],
+	["-dumpbase", "a"],
+	["-save-temps"],
+	["-fplugin=x.so"],
+	["-B", "/tmp"],
+	["@flags.rsp"],
+])
+def test_split_command_keeps_local_only_flags_local(flags):
+	assert split_command(["g++"] + flags + ["-c", "a.cpp", "-o", "a.o"]) is None
+
+@pytest.mark.parametrize("arguments", [
+	# Linking
+	["g++", "a.o", "b.o", "-o", "app"],
+	# Not compiling to an object
+	["g++", "a.cpp", "-o", "app"],
+	["g++", "-c", "a.cpp", "b.cpp"],
+	# Not gcc or clang
+	["cl.exe", "/c", "a.cpp", "/Foa.obj"],
+	["nvcc", "-c", "a.cu", "-o", "a.o"],
+])
+def test_split_command_rejects(arguments):
+	assert split_command(arguments) is None
+
+
+@pytest.fixture(scope="module")
+def workers():
+	if shutil.which("g++") is None:
+		pytest.skip("g++ isn't installed")
+	with LocalWorkers(2) as o:
+		yield o
+
+def test_local_workers_round_trip(workers, tmp_path):
+	tmp_path.joinpath("a.cpp").write_text("#include <vector>\nint f() { return int(std::vector<int>{ 1, 2 }.size()); }\n")
+	pool = WorkerPool(workers.addresses)
+	assert set(pool.probe()) == set(workers.addresses)
+	assert compile_command(["g++", "-O2", "-c", "a.cpp", "-o", "out/a.o"], str(tmp_path), pool) == 0
+	assert os.path.getsize(tmp_path.joinpath("out", "a.o")) != 0
+
+def test_local_workers_compile_error(workers, tmp_path):
+	# Preprocesses fine, only the remote compile fails
+	tmp_path.joinpath("a.cpp").write_text("int f() { return missing; }\n")
+	pool = WorkerPool(workers.addresses)
+	assert compile_command(["g++", "-c", "a.cpp", "-o", "a.o"], str(tmp_path), pool) != 0
+	assert not tmp_path.joinpath("a.o").exists()
+
+def test_local_workers_refuse_other_compiler_version(workers):
+	pool = WorkerPool(workers.addresses)
+	assert pool.compile("g++", [], "c++-cpp-output", b"int x;\n", "g++ (Other) 1.0") is None
+
+def test_pool_compile_runs_on_a_worker(workers):
+	pool = WorkerPool(workers.addresses)
+	result = pool.compile("g++", ["-O2"], "c++-cpp-output", b"int f() { return 1; }\n", compiler_version(shutil.which("g++")))
+	assert result is not None
+	assert result.returncode == 0
+	assert result.worker in workers.addresses
+	assert len(result.object) != 0
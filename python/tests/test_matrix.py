@@ -0,0 +1,56 @@
+#
+# Build matrix variants and job splitting
+#
+
+import os
+
+import hubris.repoman.repoman_linux as repoman_linux
+from hubris.repoman.cmake import Compiler
+from hubris.repoman.matrix import make_matrix, split_jobs
+from hubris.repoman.repoman_linux import RepoMan_Linux
+
+
+
+def test_make_matrix():
+	variants = make_matrix(["Debug", "Release"], [Compiler.gcc, Compiler.clang], "_build")
+	assert [v.name for v in variants] == ["Debug-gcc", "Release-gcc", "Debug-clang", "Release-clang"]
+	assert variants[0].build_root == os.path.join("_build", "debug-gcc")
+
+def test_make_matrix_without_compiler():
+	variants = make_matrix(["Debug"])
+	assert [v.name for v in variants] == ["Debug"]
+	assert variants[0].compiler is None
+	assert variants[0].build_root == os.path.join("_build", "debug")
+
+def test_split_jobs():
+	assert split_jobs(8, 3) == [3, 3, 2]
+	assert split_jobs(2, 4) == [1, 1, 1, 1]
+	assert split_jobs(8, 0) == []
+
+
+class _Tool:
+	pass
+
+def test_build_matrix_default_configs(monkeypatch):
+	calls = []
+	monkeypatch.setattr(repoman_linux, "build_matrix", lambda tool, variants, jobs = None, **kwargs: calls.append(variants) or [])
+
+	repo = RepoMan_Linux.__new__(RepoMan_Linux)
+	repo.tool = _Tool()
+	repo.build_matrix()
+	repo.build_matrix()
+	repo.build_matrix(["Release"])
+	assert [[v.config for v in variants] for variants in calls] == [["Debug", "Release"], ["Debug", "Release"], ["Release"]]
+
+def test_build_configs_keep_the_repo_settings(monkeypatch):
+	calls = []
+	monkeypatch.setattr(repoman_linux, "build_matrix", lambda tool, variants, jobs = None, **kwargs: calls.append((variants, jobs, kwargs)) or [])
+
+	repo = RepoMan_Linux.__new__(RepoMan_Linux)
+	repo.tool = _Tool()
+	assert repo.build(configs=["Debug", "Release"], jobs=4, compiler=Compiler.gcc, defs=["-DX=1"], build_root="_out")
+	variants, jobs, kwargs = calls[0]
+	assert [v.name for v in variants] == ["Debug-gcc", "Release-gcc"]
+	assert variants[0].build_root == os.path.join("_out", "debug-gcc")
+	assert jobs == 4
+	assert kwargs == { "defs" : ["-DX=1"] }
@@ -0,0 +1,165 @@
+#
+# Finding the modules of a tree and ordering them by their dependencies
+#
+
+import os
+
+from hubris.repoman.buildlog import Diagnostic, DiagnosticSeverity
+from hubris.repoman.fileapi import CodeModel, CodeModelTarget
+from hubris.repoman.modules import Module, ModuleState, build_modules, find_modules, sort_modules
+
+
+
+def _write(root, path : str, text : str):
+	path = root.joinpath(path)
+	path.parent.mkdir(parents=True, exist_ok=True)
+	path.write_text(text)
+
+def _tree(root):
+	"""
+	app links util, which links core. core is nested in util, extra only sits next to them.
+	"""
+	_write(root, "CMakeLists.txt", "project(app)\nADD_CMAKE_SUBDIRS_HERE()\n"
+		"add_executable(${PROJECT_NAME} main.cpp)\ntarget_link_libraries(${PROJECT_NAME} PRIVATE util)\n")
+	_write(root, "util/CMakeLists.txt", "project(util)\nset(_link_public core)\n"
+		"add_library(${PROJECT_NAME} STATIC util.cpp)\ntarget_link_libraries(${PROJECT_NAME} PUBLIC ${_link_public})\n")
+	_write(root, "util/core/CMakeLists.txt", "project(core)\nadd_library(core STATIC core.cpp)\n")
+	_write(root, "util/core/src/CMakeLists.txt", "target_sources(core PRIVATE more.cpp)\n")
+	_write(root, "extra/CMakeLists.txt", "project(extra) # add_library(commented)\nadd_library(extra INTERFACE)\n")
+	_write(root, "_build/CMakeLists.txt", "project(ignored)\n")
+
+def _module(name : str, deps : "list[str]") -> Module :
+	o = Module(name, name)
+	o.deps = deps
+	return o
+
+
+def test_find_modules(tmp_path):
+	_tree(tmp_path)
+	modules = find_modules(tmp_path)
+	assert sorted(modules) == ["app", "core", "extra", "util"]
+	assert modules["core"].root == os.path.join(str(tmp_path), "util", "core")
+	assert modules["extra"].targets == ["extra"]
+	assert modules["app"].deps == ["util"]
+	assert modules["util"].deps == ["core"]
+	assert modules["core"].deps == []
+
+def test_find_modules_git_dependency(tmp_path):
+	_write(tmp_path, "CMakeLists.txt", "project(app)\nADD_GIT_DEPENDENCY(${CMAKE_CURRENT_SOURCE_DIR}/_deps/dep dep https://example.com/dep.git)\n"
+		"add_executable(app main.cpp)\n")
+	_write(tmp_path, "_deps/dep/CMakeLists.txt", "project(dep)\nadd_library(dep STATIC dep.cpp)\n")
+	modules = find_modules(tmp_path)
+	assert sorted(modules) == ["app", "dep"]
+	assert modules["app"].deps == ["dep"]
+	assert modules["app"].git_deps[0].repo == "https://example.com/dep.git"
+
+def test_sort_modules(tmp_path):
+	_tree(tmp_path)
+	order = [v.name for v in sort_modules(find_modules(tmp_path))]
+	assert order.index("core") < order.index("util") < order.index("app")
+	assert "extra" in order
+
+def test_sort_modules_is_stable():
+	modules = { v.name : v for v in [_module("d", ["b", "c"]), _module("c", ["a"]), _module("b", ["a"]), _module("a", [])] }
+	assert [v.name for v in sort_modules(modules)] == ["a", "b", "c", "d"]
+
+def test_sort_modules_cycle():
+	modules = { v.name : v for v in [_module("a", ["c"]), _module("b", ["a"]), _module("c", ["b"]), _module("d", [])] }
+	assert sort_modules(modules) is None
+
+
+class _Tool:
+	"""
+	Stands in for CMake, configures nothing and reports a failed ninja step for every broken target.
+	"""
+
+	def generate(self, **kwargs) -> bool :
+		self.generated += 1
+		return True
+
+	def codemodel(self, build_root, config = None) -> CodeModel :
+		targets = [CodeModelTarget(v.name, v.name, "STATIC_LIBRARY", v.root) for v in self.modules.values()]
+		return CodeModel(self.repo_root, os.path.join(self.repo_root, "_build"), config, targets)
+
+	def build(self, targets = None, on_diagnostic = None, keep_going = False, **kwargs) -> bool :
+		self.builds.append(sorted(targets))
+		for v in sorted(targets):
+			if v in self.broken:
+				on_diagnostic(Diagnostic(f"CMakeFiles/{v}.dir/{v}.cpp.o", None, None, DiagnosticSeverity.error,
+					f"FAILED: CMakeFiles/{v}.dir/{v}.cpp.o"))
+				# The error is in a header of the module it depends on
+				on_diagnostic(Diagnostic(os.path.join(self.repo_root, "core", "core.hpp"), 1, 1, DiagnosticSeverity.error,
+					"expected ';'"))
+		return not any(v in self.broken for v in targets)
+
+	def __init__(self, root, modules : "dict[str, Module]", broken : "list[str]" = []):
+		self.repo_root = str(root)
+		self.modules = modules
+		self.broken = broken
+		self.generated = 0
+		self.builds : "list[list[str]]" = []
+
+def _tool_modules(root) -> "dict[str, Module]" :
+	o = {}
+	for name, deps in (("core", []), ("util", ["core"]), ("log", ["core"]), ("app", ["util", "log"])):
+		o[name] = Module(name, os.path.join(str(root), name))
+		o[name].targets = [name]
+		o[name].deps = deps
+	return o
+
+def test_build_modules_order(tmp_path):
+	modules = _tool_modules(tmp_path)
+	tool = _Tool(tmp_path, modules)
+	results = build_modules(tool, modules)
+	assert tool.generated == 1
+	# Every module is built by one build
+	assert tool.builds == [["app", "core", "log", "util"]]
+	assert [v.state for v in results] == [ModuleState.built] * 4
+
+	# Nothing changed since
+	tool.builds = []
+	results = build_modules(tool, modules)
+	assert tool.builds == []
+	assert [v.state for v in results] == [ModuleState.up_to_date] * 4
+
+def test_build_modules_failure_blocks_dependents(tmp_path):
+	modules = _tool_modules(tmp_path)
+	tool = _Tool(tmp_path, modules, broken=["util"])
+	results = { v.module.name : v for v in build_modules(tool, modules) }
+	assert tool.builds == [["app", "core", "log", "util"]]
+	assert { k : v.state for k, v in results.items() } == { "core" : ModuleState.built, "util" : ModuleState.failed,
+		"log" : ModuleState.built, "app" : ModuleState.blocked }
+	# Told by the failed step's target, not by the file the error is in
+	assert len(results["util"].errors) == 2
+	assert len(results["core"].errors) == 0
+
+	# Only what failed or was blocked is built again
+	tool.broken = []
+	tool.builds = []
+	results = { v.module.name : v.state for v in build_modules(tool, modules) }
+	assert tool.builds == [["app", "util"]]
+	assert results == { "core" : ModuleState.up_to_date, "util" : ModuleState.built, "log" : ModuleState.up_to_date,
+		"app" : ModuleState.built }
+
+class _LinkFailTool(_Tool):
+	"""
+	Also fails a step of no module's target, ie a custom command's.
+	"""
+
+	def build(self, targets = None, on_diagnostic = None, **kwargs) -> bool :
+		super().build(targets, on_diagnostic, **kwargs)
+		on_diagnostic(Diagnostic("gen/version.hpp", None, None, DiagnosticSeverity.error, "FAILED: gen/version.hpp"))
+		on_diagnostic(Diagnostic(None, None, None, DiagnosticSeverity.error, "version.py exited with 1"))
+		return False
+
+def test_build_modules_unattributed_errors(tmp_path):
+	modules = _tool_modules(tmp_path)
+	tool = _LinkFailTool(tmp_path, modules, broken=["util"])
+	results = { v.module.name : v.state for v in build_modules(tool, modules) }
+	assert results == { "core" : ModuleState.unfinished, "util" : ModuleState.failed, "log" : ModuleState.unfinished,
+		"app" : ModuleState.blocked }
+
+	# None could be told a module
+	tool = _LinkFailTool(tmp_path, modules)
+	results = { v.module.name : v.state for v in build_modules(tool, modules) }
+	assert set(results.values()) == { ModuleState.failed }
@@ -0,0 +1,48 @@
+#
+# Reading the steps of a build from .ninja_log
+#
+
+from hubris.repoman.telemetry import make_build_report, read_ninja_log, read_ninja_log_entries
+
+
+
+def _write_log(path, entries : "list[tuple[int, int, int, str, str]]"):
+	with open(path, "w") as f:
+		f.write("# ninja log v5\n")
+		for v in entries:
+			f.write("\t".join(str(x) for x in v) + "\n")
+
+def _outputs(edges) -> "list[list[str]]" :
+	return sorted(sorted(v.outputs) for v in edges)
+
+
+def test_read_ninja_log_since_before(tmp_path):
+	path = tmp_path.joinpath(".ninja_log")
+	_write_log(path, [(0, 100, 1, "a.o", "h1"), (0, 200, 1, "b.o", "h2")])
+	before = read_ninja_log_entries(path)
+
+	# The next build rebuilt b.o and linked, with times starting from zero again
+	with open(path, "a") as f:
+		f.write("0\t50\t2\tb.o\th2\n10\t80\t2\tlib.a\th3\n10\t80\t2\tlib.so\th3\n")
+	edges = read_ninja_log(path, before)
+	assert _outputs(edges) == [["b.o"], ["lib.a", "lib.so"]]
+
+def test_read_ninja_log_recompacted(tmp_path):
+	# Ninja rewrites the log from a hash map, so the last build's lines aren't last
+	path = tmp_path.joinpath(".ninja_log")
+	_write_log(path, [(0, 300, 1, "a.o", "h1"), (0, 200, 1, "b.o", "h2"), (0, 100, 1, "c.o", "h3")])
+	before = read_ninja_log_entries(path)
+	_write_log(path, [(0, 300, 1, "a.o", "h1"), (5, 20, 2, "c.o", "h3"), (0, 200, 1, "b.o", "h2"), (0, 10, 2, "d.o", "h4")])
+	assert _outputs(read_ninja_log(path, before)) == [["c.o"], ["d.o"]]
+
+def test_no_op_build_reports_nothing(tmp_path):
+	path = tmp_path.joinpath(".ninja_log")
+	_write_log(path, [(0, 100, 1, "a.o", "h1"), (0, 200, 1, "b.o", "h2")])
+	report = make_build_report(tmp_path, jobs=4, before=read_ninja_log_entries(path))
+	assert report is not None
+	assert len(report.edges) == 0
+	assert report.total_time == 0
+
+def test_missing_log(tmp_path):
+	assert read_ninja_log_entries(tmp_path.joinpath(".ninja_log")) == {}
+	assert make_build_report(tmp_path) is None
@@ -0,0 +1,48 @@
+#
+# Excluding the sources that break unity batches
+#
+
+import os
+
+from hubris.repoman.buildlog import Diagnostic, DiagnosticSeverity
+from hubris.repoman.unity import UnityBuild, exclude_failures, revert_failures
+
+
+
+def _failed(output : str) -> Diagnostic :
+	return Diagnostic(output, None, None, DiagnosticSeverity.error, f"FAILED: {output}")
+
+def _error(file : str) -> Diagnostic :
+	return Diagnostic(file, 1, 1, DiagnosticSeverity.error, "redefinition of 'x'")
+
+
+def test_exclusions_are_saved_once_kept(tmp_path):
+	unity = UnityBuild()
+	assert exclude_failures(unity, [_failed("CMakeFiles/core.dir/Unity/unity_0_cxx.cxx.o"), _error("../src/a.cpp")], tmp_path)
+	source = os.path.normpath(os.path.join(str(tmp_path), "../src/a.cpp"))
+	assert unity.excluded_sources == { "core" : [source] }
+	assert unity.pending == [("core", source)]
+
+	unity.save(tmp_path)
+	assert UnityBuild.load(tmp_path).excluded_sources == {}
+	unity.pending = []
+	unity.save(tmp_path)
+	assert UnityBuild.load(tmp_path).excluded_sources == { "core" : [source] }
+
+def test_source_failing_on_its_own_is_taken_back(tmp_path):
+	unity = UnityBuild()
+	exclude_failures(unity, [_failed("CMakeFiles/core.dir/Unity/unity_0_cxx.cxx.o"), _error("../src/a.cpp"), _error("../src/b.cpp")], tmp_path)
+	# Built on its own a.cpp still fails, b.cpp doesn't
+	assert revert_failures(unity, [_failed("CMakeFiles/core.dir/src/a.cpp.o"), _error("../src/a.cpp")], tmp_path)
+	source = os.path.normpath(os.path.join(str(tmp_path), "../src/b.cpp"))
+	assert unity.excluded_sources == { "core" : [source] }
+	assert unity.pending == [("core", source)]
+
+def test_disabled_target_failing_without_unity_is_taken_back(tmp_path):
+	unity = UnityBuild()
+	assert exclude_failures(unity, [_failed("CMakeFiles/core.dir/Unity/unity_0_cxx.cxx.o"), _error("CMakeFiles/core.dir/Unity/unity_0_cxx.cxx")], tmp_path)
+	assert unity.disabled_targets == ["core"]
+	assert not revert_failures(unity, [_failed("CMakeFiles/util.dir/util.cpp.o"), _error("../util.cpp")], tmp_path)
+	assert revert_failures(unity, [_failed("CMakeFiles/core.dir/core.cpp.o"), _error("../core.cpp")], tmp_path)
+	assert unity.disabled_targets == []
+	assert unity.pending == []
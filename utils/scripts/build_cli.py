@@ -1,5 +1,6 @@
 from argparse import ArgumentParser
-from hubris.repoman import RepoMan
+import inspect
+
 import hubris
 
 from repo import clean, build, getdeps
@@ -15,15 +16,47 @@ group.add_argument("-c", "--clean", help="Cleans the repo", action="store_true",
 group.add_argument("-x", "--rebuild", help="Cleans and then builds the repo", action="store_true", default=False)
 group.add_argument("-b", "--build", help="Builds the repo", action="store_true", default=False)
 
-group.add_argument("--config", choices=["debug", "release", "all"], default=None,
-	help='The config(s) to build')
+parser.add_argument("--config", choices=["debug", "release", "all"], default=None,
+	help='The config(s) to build, "all" builds them at once')
+parser.add_argument("-j", "--jobs", type=int, default=None,
+	help="Total number of jobs shared by the configs being built")
+parser.add_argument("--since", default=None, metavar="REV",
+	help="Only build and test the targets affected by the changes since a revision, ie origin/main")
 
 args = parser.parse_args()
 
 
 
+# CMake config names for each --config choice
+_CONFIGS = {
+	"debug" : ["Debug"],
+	"release" : ["Release"],
+	"all" : ["Debug", "Release"],
+}
+
 steps = []
 
+# Handed to the repo's build(), which forwards them to RepoMan.build() with its own defs and roots
+build_options = {}
+if args.config is not None:
+	build_options["configs"] = _CONFIGS[args.config]
+if args.jobs is not None:
+	build_options["jobs"] = args.jobs
+if args.since is not None:
+	build_options["since"] = args.since
+
+if len(build_options) != 0:
+	parameters = inspect.signature(build).parameters
+	if not any(v.kind == inspect.Parameter.VAR_KEYWORD for v in parameters.values()) and \
+		not all(v in parameters for v in build_options):
+		hubris.log_error(f"The repo's build() doesn't take {', '.join(build_options)}, "
+			"have it take **options and pass them on to RepoMan.build()")
+		exit(1)
+
+	project_build = build
+	def build():
+		return project_build(**build_options)
+
 if args.getdeps:
 	def getdeps_step():
 		return getdeps(force = True)
@@ -0,0 +1,35 @@
+from argparse import ArgumentParser
+from pathlib import Path
+import hubris
+import hubris.git as git
+
+parser = ArgumentParser(description="Clones a git repository, optionally borrowing objects from a local mirror cache")
+parser.add_argument("url", type=str, help="The repository to clone")
+parser.add_argument("dest", type=Path, help="Directory to clone into")
+parser.add_argument("--branch", "-b", type=str, default=None, help="Branch or tag to check out")
+parser.add_argument("--depth", type=int, default=None, help="Create a shallow clone with this many commits, 0 clones the full history")
+parser.add_argument("--filter", type=str, default=None, help='Partial clone filter, ie "blob:none"')
+parser.add_argument("--single_branch", action="store_true", help="Only fetch the history of the checked out branch")
+parser.add_argument("--reference", type=Path, default=None, help="Borrow objects from this repository if it exists")
+parser.add_argument("--mirror_cache", type=Path, default=None, help="Directory of bare mirrors to create/update and borrow objects from")
+parser.add_argument("--no_dissociate", dest="dissociate", action="store_false",
+	help="Keep borrowing objects from the cache instead of copying them, the clone breaks if the cache is pruned")
+parser.add_argument("--quiet", "-q", action="store_true", help="Silences output")
+
+args = parser.parse_args()
+
+if args.quiet:
+	hubris.set_log_level(hubris.LogLevel.error)
+
+result = git.clone(args.url, args.dest,
+	branch = args.branch,
+	depth = args.depth or None,
+	filter = args.filter or None,
+	single_branch = args.single_branch,
+	reference = args.reference,
+	mirror_cache = args.mirror_cache,
+	dissociate = args.dissociate,
+	quiet = args.quiet)
+
+if not result:
+	exit(1)